@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+bench_ev_queue.py: Compare event queue backends (cfg.EV_QUEUE_MODE) on several topologies.
+"""
+__author__      = ['Kuan-yin Chen', 'Kejiao Sui', 'Wei Lin']
+__copyright__   = 'Copyright 2014, NYU-Poly'
+
+
+# Built-in modules
+import os
+import sys
+import imp
+import random
+
+TOPOLOGIES  = ['./topologies/geant', './topologies/spain']
+MODES       = ['heap', 'calendar']
+SIM_TIME    = 10.0
+SEED        = 1
+
+# ---- Load base config file as specified ----
+if (len(sys.argv) > 1):
+    abs_path = os.path.abspath(sys.argv[1])
+else:
+    abs_path = os.path.abspath('./cfgs/default.txt')
+cfg = imp.load_source('SimConfig', abs_path)
+print "Reading config from: %s" %(abs_path)
+
+# Third-party modules
+import numpy.random as nprd
+# User-defined modules
+from sim.SimCore import *
+import SimConfig as cfg
+
+
+def run_once(dir_topo, mode):
+    """Run one simulation with the given topology and event queue backend.
+
+    Returns:
+        float64: Execution time of SimCore.main_course() in seconds.
+        int: Number of events pushed into the event queue.
+    """
+    cfg.DIR_TOPO        = dir_topo
+    cfg.EV_QUEUE_MODE   = mode
+
+    mySim = SimCore()
+    random.seed(SEED)       # Same flows for every backend
+    nprd.seed(SEED)
+    mySim.main_course()
+    return mySim.exec_ed_time - mySim.exec_st_time, mySim.ev_seq
+
+
+if __name__ == '__main__':
+    # Only the event-driven main loop is of interest. Turn off screen and most file outputs.
+    # EvLogLinkUtil events are kept since they are part of a typical event mix.
+    cfg.SIM_TIME        = SIM_TIME
+    cfg.SHOW_PROGRESS   = 0
+    cfg.SHOW_SUMMARY    = 0
+    cfg.LOG_TABLE_UTIL  = 0
+    cfg.LOG_FLOW_STATS  = 0
+    cfg.LOG_SUMMARY     = 0
+    cfg.LOG_PATH_DB     = 0
+
+    results = []
+    for dir_topo in TOPOLOGIES:
+        for mode in MODES:
+            exec_time, n_events = run_once(dir_topo, mode)
+            results.append((dir_topo, mode, exec_time, n_events))
+
+    print
+    print '%-24s%-12s%-16s%-12s%-16s' %('topology', 'mode', 'exec_time(s)', '#events', 'us/event')
+    for dir_topo, mode, exec_time, n_events in results:
+        print '%-24s%-12s%-16.3f%-12d%-16.3f' %(os.path.basename(dir_topo), mode, exec_time, \
+                                               n_events, exec_time * 1e6 / max(n_events, 1))
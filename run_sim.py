@@ -32,15 +32,23 @@ import SimConfig as cfg
 
 
 if __name__ == '__main__':
-    mySim = SimCore()
+    if (cfg.RESUME_FROM != ''):
+        print "Resuming from checkpoint: %s" %(cfg.RESUME_FROM)
+        mySim = load_checkpoint(cfg.RESUME_FROM)
+    else:
+        mySim = SimCore()
     if (cfg.DO_PROFILING == True):
-        fn_profile = os.path.join(cfg.LOG_DIR, 'profile_pstats.pstats')
         import cProfile
+        profiler = cProfile.Profile()
+        profiler.runcall(mySim.main_course)
+        # Branches return here too, with cfg.LOG_DIR set to their own folder. Their
+        # profiles also cover the run before the fork.
+        fn_profile = os.path.join(cfg.LOG_DIR, 'profile_pstats.pstats')
         print "Code performance profiling output to", fn_profile
-        cProfile.run('mySim.main_course()', fn_profile)
+        profiler.dump_stats(fn_profile)
     else:
         mySim.main_course()
 
     if (cfg.LOG_CONFIG > 0):
-        os.system("cp %s %s" %(abs_path, mySim.fn_config))
-    os.system("rm %s" %(abs_path + 'c'))    # Remove temp file generated by imp
\ No newline at end of file
+        mySim.dump_config(abs_path)
+    os.system("rm -f %s" %(abs_path + 'c'))    # Remove temp file generated by imp
\ No newline at end of file
@@ -10,39 +10,57 @@ __copyright__   = 'Copyright 2014, NYU-Poly'
 import os
 import csv
 import sys
-from heapq import heappush, heappop
 from math import ceil, log
 from time import time
 import random
 # Third-party modules
 import networkx as nx
-import netaddr as na
 # User-defined modules
 import SimConfig as cfg
 from SimCtrl import *
 from SimFlowGen import *
 from SimFlow import *
+from SimHostAddr import *
 from SimSwitch import *
 from SimLink import *
+from SimLinkTable import *
+from SimPath import *
 from SimEvent import *
+from SimEventQueue import *
 from SimCoreEventHandling import *
 from SimCoreLogging import *
 from SimCoreCalculation import *
+from SimCoreCheckpoint import *
+from SimCoreFluid import *
 
 
-class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging):
+NO_EVENT = [float('inf'), 0, EV_NOTYPE, None]    # Placeholder of next event when none is queued
+
+
+class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging, SimCoreCheckpoint, \
+              SimCoreFluid):
     """Core class of FlowSim simulator.
 
     Attributes:
         sim_time (float64): Total simulation time
         timer (float64): Simulation timer, which keeps current time progress
         topo (networkx.Graph): An undirected graph to keep network topology
-        ev_queue (list of 2-tuples): Event queue. Each element is a 2-tuple of (ev_time, event obj)
+        ev_queue (HeapEventQueue or CalendarEventQueue): Event queue, selected by
+                                     cfg.EV_QUEUE_MODE. Each element is a 4-tuple of
+                                     (ev_time, ev_seq, ev_type, event obj)
+        timers (PeriodicTimers): Periodic events (logging, counter collection, reroute),
+                                 kept outside ev_queue.
         nodes_df (pandas.DataFrame): A dataframe that contains switching nodes' names and params.
         links_df (pandas.DataFrame): A dataframe that contains links' names and params.
-        hosts (dict of netaddr.IpAddress): Key is host IP, value is its edge switch
-        flows (dict of 2-tuples): Key is 2-tuple of flow src/dst,
-                                  Value is its associated SimFlow instance.
+        node_ids (dict of int): Key is node name, value is its index in self.nodes
+        link_ids (dict of int): Key is link key, in either orientation, value is its
+                                index in self.links. Paths carry their link IDs (see SimPath).
+        link_table (SimLinkTable): Columns of link attributes, indexed by link ID, and
+                                   viewed by the SimLink instances in linkobjs.
+        hosts (dict of int): Key is host IP (see SimHostAddr), value is its edge switch
+        flows (dict of int): Key is flow key, i.e. packed (src_ip, dst_ip) (see SimHostAddr),
+                             Value is its associated SimFlow instance.
+        flow_table (SimFlowTable): Columns of flow attributes, viewed by SimFlow instances.
         link_util_recs (list of np.array): List of link utilization records.
         table_util_recs (list of np.array): List of table utilization records.
         flow_stats_recs (list of np.array): List of flow stats records.
@@ -66,7 +84,13 @@ class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging):
         # ---- Simulator timer and counters ----
         self.sim_time = cfg.SIM_TIME
         self.timer = 0.0
-        self.ev_queue = []
+        self.is_started = False     # Set when initial events are queued. Checkpoints
+                                    # loaded by load_checkpoint() are already started.
+        if (cfg.EV_QUEUE_MODE == 'calendar'):
+            self.ev_queue = CalendarEventQueue()
+        else:
+            self.ev_queue = HeapEventQueue()    # Default to 'heap'
+        self.timers = PeriodicTimers()
         random.seed(int(time()))
 
         # ---- Parse CSV and set up topology graph's nodes and edges accordingly ----
@@ -75,7 +99,11 @@ class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging):
         self.links = []
         self.nodeobjs = {}
         self.linkobjs = {}
+        self.link_table = SimLinkTable()    # Attributes of links in self.linkobjs (see SimLink)
         self.link_mapper = {}
+        self.node_ids = {}
+        self.link_ids = {}
+        self.never_btnk_links = []
         self.build_topo()   # Translate csv files into networkx.Graph
 
         # ---- Create hosts, assign edge switches * IPs ----
@@ -88,12 +116,15 @@ class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging):
 
         # ---- Keeping flow records ----
         self.flows = {}     # Empty dict at first.
+        self.flow_table = SimFlowTable()    # Attributes of flows in self.flows (see SimFlow)
         self.next_end_time = float('inf')  # Records next ending flow's estimated ending time
-        self.next_end_flow = ('', '')   # Records next ending flow
+        self.next_end_flow = NO_FLOW    # Records next ending flow
 
         # ---- Constructor of base classes ----
         SimCoreLogging.__init__(self)
         SimCoreCalculation.__init__(self)
+        SimCoreEventHandling.__init__(self)
+        SimCoreCheckpoint.__init__(self)
 
 
     def display_topo(self):
@@ -154,25 +185,80 @@ class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging):
 
         for rowdict in nodes_rd:
             rowdict = dict_convert(rowdict)
-            name = rowdict['name']
+            name = intern(rowdict['name'])          # Node names are dict keys everywhere
+            rowdict['name'] = name
             self.topo.add_node(name)
             self.nodeobjs[name] = SimSwitch(**rowdict)
 
+        link_rows = {}
         for rowdict in links_rd:
             rowdict = dict_convert(rowdict)
-            node1, node2 = rowdict['node1'], rowdict['node2']
+            node1, node2 = intern(rowdict['node1']), intern(rowdict['node2'])
+            rowdict['node1'], rowdict['node2'] = node1, node2
             self.topo.add_edge(node1, node2)
-            self.linkobjs[(node2, node1)] = SimLink(**rowdict)
-            self.linkobjs[(node1, node2)] = self.linkobjs[(node2, node1)]
-                                                    # (node2, node1) and (node1, node2)
-                                                    # Pointing to the same SimLink instance
+            link_rows[(node1, node2)] = rowdict
 
         self.nodes = self.topo.nodes()
         self.links = self.topo.edges()
 
-        for lk in self.links:
+        # Dense integer IDs: a node's ID is its index in self.nodes, and a link's ID is
+        # its index in self.links, i.e. its row in self.link_table. Links are stored once,
+        # under their key in self.links; link_mapper and link_ids accept either orientation.
+        self.node_ids = {nd: i for i, nd in enumerate(self.nodes)}
+        for i, lk in enumerate(self.links):
+            rev = (lk[1], lk[0])
+            rowdict = link_rows[lk] if (lk in link_rows) else link_rows[rev]
+            self.linkobjs[lk] = SimLink(self.link_table, **rowdict)
             self.link_mapper[lk] = lk
-            self.link_mapper[(lk[1], lk[0])] = lk
+            self.link_mapper[rev] = lk
+            self.link_ids[lk] = i
+            self.link_ids[rev] = i
+
+        self.mark_never_btnk_links()
+
+
+    def mark_never_btnk_links(self):
+        """Mark links that can never be the bottleneck of any flow, so that calc_flow_rates
+        can leave them out. Referred by build_topo() and set_link_attr(), and must be called
+        again if link capacities or hosts are changed otherwise.
+
+        Args:
+            None
+
+        Returns:
+            None. self.never_btnk_links and each link's never_btnk flag are updated.
+
+        Extra Notes:
+            1. Let nd be an end node of link lk with no hosts. Every flow on lk passes
+               through nd, so it also runs on one of nd's other links. If lk.cap is no less
+               than the sum of caps of nd's other links, lk can never be overloaded, and its
+               capacity constraint is implied by theirs.
+            2. A link is only marked if the links that imply its constraint stay unmarked,
+               so every flow on a marked link still has an unmarked link.
+            3. Nodes with hosts can source any amount of traffic, so links are only marked
+               through host-less (e.g. aggregation or core) nodes.
+
+        """
+        self.link_table.view('never_btnk')[:] = 0
+        self.never_btnk_links = []
+
+        needed = set()      # Links that imply the constraint of a marked link
+        for lk in self.links:
+            linkobj = self.linkobjs[lk]
+            if (lk in needed):
+                continue
+            for nd in lk:
+                if (self.nodeobjs[nd].n_hosts > 0):
+                    continue
+                other_links = [self.link_mapper[(nd, nb)] for nb in self.topo.neighbors(nd) \
+                               if (not nb in lk)]
+                if (any(self.linkobjs[olk].never_btnk for olk in other_links)):
+                    continue
+                if (linkobj.cap >= sum(self.linkobjs[olk].cap for olk in other_links)):
+                    linkobj.never_btnk = True
+                    self.never_btnk_links.append(lk)
+                    needed.update(other_links)
+                    break
 
 
     def get_node_attr(self, sw_name, attr_name):
@@ -217,7 +303,7 @@ class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging):
             Variable type: Link attribute
 
         """
-        ret = getattr(self.linkobjs[(node1, node2)], attr_name)
+        ret = getattr(self.linkobjs[self.link_mapper[(node1, node2)]], attr_name)
         return ret
 
 
@@ -235,54 +321,72 @@ class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging):
             None
 
         """
-        setattr(self.linkobjs[(node1, node2)], attr_name, val)
+        setattr(self.linkobjs[self.link_mapper[(node1, node2)]], attr_name, val)
+        if (attr_name == 'cap'):
+            self.mark_never_btnk_links()
 
 
     def get_links_on_path(self, path):
-        """Get a list of links along the specified path.
+        """Get the links along the specified path.
 
         Args:
             path (list of strings): List of node names along the path
 
         Returns:
-            list of 2-tuples: List of links along the path, each represented by
-                              a 2-tuple of node names.
+            tuple of 2-tuples: Links along the path, each represented by
+                               a 2-tuple of node names.
+
+        Extra Notes:
+            Paths of the path DB are SimPath instances (see make_path), which already
+            carry their links. Links of other paths are looked up through link_mapper.
 
         """
-        ret = []
+        if (isinstance(path, SimPath)):
+            return path.links
 
-        for i in range(len(path)-1):
-            ret.append(self.link_mapper[(path[i+1], path[i])])
+        return tuple([self.link_mapper[(path[i+1], path[i])] for i in range(len(path)-1)])
 
-        return ret
 
+    def make_path(self, nodes):
+        """Build a SimPath from a list of node names, with its links and link IDs.
+        Referred by SimCtrlPathDB when building the path DB.
 
-    def install_entries_to_path(self, path, links, src_ip, dst_ip):
+        Args:
+            nodes (list of strings): List of node names along the path
+
+        Returns:
+            SimPath: The path
+
+        """
+        links = tuple([self.link_mapper[(nodes[i+1], nodes[i])] for i in range(len(nodes)-1)])
+        return SimPath(nodes, links, tuple([self.link_ids[lk] for lk in links]))
+
+
+    def install_entries_to_path(self, path, links, fl):
         """Install flow entries to the specified path.
 
         Args:
             path (list of str): Path
             links (list of 2-tuples): Links along the path
-            src_ip (netaddr.IPAddress)
-            dst_ip (netaddr.IPAddress)
+            fl (int): Flow key
 
         Returns:
             None
 
         """
         for nd in path:
-            self.nodeobjs[nd].install_flow_entry(src_ip, dst_ip)
+            self.nodeobjs[nd].install_flow_entry(fl)
 
         #for lk in self.get_links_on_path(path):
+        flowobj = self.flows[fl]
         for lk in links:
-            flowobj = self.flows[(src_ip, dst_ip)]
-            self.linkobjs[lk].install_flow_entry(src_ip, dst_ip, flowobj)
+            self.linkobjs[lk].install_flow_entry(fl, flowobj)
 
 
     def create_hosts(self):
         """Create hosts, bind hosts to edge switches, and assign IPs.
         """
-        base_ip = na.IPAddress('10.0.0.1')
+        base_ip = HOST_BASE_IP
         for nd in self.nodes:
             n_hosts = self.nodeobjs[nd].n_hosts
             self.nodeobjs[nd].base_ip = base_ip
@@ -291,7 +395,8 @@ class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging):
             for i in range(n_hosts):
                 myIP = base_ip + i
                 self.hosts[myIP] = nd
-            base_ip = base_ip + 2 ** int(ceil(log(n_hosts, 2)))  # Shift base_ip by an entire IP segment
+            if (n_hosts > 0):   # Switches without hosts (e.g. core switches) take no IP segment
+                base_ip = base_ip + 2 ** int(ceil(log(n_hosts, 2)))  # Shift base_ip by an entire IP segment
 
 
     def main_course(self):
@@ -305,29 +410,44 @@ class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging):
         """
         self.exec_st_time = time()
 
-        # Step 1: Generate initial set of flows and queue them as FlowArrival events
-        self.flowgen.gen_init_flows(self.ev_queue, self)
-
-        # Step 2: Initialize EvLogLinkUtil, EvLogTableUtil and EvReroute events
-        if (cfg.LOG_LINK_UTIL > 0):
-            heappush(self.ev_queue, (cfg.PERIOD_LOGGING, \
-                                     EvLogLinkUtil(ev_time=cfg.PERIOD_LOGGING)))
-        if (cfg.LOG_TABLE_UTIL > 0):
-            heappush(self.ev_queue, (cfg.PERIOD_LOGGING, \
-                                     EvLogTableUtil(ev_time=cfg.PERIOD_LOGGING)))
-        if (cfg.DO_REROUTE > 0):
-            heappush(self.ev_queue, (cfg.PERIOD_REROUTE, \
-                                     EvReroute(ev_time=cfg.PERIOD_REROUTE+0.0001)))
-
-        if (cfg.DO_REROUTE > 0):
-            heappush(self.ev_queue, (cfg.PERIOD_COLLECT, \
-                                     EvCollectCnt(ev_time=cfg.PERIOD_COLLECT)))
+        # Time-stepped fluid engine instead of the event loop (see SimCoreFluid)
+        if (cfg.ENGINE_MODE == 'fluid'):
+            self.main_course_fluid()
+            return
+
+        # Steps 1 and 2 are skipped when continuing from a checkpoint
+        if (not self.is_started):
+            # Step 1: Generate initial set of flows and queue them as FlowArrival events
+            self.flowgen.gen_init_flows(self)
+
+            # Step 2: Register EvLogLinkUtil, EvLogTableUtil, EvReroute and EvCollectCnt
+            # as periodic timers
+            if (cfg.LOG_LINK_UTIL > 0):
+                self.schedule_periodic(cfg.PERIOD_LOGGING, cfg.PERIOD_LOGGING, \
+                                       EvLogLinkUtil(cfg.PERIOD_LOGGING))
+            if (cfg.LOG_TABLE_UTIL > 0):
+                self.schedule_periodic(cfg.PERIOD_LOGGING, cfg.PERIOD_LOGGING, \
+                                       EvLogTableUtil(cfg.PERIOD_LOGGING))
+            if (cfg.DO_REROUTE > 0):
+                self.schedule_periodic(cfg.PERIOD_REROUTE, cfg.PERIOD_REROUTE, \
+                                       EvReroute(cfg.PERIOD_REROUTE))
+
+            if (cfg.DO_REROUTE > 0):
+                self.schedule_periodic(cfg.PERIOD_COLLECT, cfg.PERIOD_COLLECT, \
+                                       EvCollectCnt(cfg.PERIOD_COLLECT))
+
+            self.is_started = True
 
         # Step 3: Main loop of simulation
         print "Logging to folder: %s" %(cfg.LOG_DIR)
         print "Start simulation. Experiment name: %s" %(cfg.EXP_NAME)
 
         next_prog_time = 0.0
+        self.set_next_ckpt_time()
+        self.set_next_branch_time()
+        ev_queue    = self.ev_queue
+        timers      = self.timers
+        ev_handlers = self.ev_handlers
 
         #while (self.timer <= self.sim_time):
         while True:
@@ -348,69 +468,72 @@ class SimCore(SimCoreCalculation, SimCoreEventHandling, SimCoreLogging):
                     sys.stdout.flush()
                     next_prog_time = ceil(percentage) * cfg.SIM_TIME / 100.0
 
-            if (self.ev_queue[0][0] < self.next_end_time):
-                # Next event comes earlier than next flow end
-                event_tuple     = heappop(self.ev_queue)
-                ev_time         = event_tuple[0]
-                event           = event_tuple[1]
-                ev_type         = event.ev_type
+            # Next event is either ev_queue's head or a periodic timer, whichever comes first
+            next_ev = ev_queue.peek()
+            if (timers.head is not None and (next_ev is None or timers.head < next_ev)):
+                next_ev = timers.head
+            elif (next_ev is None):
+                if (self.next_end_time == float('inf')):
+                    break       # Nothing left to simulate
+                next_ev = NO_EVENT
+
+            if (self.rates_dirty or next_ev[0] < self.next_end_time):
+                # Next event comes earlier than next flow end.
+                # If flow rates are pending recalculation, next_end_time is stale and
+                # there are more events at the current ev_time: handle those first.
+                if (next_ev is timers.head):
+                    ev_time, ev_seq, ev_type, event = next_ev[:4]
+                    event.ev_time = ev_time
+                    self.rearm_periodic(next_ev)
+                else:
+                    ev_time, ev_seq, ev_type, event = ev_queue.pop()
             else:
                 # Next flow end comes earlier than next event
                 # Immediately schedule a EvFlowEnd event and handle it!
                 ev_time         = self.next_end_time
-                event           = EvFlowEnd(ev_time=ev_time, \
-                                            src_ip=self.next_end_flow[0], \
-                                            dst_ip=self.next_end_flow[1])
-                ev_type         = 'EvFlowEnd'
+                event           = EvFlowEnd(ev_time, key_src(self.next_end_flow), \
+                                            key_dst(self.next_end_flow))
+                ev_type         = EV_FLOW_END
 
-            self.timer = self.ev_queue[0][0]    # Set timer to next event's ev_time
+            # Set timer to next event's ev_time
+            self.timer = min(ev_queue.peek_time(), timers.peek_time())
 
             if (cfg.SHOW_EVENTS > 0):
                 print '%.6f' %(ev_time)
                 print event
 
             # ---- Handle Events ----
-            # Handle EvFlowArrival
-            if   (ev_type == 'EvFlowArrival'):
-                self.handle_EvFlowArrival(ev_time, event)
-
-            # Handle EvPacketIn
-            elif (ev_type == 'EvPacketIn'):
-                self.handle_EvPacketIn(ev_time, event)
-
-            # Handle EvFlowInstall
-            elif (ev_type == 'EvFlowInstall'):
-                self.handle_EvFlowInstall(ev_time, event)
-
-            # Handle EvFlowEnd
-            elif (ev_type == 'EvFlowEnd'):
-                self.handle_EvFlowEnd(ev_time, event)
-
-            # Handle EvIdleTimeout
-            elif (ev_type == 'EvIdleTimeout'):
-                self.handle_EvIdleTimeout(ev_time, event)
+            # Dispatch to the handler registered for ev_type
+            ev_handlers[ev_type](ev_time, event)
 
-            # Handle EvCollectCnt
-            elif (ev_type == 'EvCollectCnt'):
-                self.handle_EvCollectCnt(ev_time, event)
+            # Recalculate flow rates (and next_end_time) only once per time instant,
+            # after the last event at ev_time is handled.
+            if (self.rates_dirty and min(ev_queue.peek_time(), timers.peek_time()) > ev_time):
+                self.recalc_flow_rates(ev_time)
+                self.rates_dirty = False
 
-            # Handle EvReroute
-            elif (ev_type == 'EvReroute'):
-                self.handle_EvReroute(ev_time, event)
+            # Checkpoint simulator state between time instants
+            if (self.timer >= self.next_ckpt_time and not self.rates_dirty):
+                self.do_checkpoint()
 
-            # Handle EvLogLinkUtil
-            elif (ev_type == 'EvLogLinkUtil'):
-                self.handle_EvLogLinkUtil(ev_time, event)
-
-            # Handle EvLogTableUtil
-            elif (ev_type == 'EvLogTableUtil'):
-                self.handle_EvLogTableUtil(ev_time, event)
+            # Fork branches from the warm simulator state
+            if (self.timer >= self.next_branch_time and not self.rates_dirty):
+                self.do_branch()
 
         # Finalize
         self.update_all_flows(self.sim_time)
         self.exec_ed_time = time()
 
         # Step 4: Dump list of records to csv files
+        self.dump_logs()
+
+        # Parent of branches waits for them to finish
+        self.wait_branches()
+
+
+    def dump_logs(self):
+        """Dump list of records to csv files, and show summary. Step 4 of main_course.
+        """
         if (cfg.LOG_LINK_UTIL > 0):
             self.dump_link_util()
             self.dump_link_flows()
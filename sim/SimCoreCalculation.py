@@ -7,9 +7,19 @@ __author__      = 'Kuan-yin Chen'
 __copyright__   = 'Copyright 2014, NYU-Poly'
 
 # Built-in modules
+from heapq import heappush, heappop, heapify
 # Third-party modules
+import numpy as np
 # User-defined modules
 import SimConfig as cfg
+from SimSortedFlows import SortedFlows
+from SimPathClass import SimPathClass
+from SimFlowTable import *
+from SimHostAddr import *
+
+# Approximate rate mode: a new flow's provisional share on a link with no residual capacity,
+# as a fraction of the link's equal share (cap / n_active_flows)
+PROVISIONAL_MIN_SHARE = 0.01
 
 class SimCoreCalculation:
     """Flow rate calculation-related codes for SimCore class.
@@ -17,66 +27,741 @@ class SimCoreCalculation:
     def __init__(self):
         """
         """
-        self.sorted_flows = []
-            # A sorted list of flows (in ascending order of flow_rate)
-            # Each element is a 3-tuple: (flow_rate, flowobj, flow_key)
+        self.sorted_flows = SortedFlows()
+            # Active flows sorted in ascending order of (flow_rate, flow_id)
+            # Each element is a 4-tuple: (flow_rate, flow_id, flowobj, flow_key)
+        self.end_heap = []
+            # Min-heap of flows' estimated end times, pushed whenever a flow's rate changes
+            # Each element is a 3-tuple: (est_end_time, (flow_rate, flow_id), flow_key)
+            # Entries of ended flows, or with outdated est_end_time, are dropped lazily.
+        self.rates_dirty = False
+            # Set by event handlers that change the set of active flows or their paths.
+            # SimCore.main_course calls calc_flow_rates once all events of the same
+            # ev_time have been handled, then clears the flag.
+        self.total_rate = 0.0
+            # Sum of all active flows' curr_rate
+        self.byte_cnt_time = 0.0
+            # Time up to which link byte counters have been integrated
+        self.changed_links = set()
+            # Links whose set of active flows changed since the last calc_flow_rates.
+            # Used by cfg.RATE_ALLOC_MODE == 'incremental'.
+        self.path_classes = {}
+            # Used by cfg.RATE_ALLOC_MODE == 'pathclass'.
+            # Key: (tuple of links, source rate), Value: SimPathClass
+        self.dirty_classes = set()
+            # Path classes whose flows, or rate, changed since their est_end_time was set
+        self.class_end_heap = []
+            # Min-heap of path classes' est_end_time
+            # Each element is a 4-tuple: (est_end_time, sort key, flow key, SimPathClass),
+            # where sort key and flow key are those of the class's earliest-ending flow.
+
+        # Approximate rate mode (cfg.RATE_APPROX_INTERVAL > 0 or cfg.RATE_APPROX_N_CHANGES > 0)
+        self.n_rate_changes = 0
+            # Number of flow installs, ends and reroutes since the last calc_flow_rates
+        self.last_calc_time = float('-inf')
+            # ev_time of the last calc_flow_rates
+        self.provisional_flows = []
+            # Flows installed since the last calc_flow_rates, waiting for a provisional rate
+        self.n_exact_calc = 0
+        self.n_provisional_calc = 0
+        self.max_rate_dev = 0.0
+            # Largest |exact rate - approximate rate| of a flow still active at an exact
+            # calc_flow_rates. A sample, not a bound: flows that end in between are not seen.
+        self.max_rel_rate_dev = 0.0
+            # Largest |exact rate - approximate rate| / exact rate of such a flow
 
 
     def sorted_flows_insert(self, flow_rate, flowobj, flow_key):
         """
         """
-        # If source rate is unlimited, we can simply put an 'inf' in the sorted_flows list.
+        # If source rate is unlimited, we can simply put an 'inf' in the sorted_flows list,
+        # so flows are kept in order of arrival.
         if (cfg.SRC_LIMITED == 0):
-            self.sorted_flows.append((float('inf'), flowobj, flow_key))
+            flow_rate = float('inf')
+
+        self.sorted_flows.insert(flow_rate, flowobj, flow_key)     # O(log n)
+
+
+    def sorted_flows_remove(self, flow_key):
+        """
+        """
+        self.sorted_flows.remove(flow_key)     # O(log n), located by flow_key
+
+
+    def update_all_flows(self, ev_time):
+        """Bring the states of all flows up to ev_time, as SimFlow.update_flow() does,
+        with numpy operations over the columns of self.flow_table.
+        """
+        t           = self.flow_table
+        status      = t.view('status')
+        act         = np.flatnonzero(status == FLOW_ACTIVE)
+        update_time = t.view('update_time')
+        bytes_left  = t.view('bytes_left')
+        bytes_sent  = t.view('bytes_sent')
+        cnt         = t.view('cnt')
+
+        bytes_recent    = t.view('curr_rate')[act] * (ev_time - update_time[act])
+        bytes_left[act] -= bytes_recent
+        bytes_sent[act] = t.view('flow_size')[act] - bytes_left[act]
+        cnt[act]        += bytes_recent
+        t.view('avg_rate')[act] = bytes_sent[act] / (ev_time - t.view('arrive_time')[act])
+
+        update_time[status != FLOW_FREE] = ev_time
+
+
+    def update_link_byte_cnt(self, ev_time):
+        """Integrate each link's aggregate assigned rate (and the total rate of all flows)
+        into link byte counters (and global throughput) up to ev_time.
+
+        Args:
+            ev_time (float64): Current time
+
+        Extra Notes:
+            Whoever changes a flow's curr_rate or path (calc_flow_rates, flow end, reroute)
+            must call this method first, and then update link rates with add_flow_rate().
+            So between two calls, link rates are constant.
+
+        """
+        dt = ev_time - self.byte_cnt_time
+        if (dt > 0.0):
+            byte_cnt                    = self.link_table.view('byte_cnt')
+            byte_cnt                    += self.link_table.view('asgn_rate') * dt
+            self.global_throughput      += self.total_rate * dt
+        self.byte_cnt_time = ev_time
+
+
+    def add_flow_rate(self, flowobj, delta):
+        """Add delta to the aggregate rate of each link on a flow's path, and to the total
+        rate of all flows. Called when the flow's curr_rate changes by delta, or with
+        -curr_rate / +curr_rate when the flow leaves / joins its path.
+        """
+        asgn_rate = self.link_table.asgn_rate
+        for i in self.flow_table.path[flowobj.fid].link_ids:
+            asgn_rate[i] += delta
+        self.total_rate += delta
+
+
+    def assign_flow_bw(self, flowobj, ev_time, asgn_bw):
+        """Assign BW to a flow during calc_flow_rates. The flow's states are only updated
+        if its rate actually changes.
+        """
+        ft, fid = self.flow_table, flowobj.fid
+        if (asgn_bw == ft.curr_rate[fid]):
+            ft.assigned[fid] = True     # est_end_time still holds
+        else:
+            flowobj.update_flow(ev_time)
+            self.add_flow_rate(flowobj, asgn_bw - ft.curr_rate[fid])
+            flowobj.assign_bw(ev_time, asgn_bw)
+            fl = (ft.src_ip[fid] << 32) | ft.dst_ip[fid]
+            sort_key = self.sorted_flows.keys.get(fl)
+            if (sort_key is not None):      # Flows not in sorted_flows never end by end_heap
+                heappush(self.end_heap, (ft.est_end_time[fid], sort_key, fl))
+
+
+    def recalc_flow_rates(self, ev_time):
+        """Update flow rates once all events at ev_time have been handled. Either runs
+        calc_flow_rates, or, in approximate rate mode, may only assign provisional rates to
+        newly installed flows.
+
+        Args:
+            ev_time (float64): Current time
+
+        Extra Notes:
+            - Approximate rate mode is on if cfg.RATE_APPROX_INTERVAL > 0 or
+              cfg.RATE_APPROX_N_CHANGES > 0. calc_flow_rates then runs at most once per
+              RATE_APPROX_INTERVAL sim seconds, or once per RATE_APPROX_N_CHANGES flow
+              installs, ends and reroutes, whichever comes first.
+            - In between, each new flow gets a provisional share of the residual capacity
+              along its path (see assign_provisional_rates), and other flows keep their
+              rates, so links may be under-subscribed, but are not over-subscribed (except
+              by PROVISIONAL_MIN_SHARE on links with no residual capacity). Rerouted flows
+              are given a provisional rate on their new path too (see
+              release_flow_rate).
+            - At each exact calc_flow_rates, the deviation of each active flow's rate from
+              its exact rate is sampled, and the largest one is reported in summary.csv.
+              Flows that start and end between two exact calc_flow_rates are not sampled,
+              so this is an estimate of the error, not a bound.
+            - Approximate rate mode is not available with cfg.RATE_ALLOC_MODE == 'pathclass',
+              whose flows always run at their class's exact rate.
+
+        """
+        if (not self.is_rate_approx()):
+            self.calc_flow_rates(ev_time)
+        elif ((cfg.RATE_APPROX_INTERVAL > 0 and \
+               ev_time - self.last_calc_time >= cfg.RATE_APPROX_INTERVAL) or \
+              (cfg.RATE_APPROX_N_CHANGES > 0 and \
+               self.n_rate_changes >= cfg.RATE_APPROX_N_CHANGES)):
+            approx_rates = [(tpl[2], tpl[2].curr_rate) for tpl in self.sorted_flows]
+            self.calc_flow_rates(ev_time)
+            for flowobj, approx_rate in approx_rates:
+                if (approx_rate > 0.0):
+                    dev = abs(flowobj.curr_rate - approx_rate)
+                    self.max_rate_dev = max(self.max_rate_dev, dev)
+                    if (flowobj.curr_rate > 0.0):   # e.g. not on a zero-capacity link
+                        self.max_rel_rate_dev = max(self.max_rel_rate_dev, \
+                                                    dev / flowobj.curr_rate)
+            self.n_exact_calc += 1
+        else:
+            self.assign_provisional_rates(ev_time)
+            self.n_provisional_calc += 1
             return
 
-        # Or else, we need to have the list sorted in ascending order of flow source rate.
-        # Here we manually implement binary search.
-        # Why? Although bisect library implemets the search algorithm, but it requires a
-        # separated sorted_keys list, which is not what I wanted.
-        lo  = 0
-        hi  = len(self.sorted_flows)
-        mid = 0
-        while (lo < hi):    # O(log n)
-            mid = (lo + hi) / 2     # Integer
-            mid_rate = self.sorted_flows[mid][0]     # First element of the 3-tuple
-            if (mid_rate < flow_rate):
-                lo = mid + 1
-            elif (mid_rate > flow_rate):
-                hi = mid
-            else:
+        self.n_rate_changes     = 0
+        self.last_calc_time     = ev_time
+        self.provisional_flows  = []
+
+
+    def is_rate_approx(self):
+        """Check whether approximate rate mode is on (see recalc_flow_rates).
+        """
+        return ((cfg.RATE_APPROX_INTERVAL > 0 or cfg.RATE_APPROX_N_CHANGES > 0) and \
+                not cfg.RATE_ALLOC_MODE == 'pathclass')
+
+
+    def release_flow_rate(self, ev_time, flowobj):
+        """In approximate rate mode, stop a flow that has just been moved to a new path,
+        and queue it for a provisional rate, as if it were newly installed.
+
+        Args:
+            ev_time (float64): Current time
+            flowobj (SimFlow): The flow. Its rate must already be taken off its old path
+                with add_flow_rate(), and not yet be added to its new path.
+
+        Extra Notes:
+            Keeping its old rate could over-subscribe links on the new path until the next
+            exact calc_flow_rates.
+
+        """
+        ft, fid = self.flow_table, flowobj.fid
+        flowobj.update_flow(ev_time)
+        ft.curr_rate[fid]       = 0.0
+        ft.est_end_time[fid]    = float('inf')
+        self.provisional_flows.append(flowobj)
+
+
+    def assign_provisional_rates(self, ev_time):
+        """Assign provisional rates to flows installed since the last calc_flow_rates.
+
+        Args:
+            ev_time (float64): Current time
+
+        Extra Notes:
+            On each link, the residual capacity (cap - asgn_rate) is split evenly among the
+            link's new flows. If the link has no residual capacity, a new flow gets
+            PROVISIONAL_MIN_SHARE of the link's equal share (cap / n_active_flows) instead,
+            so that it does not stall until the next exact calc_flow_rates. A new flow's
+            rate is the smallest such share along its path, and no more than its source
+            rate if cfg.SRC_LIMITED > 0.
+
+        """
+        new_flows = [flowobj for flowobj in self.provisional_flows \
+                     if (flowobj.status == FLOW_ACTIVE and flowobj.curr_rate == 0.0)]
+        self.provisional_flows = []
+
+        n_new = {}      # Key: link ID, Value: # of new flows on the link
+        for flowobj in new_flows:
+            for i in flowobj.path.link_ids:
+                n_new[i] = n_new.get(i, 0) + 1
+
+        # Shares are taken before any new flow is added to link rates
+        lt          = self.link_table
+        cap         = lt.cap
+        asgn_rate   = lt.asgn_rate
+        n_active    = lt.n_active_flows
+        asgn_bws    = []
+        for flowobj in new_flows:
+            asgn_bw = flowobj.flow_rate if (cfg.SRC_LIMITED > 0) else float('inf')
+            for i in flowobj.path.link_ids:
+                residual = cap[i] - asgn_rate[i]
+                if (residual > 0.0):
+                    share = residual / n_new[i]
+                else:
+                    share = PROVISIONAL_MIN_SHARE * cap[i] / n_active[i]
+                asgn_bw = min(asgn_bw, share)
+            asgn_bws.append(asgn_bw)
+
+        self.update_link_byte_cnt(ev_time)
+        for flowobj, asgn_bw in zip(new_flows, asgn_bws):
+            if (asgn_bw < float('inf')):
+                self.assign_flow_bw(flowobj, ev_time, asgn_bw)
+
+        self.find_next_end_flow()
+
+
+    def calc_flow_rates(self, ev_time):
+        """Recalculate flow rates with the allocator selected by cfg.RATE_ALLOC_MODE.
+
+        Args:
+            ev_time (float64): Current time
+
+        Returns:
+            None. But will update flow and link rates, as well as identify next ending
+            flow and its estimated end time.
+
+        Extra Notes:
+            - 'devoflow': DevoFlow Algorithm 1 over all active flows (default).
+            - 'maxmin': Exact max-min fair water-filling over all active flows.
+            - 'incremental': Same result as 'maxmin', but water-filling only runs on the
+              flows and links that are connected to self.changed_links.
+            - 'numpy': Same result as 'maxmin' (up to floating point rounding), but
+              water-filling rounds are vectorized over a sparse flow x link matrix.
+            - 'pathclass': Same result as 'maxmin' (up to floating point rounding), but
+              water-filling runs over path classes (see SimPathClass) instead of flows.
+
+        """
+        # Bytes sent at the rates that are about to change are credited to links first
+        self.update_link_byte_cnt(ev_time)
+        if (len(self.sorted_flows) == 0):
+            self.total_rate = 0.0       # Drop floating point residue
+
+        self.run_rate_allocator(ev_time)
+
+        # Links marked never_btnk are left out of rate allocation. If one of them is
+        # overloaded anyway, the marking no longer holds (e.g. a link capacity was changed
+        # without mark_never_btnk_links): drop it, and redo with all links.
+        for lk in self.never_btnk_links:
+            linkobj = self.linkobjs[lk]
+            if (linkobj.asgn_rate > linkobj.cap * (1.0 + 1e-9)):
+                for lk in self.never_btnk_links:
+                    self.linkobjs[lk].never_btnk = False
+                self.never_btnk_links   = []
+                self.changed_links.update(self.links)
+                self.run_rate_allocator(ev_time)
                 break
 
-        self.sorted_flows.insert(mid, (flow_rate, flowobj, flow_key) )  # O(n)
+        self.changed_links = set()
 
 
-    def sorted_flows_remove(self, flow_key):
+    def run_rate_allocator(self, ev_time):
+        """Run the allocator selected by cfg.RATE_ALLOC_MODE. Referred by calc_flow_rates.
         """
+        if (cfg.RATE_ALLOC_MODE == 'incremental'):
+            self.calc_flow_rates_incremental(ev_time)
+        elif (cfg.RATE_ALLOC_MODE == 'maxmin'):
+            self.calc_flow_rates_maxmin(ev_time)
+        elif (cfg.RATE_ALLOC_MODE == 'numpy'):
+            self.calc_flow_rates_numpy(ev_time)
+        elif (cfg.RATE_ALLOC_MODE == 'pathclass'):
+            self.calc_flow_rates_pathclass(ev_time)
+        else:
+            self.calc_flow_rates_devoflow(ev_time)     # Default to 'devoflow'
+
+
+    def find_next_end_flow(self):
+        """Find the active flow with the earliest est_end_time, and record it as
+        self.next_end_flow and self.next_end_time.
+
+        Extra Notes:
+            Heap entries are outdated if the flow has ended (it is no longer in
+            self.sorted_flows under the same flow_id), or if its est_end_time has changed.
+            Ties are broken by order in self.sorted_flows.
+            Once outdated entries make up most of the heap, it is rebuilt from active flows.
+
         """
-        for i in range(len(self.sorted_flows)):
-            # Since flow_rate may not be unique, I still implemented a linear search.
-            # It's done only once per EvFlowEnd so doesn't matter much.
-            if (self.sorted_flows[i][2] == flow_key):
-                self.sorted_flows.pop(i)
+        if (cfg.RATE_ALLOC_MODE == 'pathclass'):
+            self.find_next_end_class()
+            return
+
+        end_heap        = self.end_heap
+        est_end_time    = self.flow_table.est_end_time
+        if (len(end_heap) > 2 * len(self.sorted_flows) + 1024):
+            end_heap[:] = [(est_end_time[tpl[2].fid], tpl[:2], tpl[3]) \
+                           for tpl in self.sorted_flows \
+                           if (est_end_time[tpl[2].fid] < float('inf'))]
+            heapify(end_heap)
+
+        flows, sort_keys = self.flows, self.sorted_flows.keys
+        while (end_heap):
+            est, sort_key, fl = end_heap[0]
+            if (sort_keys.get(fl) == sort_key and est_end_time[flows[fl].fid] == est):
+                self.next_end_time = est
+                self.next_end_flow = fl
                 return
+            heappop(end_heap)
+
+        self.next_end_time  = float('inf')
+        self.next_end_flow  = NO_FLOW
 
 
-    def update_all_flows(self, ev_time):
+    def find_next_end_class(self):
+        """Find the active flow with the earliest estimated end time from path classes,
+        and record it as self.next_end_flow and self.next_end_time.
+
+        Extra Notes:
+            Heap entries are outdated if the class has been emptied, or if its
+            est_end_time has changed since. Ties are broken by order in self.sorted_flows.
+
         """
+        class_end_heap = self.class_end_heap
+        if (len(class_end_heap) > 2 * len(self.path_classes) + 1024):
+            class_end_heap[:] = [x for x in class_end_heap \
+                                 if (x[3].flows and x[3].est_end_time == x[0])]
+            heapify(class_end_heap)
+
+        while (class_end_heap):
+            est, sort_key, fl, pc = class_end_heap[0]
+            if (pc.flows and pc.est_end_time == est):
+                self.next_end_time = est
+                self.next_end_flow = fl
+                return
+            heappop(class_end_heap)
+
+        self.next_end_time  = float('inf')
+        self.next_end_flow  = NO_FLOW
+
+
+    def path_class_join(self, flow_key, flowobj):
+        """Add an active flow to the path class of its links (and source rate), when it is
+        installed or rerouted. No-op unless cfg.RATE_ALLOC_MODE == 'pathclass'.
         """
-        for fl in self.flows:
-            flowobj = self.flows[fl]
-            bytes_recent = flowobj.update_flow(ev_time)
+        if (cfg.RATE_ALLOC_MODE != 'pathclass'):
+            return
+        src_rate    = flowobj.flow_rate if (cfg.SRC_LIMITED > 0) else float('inf')
+        key         = (tuple(flowobj.links), src_rate)
+        pc          = self.path_classes.get(key)
+        if (pc is None):
+            pc = SimPathClass(key, flowobj.path.link_ids)
+            self.path_classes[key] = pc
+            for i in pc.link_ids:
+                self.link_table.path_classes[i][key] = pc
+        pc.add_flow(flow_key, flowobj)
+        self.dirty_classes.add(pc)
+
+
+    def path_class_leave(self, flow_key, flowobj):
+        """Remove an active flow from its path class, when it ends or is rerouted.
+        No-op unless cfg.RATE_ALLOC_MODE == 'pathclass'.
+        """
+        if (cfg.RATE_ALLOC_MODE != 'pathclass'):
+            return
+        pc = flowobj.path_class
+        pc.remove_flow(flow_key)
+        if (pc.flows):
+            self.dirty_classes.add(pc)
+        else:
+            del self.path_classes[pc.key]
+            for i in pc.link_ids:
+                del self.link_table.path_classes[i][pc.key]
+            self.dirty_classes.discard(pc)
+
+
+    def assign_class_bw(self, pc, ev_time, asgn_bw):
+        """Assign BW to every flow of a path class during calc_flow_rates. Flows are only
+        updated if the class rate changes, or if they joined since the last assignment.
+        """
+        pc.assigned = True
+        pc.advance(ev_time)
+        if (asgn_bw != pc.rate):
+            flowobjs = pc.flows.itervalues()
+            pc.rate  = asgn_bw
+            self.dirty_classes.add(pc)
+        elif (pc.new_flows):
+            flowobjs = [pc.flows[fl] for fl in pc.new_flows if (fl in pc.flows)]
+        else:
+            return
 
-            if (flowobj.status == 'active'):
-                self.global_throughput      += bytes_recent
-                for lk in flowobj.links:
-                    # Update link byte counters
-                    self.link_byte_cnt[lk]  += bytes_recent
+        delta = 0.0     # Sum of rate changes, added to each link of the class at once
+        for flowobj in flowobjs:
+            if (asgn_bw != flowobj.curr_rate):
+                flowobj.update_flow(ev_time)
+                delta += asgn_bw - flowobj.curr_rate
+                flowobj.assign_bw(ev_time, asgn_bw)
+        asgn_rate = self.link_table.asgn_rate
+        for i in pc.link_ids:
+            asgn_rate[i] += delta
+        self.total_rate += delta
 
 
-    #def calc_flow_rates_src_limited(self, ev_time):
-    def calc_flow_rates(self, ev_time):
+    def calc_flow_rates_pathclass(self, ev_time):
+        """Calculate exact max-min fair flow rates by water-filling over path classes.
+        Aware of each flow's source rate if cfg.SRC_LIMITED > 0.
+
+        Args:
+            ev_time (float64): Current time
+
+        Extra Notes:
+            Flows in a path class share all their links (and source rates), so max-min
+            fairness gives them the same rate. Water-filling is done as in water_fill(),
+            except that a class counts as len(class) flows on each of its links. So its
+            cost grows with the number of distinct paths, not with the number of flows.
+
+        """
+        classes = self.path_classes.values()
+
+        # Link attributes are read from self.link_table columns directly, by link ID
+        lt              = self.link_table
+        unasgn_bw       = lt.unasgn_bw
+        n_unasgn_flows  = lt.n_unasgn_flows
+        bw_per_flow     = lt.bw_per_flow
+        never_btnk      = lt.never_btnk
+        lt.view('unasgn_bw')[:]         = lt.view('cap')
+        lt.view('n_unasgn_flows')[:]    = 0
+        for pc in classes:
+            pc.assigned = False
+            for i in pc.link_ids:
+                n_unasgn_flows[i] += len(pc.flows)
+
+        btnk_heap = []      # Heap of (bw_per_flow, link key, link ID)
+        for i, lk in enumerate(self.links):
+            if (n_unasgn_flows[i] == 0):
+                lt.asgn_rate[i] = 0.0           # Drop floating point residue
+            elif (not never_btnk[i]):
+                bw_per_flow[i]  = unasgn_bw[i] / float(n_unasgn_flows[i])
+                btnk_heap.append((bw_per_flow[i], lk, i))
+        heapify(btnk_heap)
+
+        if (cfg.SRC_LIMITED > 0):
+            src_order = sorted(classes, key=lambda x: x.key[1])
+        else:
+            src_order = []
+        i_src       = 0
+        n_unasgn    = len(classes)
+
+        while (n_unasgn > 0):
+            # Find bottleneck link (see water_fill)
+            while (btnk_heap):
+                btnk_bw, btnk_link, btnk_i = btnk_heap[0]
+                if (n_unasgn_flows[btnk_i] > 0 and bw_per_flow[btnk_i] == btnk_bw):
+                    break
+                heappop(btnk_heap)
+            else:
+                break
+
+            while (i_src < len(src_order) and src_order[i_src].assigned):
+                i_src += 1
+
+            if (i_src < len(src_order) and src_order[i_src].key[1] < btnk_bw):
+                # Case 1: The class is limited by its source rate
+                asgn_classes    = [src_order[i_src]]
+                asgn_bw         = src_order[i_src].key[1]
+            else:
+                # Case 2: All unassigned classes on btnk_link get its fair share
+                asgn_classes    = [pc for pc in lt.path_classes[btnk_i].itervalues() \
+                                   if (not pc.assigned)]
+                asgn_bw         = btnk_bw
+
+            for pc in asgn_classes:
+                self.assign_class_bw(pc, ev_time, asgn_bw)
+                n_unasgn -= 1
+
+                n_flows = len(pc.flows)
+                for lk, i in zip(pc.links, pc.link_ids):
+                    if (never_btnk[i]):
+                        continue
+                    unasgn_bw[i]        -=  asgn_bw * n_flows
+                    n_unasgn_flows[i]   -=  n_flows
+                    if (n_unasgn_flows[i] > 0):
+                        bw_per_flow[i]  =   unasgn_bw[i] / float(n_unasgn_flows[i])
+                        heappush(btnk_heap, (bw_per_flow[i], lk, i))
+
+        # Give new flows their finish tags, and update est_end_time of changed classes
+        sort_keys = self.sorted_flows.keys
+        for pc in self.dirty_classes:
+            for fl in pc.new_flows:
+                if (fl in pc.flows):
+                    pc.push_tag(fl, sort_keys[fl])
+            pc.new_flows = []
+
+            head = pc.head()
+            if (pc.rate > 0.0):
+                pc.est_end_time = pc.vtime + (head[0] - pc.vbytes) / pc.rate
+            else:
+                pc.est_end_time = float('inf')
+            heappush(self.class_end_heap, (pc.est_end_time, head[1], head[2], pc))
+        self.dirty_classes = set()
+
+        self.find_next_end_class()
+
+
+    def calc_flow_rates_maxmin(self, ev_time):
+        """Calculate exact max-min fair flow rates over all active flows and all links.
+        """
+        flows = {tpl[3]: tpl[2] for tpl in self.sorted_flows}
+        self.water_fill(ev_time, flows, range(len(self.links)))
+        self.find_next_end_flow()
+
+
+    def calc_flow_rates_incremental(self, ev_time):
+        """Calculate exact max-min fair flow rates, but only for flows whose rates may
+        change: those connected to self.changed_links through shared links.
+
+        Extra Notes:
+            Max-min fair allocation can be done separately for each connected component of
+            the flow-link graph, since flows in different components share no link. A flow
+            arriving, ending or being rerouted only changes the component(s) its links
+            belong to, so the rates of all other flows still hold.
+
+        """
+        never_btnk      = self.link_table.never_btnk
+        active_flows    = self.link_table.active_flows
+        comp_flows  = {}
+        comp_links  = set()     # IDs of links in the components
+        visited     = set()     # Flow objects already in comp_flows. Cheaper to hash than keys.
+        stack       = [self.link_ids[lk] for lk in self.changed_links]
+        while (stack):
+            i = stack.pop()
+            if (i in comp_links or never_btnk[i]):
+                continue    # Flows on never_btnk links are reached through their other links
+            comp_links.add(i)
+            for fl, flowobj in active_flows[i].iteritems():
+                if (not flowobj in visited):
+                    visited.add(flowobj)
+                    comp_flows[fl] = flowobj
+                    stack.extend(flowobj.path.link_ids)
+
+        self.water_fill(ev_time, comp_flows, comp_links)
+        self.find_next_end_flow()
+
+
+    def water_fill(self, ev_time, flows, links):
+        """Max-min fair water-filling (progressive filling) over a set of flows and the links
+        they run on. Aware of each flow's source rate if cfg.SRC_LIMITED > 0.
+
+        Args:
+            ev_time (float64): Current time
+            flows (dict): Active flows to be assigned. Key: flow key, Value: SimFlow.
+            links (iterable of int): IDs of links to be filled. Must include every link of
+                                     every flow in flows (except never_btnk links, which
+                                     are skipped), and no link may carry an active flow
+                                     that is not in flows.
+
+        Extra Notes:
+            Each round picks the bottleneck link with the smallest fair share
+            (unasgn_bw / n_unasgn_flows), and assigns that share to all its unassigned flows.
+            If a flow's source rate is below the smallest fair share, the flow is assigned
+            its source rate first.
+            Ties are broken by link key and flow key, so that the result does not depend on
+            the order of flows and links passed in (down to the last bit).
+            Links are kept in a min-heap of (bw_per_flow, link key, link ID). A link's entry
+            is pushed again whenever its share changes, and outdated entries are dropped when
+            they reach the top, so each bottleneck costs O(log L) instead of a scan of all
+            links.
+            Link attributes are read from self.link_table columns directly, by link ID.
+
+        """
+        lt              = self.link_table
+        cap             = lt.cap
+        unasgn_bw       = lt.unasgn_bw
+        n_unasgn_flows  = lt.n_unasgn_flows
+        bw_per_flow     = lt.bw_per_flow
+        never_btnk      = lt.never_btnk
+        link_keys       = self.links
+
+        for i in links:
+            unasgn_bw[i]        = cap[i]
+            n_unasgn_flows[i]   = 0
+        for flowobj in flows.itervalues():
+            for i in flowobj.path.link_ids:
+                n_unasgn_flows[i] += 1
+
+        btnk_heap = []
+        for i in links:
+            if (n_unasgn_flows[i] == 0):
+                lt.asgn_rate[i] = 0.0           # Drop floating point residue
+            elif (not never_btnk[i]):
+                bw_per_flow[i]  = unasgn_bw[i] / float(n_unasgn_flows[i])
+                btnk_heap.append((bw_per_flow[i], link_keys[i], i))
+        heapify(btnk_heap)
+
+        unasgn_flows = set(flows.itervalues())      # Set of SimFlow objects
+        if (cfg.SRC_LIMITED > 0):
+            src_order = [flowobj for fl, flowobj in \
+                         sorted(flows.iteritems(), key=lambda x: (x[1].flow_rate, x[0]))]
+        else:
+            src_order = []
+        i_src = 0
+
+        while (unasgn_flows):
+            # Find bottleneck link. Heap entries are outdated if the link's share has
+            # changed, or if it has no unassigned flows left.
+            while (btnk_heap):
+                btnk_bw, btnk_link, btnk_i = btnk_heap[0]
+                if (n_unasgn_flows[btnk_i] > 0 and bw_per_flow[btnk_i] == btnk_bw):
+                    break
+                heappop(btnk_heap)
+            else:
+                break
+
+            # Skip flows that are already assigned, and find the smallest source rate
+            while (i_src < len(src_order) and not src_order[i_src] in unasgn_flows):
+                i_src += 1
+
+            if (i_src < len(src_order) and src_order[i_src].flow_rate < btnk_bw):
+                # Case 1: The flow is limited by its own source rate
+                asgn_flows  = [src_order[i_src]]
+                asgn_bw     = src_order[i_src].flow_rate
+            else:
+                # Case 2: All unassigned flows on btnk_link get its fair share
+                asgn_flows  = [flowobj for flowobj in lt.active_flows[btnk_i].itervalues() \
+                               if (flowobj in unasgn_flows)]
+                asgn_bw     = btnk_bw
+                if (not asgn_flows):
+                    # The link's count disagrees with its active_flows. Drop the link, so
+                    # that every round makes progress.
+                    n_unasgn_flows[btnk_i] = 0
+                    continue
+
+            for flowobj in asgn_flows:
+                self.assign_flow_bw(flowobj, ev_time, asgn_bw)
+                unasgn_flows.remove(flowobj)
+
+                for i in flowobj.path.link_ids:
+                    if (never_btnk[i]):
+                        continue
+                    unasgn_bw[i]        -=  asgn_bw
+                    n_unasgn_flows[i]   -=  1
+                    if (n_unasgn_flows[i] > 0):
+                        bw_per_flow[i]  =   unasgn_bw[i] / float(n_unasgn_flows[i])
+                        heappush(btnk_heap, (bw_per_flow[i], link_keys[i], i))
+
+
+    def calc_flow_rates_numpy(self, ev_time):
+        """Calculate exact max-min fair flow rates over all active flows and all links, with
+        water-filling rounds done as numpy array operations. Aware of each flow's source
+        rate if cfg.SRC_LIMITED > 0.
+
+        Args:
+            ev_time (float64): Current time
+
+        Extra Notes:
+            The flow x link incidence matrix is kept in coordinate form: inc_flow[k] and
+            inc_link[k] are the flow row and link column of the k-th nonzero entry. Per-link
+            sums over active entries are then np.bincount() calls (see maxmin_fill()).
+            The number of rounds is the number of distinct rate levels, not the number
+            of bottleneck links or flows as in water_fill().
+
+        """
+        lt      = self.link_table
+        n_links = len(self.links)
+
+        flowobjs    = [tpl[2] for tpl in self.sorted_flows]
+        n_flows     = len(flowobjs)
+        inc_link    = [i for flowobj in flowobjs for i in flowobj.path.link_ids]
+        inc_link    = np.array(inc_link, dtype=np.intp)
+        inc_flow    = np.repeat(np.arange(n_flows), [len(flowobj.links) for flowobj in flowobjs])
+        if (cfg.SRC_LIMITED > 0):
+            src_rate = np.array([flowobj.flow_rate for flowobj in flowobjs], dtype=np.float64)
+        else:
+            src_rate = np.full(n_flows, np.inf)
+
+        # Drop floating point residue
+        lt.view('asgn_rate')[np.bincount(inc_link, minlength=n_links) == 0] = 0.0
+
+        # never_btnk links are left out of the matrix
+        inc_kept    = lt.view('never_btnk')[inc_link] == 0
+        inc_link    = inc_link[inc_kept]
+        inc_flow    = inc_flow[inc_kept]
+
+        rates, frozen = maxmin_fill(inc_flow, inc_link, lt.view('cap'), src_rate)
+
+        for i, asgn_bw in enumerate(rates.tolist()):
+            if (frozen[i]):
+                self.assign_flow_bw(flowobjs[i], ev_time, asgn_bw)
+
+        self.find_next_end_flow()
+
+
+    def calc_flow_rates_devoflow(self, ev_time):
         """Calculate flow rates (according to DevoFlow Algorithm 1), but is aware of
         each flow's source rate constraints.
 
@@ -88,110 +773,211 @@ class SimCoreCalculation:
             flow and its estimated end time.
 
         Extra Notes:
-            - If cfg.SRC_LIMITED == 0, the source rate (recorded in self.sorted_flows) for
-              each flow becomes float('inf'), so no need to worry about the source rate.
+            - If cfg.SRC_LIMITED == 0, no flow is limited by its source rate, so every round
+              is Case 2 and self.sorted_flows is not walked at all.
+            - When the bottleneck link is drained, the next one is taken from btnk_heap, a
+              min-heap of (bw_per_flow, link ID). A link's entry is pushed again
+              whenever its bw_per_flow changes, and outdated entries are dropped when they
+              reach the top. Ties are broken by order in self.links, as a scan would.
+            - Links marked never_btnk (see SimCore.mark_never_btnk_links) are left out.
 
         """
-        btnk_link = ('', '')        # Bottleneck link: defined by:
+        btnk_link = -1              # ID of bottleneck link: defined by:
                                     #     argmin_{all links}
                                     #     {linkobj.unasgn_bw / linkobj.n_unasgn_flows}
         btnk_bw = float('inf')      # As shown above, bottleneck BW defined by -
                                     #     linkobj.unasgn_bw / linkobj.n_unasgn_flows
+        btnk_heap = []              # Heap of (bw_per_flow, link ID)
         n_unprocessed_links = 0
         n_unasgn_flows      = len(self.sorted_flows)
-        self.next_end_time  = float('inf')
-        self.next_end_flow  = ('', '')
 
-        for fl_tuple in self.sorted_flows:
-            fl_tuple[1].assigned    = False     # Reset "assigned" flag for every active flow
+        # Reset "assigned" flag for every active flow. Flow and link attributes in the hot
+        # loops below are read from self.flow_table and self.link_table columns directly.
+        self.flow_table.view('assigned')[:] = 0
+        assigned    = self.flow_table.assigned
+        flow_paths  = self.flow_table.path
+        lt              = self.link_table
+        unasgn_bw       = lt.unasgn_bw
+        link_n_unasgn   = lt.n_unasgn_flows
+        bw_per_flow     = lt.bw_per_flow
+        never_btnk      = lt.never_btnk
 
         # Initialize link variables and find first-round bottleneck link
-        for lk in self.links:
-            linkobj                 = self.linkobjs[lk]
-            linkobj.unasgn_bw       = linkobj.cap
-            linkobj.n_active_flows  = linkobj.get_n_active_flows()
-            linkobj.n_unasgn_flows  = linkobj.n_active_flows
-            linkobj.processed       = False
-            if (linkobj.n_unasgn_flows > 0):
-                linkobj.bw_per_flow     = linkobj.unasgn_bw / float(linkobj.n_unasgn_flows)
-                if (linkobj.bw_per_flow < btnk_bw):
-                    btnk_link   = lk
-                    btnk_bw     = linkobj.bw_per_flow
+        lt.view('unasgn_bw')[:]         = lt.view('cap')
+        lt.view('n_unasgn_flows')[:]    = lt.view('n_active_flows')
+        lt.view('asgn_rate')[lt.view('n_active_flows') == 0] = 0.0  # Drop floating point residue
+        for i in xrange(len(self.links)):
+            if (never_btnk[i]):
+                continue
+            if (link_n_unasgn[i] > 0):
+                bw_per_flow[i]      = unasgn_bw[i] / float(link_n_unasgn[i])
+                btnk_heap.append((bw_per_flow[i], i))
+                if (bw_per_flow[i] < btnk_bw):
+                    btnk_link   = i
+                    btnk_bw     = bw_per_flow[i]
                 n_unprocessed_links += 1
             else:
                 pass
+        heapify(btnk_heap)
 
         # Start assigning curr_rate to flows
-        for mice_tuple in self.sorted_flows:
-            mice_bw, mice_flowobj, mice_flowkey = mice_tuple
-
-            if (mice_flowobj.assigned == True):
-                continue
+        mice_iter = iter(self.sorted_flows)
+        mice_flowobj = None
+        while (n_unprocessed_links > 0):
+            if (cfg.SRC_LIMITED > 0):
+                # Next unassigned flow in ascending order of source rate
+                while (mice_flowobj is None or assigned[mice_flowobj.fid]):
+                    mice_tuple = next(mice_iter, None)
+                    if (mice_tuple is None):
+                        break
+                    mice_bw, mice_id, mice_flowobj, mice_flowkey = mice_tuple
+                if (mice_tuple is None):
+                    break
+            else:
+                mice_bw = float('inf')      # Source rates are unlimited: always Case 2
 
             recalc_btnk = False     # Flag for recalculation of global bottlneck
 
             # Case 1: BW assigned to flow(s) limited by the mice flow's own flow_rate
             if (mice_bw < btnk_bw):
-                mice_flowobj.assign_bw(ev_time, mice_bw)
-
-                for lk in mice_flowobj.links:
-                    linkobj                 =   self.linkobjs[lk]
-                    linkobj.unasgn_bw       -=  mice_bw
-                    linkobj.n_unasgn_flows  -=  1
-
-                    if (linkobj.n_unasgn_flows > 0):
-                        linkobj.bw_per_flow     =   linkobj.unasgn_bw /             \
-                                                    float(linkobj.n_unasgn_flows)
-                        if (linkobj.bw_per_flow < btnk_bw):
-                            btnk_link   = lk
-                            btnk_bw     = linkobj.bw_per_flow
+                self.assign_flow_bw(mice_flowobj, ev_time, mice_bw)
+
+                for i in flow_paths[mice_flowobj.fid].link_ids:
+                    if (never_btnk[i]):
+                        continue
+                    unasgn_bw[i]        -=  mice_bw
+                    link_n_unasgn[i]    -=  1
+
+                    if (link_n_unasgn[i] > 0):
+                        bw_per_flow[i]  =   unasgn_bw[i] / float(link_n_unasgn[i])
+                        heappush(btnk_heap, (bw_per_flow[i], i))
+                        if (bw_per_flow[i] < btnk_bw):
+                            btnk_link   = i
+                            btnk_bw     = bw_per_flow[i]
                     else:
                         n_unprocessed_links -= 1
-                        if (lk == btnk_link):
+                        if (i == btnk_link):
                             recalc_btnk = True
 
                 n_unasgn_flows -= 1
 
             # Case 2: BW assigned to flows(s) limited by max-min fair on btnk_link
             else:
-                for fl in self.linkobjs[btnk_link].flows:
-                    flowobj = self.flows[fl]
-
-                    if (not flowobj.status == 'active'):    continue
-
-                    elif (flowobj.assigned == True):        continue
+                n_asgn = 0
+                for flowobj in lt.active_flows[btnk_link].itervalues():
+                    if (assigned[flowobj.fid]):             continue
 
                     else:
-                        flowobj.assign_bw(ev_time, btnk_bw)
-
-                        for lk in flowobj.links:
-                            #self.link_byte_cnt[lk]  +=  bytes_sent_since_update
-                            linkobj                 =   self.linkobjs[lk]
-                            linkobj.unasgn_bw       -=  btnk_bw
-                            linkobj.n_unasgn_flows  -=  1
-
-                            if (linkobj.n_unasgn_flows > 0):
-                                linkobj.bw_per_flow =   linkobj.unasgn_bw /             \
-                                                        float(linkobj.n_unasgn_flows)
-                                if (linkobj.bw_per_flow < btnk_bw):
-                                    btnk_link   = lk
-                                    btnk_bw     = linkobj.bw_per_flow
+                        self.assign_flow_bw(flowobj, ev_time, btnk_bw)
+                        n_asgn += 1
+
+                        for i in flow_paths[flowobj.fid].link_ids:
+                            if (never_btnk[i]):
+                                continue
+                            unasgn_bw[i]        -=  btnk_bw
+                            link_n_unasgn[i]    -=  1
+
+                            if (link_n_unasgn[i] > 0):
+                                bw_per_flow[i]  =   unasgn_bw[i] / float(link_n_unasgn[i])
+                                heappush(btnk_heap, (bw_per_flow[i], i))
+                                if (bw_per_flow[i] < btnk_bw):
+                                    btnk_link   = i
+                                    btnk_bw     = bw_per_flow[i]
                             else:
-                                if (lk == btnk_link):
+                                if (i == btnk_link):
                                     recalc_btnk = True
                                 n_unprocessed_links -=  1
 
                     n_unasgn_flows -= 1
 
+                # All flows on btnk_link are assigned, but its counter says otherwise.
+                # Drop the link, so that every round makes progress.
+                if (n_asgn == 0):
+                    link_n_unasgn[btnk_link] = 0
+                    n_unprocessed_links -= 1
+                    recalc_btnk = True
+
             if (n_unprocessed_links > 0 and recalc_btnk == True):
-                btnk_link   = min([lk for lk in self.links \
-                                  if self.linkobjs[lk].n_unasgn_flows > 0], \
-                                  key=lambda x: self.linkobjs[x].bw_per_flow)
-                btnk_bw     = self.linkobjs[btnk_link].bw_per_flow
+                # Drop outdated heap entries: link drained, or its bw_per_flow has changed
+                while (btnk_heap):
+                    btnk_bw, btnk_link = btnk_heap[0]
+                    if (link_n_unasgn[btnk_link] > 0 and bw_per_flow[btnk_link] == btnk_bw):
+                        break
+                    heappop(btnk_heap)
+                else:
+                    break       # No link left with unassigned flows
 
         # Finally, get the estimated earliest-ending flow
-        for tpl in self.sorted_flows:
-            est = tpl[1].est_end_time
-            if (est < self.next_end_time):
-                self.next_end_time = est
-                self.next_end_flow = tpl[2]
\ No newline at end of file
+        self.find_next_end_flow()
+
+
+def maxmin_fill(inc_flow, inc_link, link_caps, src_rate, weight=None):
+    """Max-min fair rates by vectorized water-filling over a sparse flow x link matrix.
+    Used by SimCore.calc_flow_rates_numpy and by the fluid engine (see SimCoreFluid).
+
+    Args:
+        inc_flow (numpy array of int): Flow row of each nonzero entry of the matrix
+        inc_link (numpy array of int): Link column of each nonzero entry of the matrix
+        link_caps (numpy array of float64): Capacity of each link column
+        src_rate (numpy array of float64): Source rate of each flow row (inf if unlimited)
+        weight (numpy array of float64): Number of flows each row stands for (e.g. flows
+                                         sharing a path). None means one flow per row.
+
+    Returns:
+        numpy array of float64: Rate of (each flow of) each row
+        numpy array of bool: Whether each row got a rate. Rows on no link do not.
+
+    Extra Notes:
+        Each round computes every link's fair share (residual cap / # of unfrozen flows)
+        and the smallest one, min_share. Then either
+        - all unfrozen rows whose source rates are below min_share are frozen at their
+          source rates (they would reach them before any link saturates), or
+        - all unfrozen rows on links whose share equals min_share are frozen at
+          min_share (those links saturate).
+        Frozen rows' rates (times their weights) are subtracted from the residual caps of
+        their links.
+
+    """
+    n_links     = len(link_caps)
+    n_flows     = len(src_rate)
+    inc_weight  = weight[inc_flow] if (weight is not None) else None
+
+    residual    = link_caps.copy()
+    n_unfrozen  = np.bincount(inc_link, weights=inc_weight, minlength=n_links)
+    rates       = np.zeros(n_flows)
+    frozen      = np.zeros(n_flows, dtype=bool)
+
+    share = np.full(n_links, np.inf)
+    while (True):
+        loaded      = n_unfrozen > 0
+        if (not loaded.any()):
+            break
+        share.fill(np.inf)
+        share[loaded] = residual[loaded] / n_unfrozen[loaded]
+        min_share   = share.min()
+
+        # Case 1: Flows limited by their own source rates
+        new_frozen  = ~frozen & (src_rate < min_share)
+        if (new_frozen.any()):
+            rates[new_frozen]   = src_rate[new_frozen]
+        # Case 2: Flows limited by max-min fair share on saturated links
+        else:
+            new_frozen          = np.zeros(n_flows, dtype=bool)
+            new_frozen[inc_flow[share[inc_link] == min_share]] = True
+            new_frozen          &= ~frozen
+            rates[new_frozen]   = min_share
+
+        frozen      |= new_frozen
+        new_inc     = new_frozen[inc_flow]
+        if (inc_weight is None):
+            residual    -= np.bincount(inc_link[new_inc], weights=rates[inc_flow[new_inc]], \
+                                       minlength=n_links)
+            n_unfrozen  -= np.bincount(inc_link[new_inc], minlength=n_links)
+        else:
+            residual    -= np.bincount(inc_link[new_inc], \
+                                       weights=rates[inc_flow[new_inc]] * inc_weight[new_inc], \
+                                       minlength=n_links)
+            n_unfrozen  -= np.bincount(inc_link[new_inc], weights=inc_weight[new_inc], \
+                                       minlength=n_links)
+
+    return rates, frozen
@@ -0,0 +1,220 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""sim/SimCoreCheckpoint.py: Class SimCoreCheckpoint, containing checkpoint/resume and
+branching codes for SimCore. Inherited by SimCore.
+"""
+__author__      = 'Kuan-yin Chen'
+__copyright__   = 'Copyright 2014, NYU-Poly'
+
+# Built-in modules
+import os
+import sys
+import gzip
+import cPickle as pickle
+import random
+# Third-party modules
+import numpy.random as nprd
+# User-defined modules
+import SimConfig as cfg
+from SimEvent import *
+
+
+class SimCoreCheckpoint:
+    """Checkpoint- and branching-related codes for SimCore class.
+
+    Extra Notes:
+        1. A checkpoint file is a gzip-compressed pickle of a 3-tuple:
+           (SimCore instance, state of random module, state of numpy.random).
+           The SimCore instance carries everything reachable from it: flows, links,
+           switch tables, ev_queue, controller records and accumulated log records.
+        2. Checkpoints are only taken between time instants (no pending flow rate
+           recalculation), so a resumed run continues from a consistent state. Note that
+           pickle does not preserve the iteration order of dicts (e.g. SimCore.flows), so
+           ties (e.g. among elephant flows of equal size) may be broken differently than
+           in the original run.
+        3. The event handler table holds bound methods, which cannot be pickled. It is
+           dropped on save and rebuilt with the default handlers on load.
+        4. Branching forks the running simulator at cfg.BRANCH_TIME into one child process
+           per entry of cfg.BRANCHES. Children share the warm state (incl. the path
+           database) with the parent through copy-on-write pages. Each child overrides
+           some config knobs and continues to cfg.SIM_TIME, logging to its own folder.
+           The parent continues with the unmodified config. All branches inherit the same
+           random number generator states, hence see the same flow arrivals.
+
+    """
+    def __init__(self):
+        """Constructor of SimCoreCheckpoint class.
+
+        Args:
+            None
+
+        """
+        self.next_ckpt_time     = float('inf')  # Simulation time of next checkpoint
+        self.next_branch_time   = float('inf')  # Simulation time of forking branches
+        self.branch_pids        = []            # PIDs of forked child branches
+        self.branch_knobs       = []            # (knob, value) pairs overridden in this
+                                                # branch, incl. EXP_NAME and LOG_DIR
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['ev_handlers']
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.setup_ev_handlers()
+
+
+    def set_next_ckpt_time(self):
+        """Set next checkpoint time to the next multiple of cfg.CHECKPOINT_PERIOD
+        after current simulation time. Checkpointing is disabled if the period is <= 0.
+        """
+        if (cfg.CHECKPOINT_PERIOD > 0):
+            n_periods = int(self.timer / cfg.CHECKPOINT_PERIOD) + 1
+            self.next_ckpt_time = n_periods * cfg.CHECKPOINT_PERIOD
+        else:
+            self.next_ckpt_time = float('inf')
+
+
+    def save_checkpoint(self, fn):
+        """Dump the whole simulator state to a checkpoint file.
+
+        Args:
+            fn (str): Path of checkpoint file
+
+        """
+        tmp_fn  = fn + '.tmp'       # Write to a temp file first, so that a job killed
+        outfile = gzip.open(tmp_fn, 'wb')     # while writing leaves the last good file.
+        pickle.dump((self, random.getstate(), nprd.get_state()), outfile, \
+                    pickle.HIGHEST_PROTOCOL)
+        outfile.close()
+        os.rename(tmp_fn, fn)
+
+
+    def do_checkpoint(self):
+        """Save a checkpoint to cfg.CHECKPOINT_FILE and set next checkpoint time.
+        Called by SimCore.main_course between time instants.
+        """
+        if (cfg.SHOW_PROGRESS > 0):
+            print
+        print "Checkpoint at sim time %.6f: %s" %(self.timer, cfg.CHECKPOINT_FILE)
+        self.save_checkpoint(cfg.CHECKPOINT_FILE)
+        self.set_next_ckpt_time()
+
+
+    def set_next_branch_time(self):
+        """Set time of forking branches to cfg.BRANCH_TIME, if branching is enabled and
+        that time has not passed yet.
+        """
+        if (cfg.BRANCH_TIME > 0 and len(cfg.BRANCHES) > 0 and self.timer < cfg.BRANCH_TIME):
+            self.next_branch_time = cfg.BRANCH_TIME
+        else:
+            self.next_branch_time = float('inf')
+
+
+    def do_branch(self):
+        """Fork one child process for each (name, knobs) entry of cfg.BRANCHES.
+        Called by SimCore.main_course between time instants.
+        The child applies its knobs and returns to the main loop as a branch.
+        The parent returns to the main loop with the unmodified config.
+        """
+        self.next_branch_time = float('inf')
+        if (cfg.SHOW_PROGRESS > 0):
+            print
+        print "Forking %d branches at sim time %.6f" %(len(cfg.BRANCHES), self.timer)
+        sys.stdout.flush()      # Do not let children inherit (and repeat) buffered output
+
+        for name, knobs in cfg.BRANCHES:
+            pid = os.fork()
+            if (pid == 0):
+                self.branch_pids = []
+                self.enter_branch(name, knobs)
+                return
+            self.branch_pids.append(pid)
+
+        if (cfg.BRANCH_RESET_LOGS > 0):
+            self.reset_log_records()
+
+
+    def enter_branch(self, name, knobs):
+        """Turn a forked child into a branch: override config knobs and set up logging.
+
+        Args:
+            name (str): Name of branch. Logs go to subfolder name under cfg.LOG_DIR.
+            knobs (dict): Config overrides. Key: knob name, Value: new value.
+
+        Extra Notes:
+            Knobs read at the time of use (ROUTING_MODE, REROUTE_ALGO, N_ELEPH_FLOWS, etc.)
+            take effect right away. Switching DO_REROUTE on or off registers or removes the
+            periodic EvCollectCnt and EvReroute timers.
+
+        """
+        was_rerouting = (cfg.DO_REROUTE > 0)
+        for knob in knobs:
+            setattr(cfg, knob, knobs[knob])
+
+        cfg.EXP_NAME        = '%s_%s' %(cfg.EXP_NAME, name)
+        cfg.LOG_DIR         = os.path.join(cfg.LOG_DIR, name)
+        cfg.CHECKPOINT_FILE = os.path.join(cfg.LOG_DIR, os.path.basename(cfg.CHECKPOINT_FILE))
+        self.branch_knobs   = [(knob, knobs[knob]) for knob in sorted(knobs)] + \
+                              [(knob, getattr(cfg, knob)) for knob in \
+                               ['EXP_NAME', 'LOG_DIR', 'CHECKPOINT_FILE']]
+        self.set_log_paths()
+        if (cfg.BRANCH_RESET_LOGS > 0):
+            self.reset_log_records()
+        print "Branch %s: %s, logging to folder: %s" %(name, knobs, cfg.LOG_DIR)
+
+        if (cfg.ROUTING_MODE == 'ecmp' and not hasattr(self.ctrl, 'ecmp_db')):
+            self.ctrl.build_ecmp_db()
+
+        if (cfg.DO_REROUTE > 0 and not was_rerouting):
+            ev_time = (int(self.timer / cfg.PERIOD_COLLECT) + 1) * cfg.PERIOD_COLLECT
+            self.schedule_periodic(ev_time, cfg.PERIOD_COLLECT, EvCollectCnt(ev_time))
+            ev_time = (int(self.timer / cfg.PERIOD_REROUTE) + 1) * cfg.PERIOD_REROUTE
+            self.schedule_periodic(ev_time, cfg.PERIOD_REROUTE, EvReroute(ev_time))
+        elif (cfg.DO_REROUTE == 0 and was_rerouting):
+            self.timers.cancel_type(EV_COLLECT_CNT)
+            self.timers.cancel_type(EV_REROUTE)
+
+
+    def wait_branches(self):
+        """Wait for all child branches forked by this process to finish.
+        """
+        for pid in self.branch_pids:
+            os.waitpid(pid, 0)
+        self.branch_pids = []
+
+
+def load_checkpoint(fn):
+    """Restore a SimCore instance and random number generator states from a checkpoint file.
+
+    Args:
+        fn (str): Path of checkpoint file
+
+    Returns:
+        SimCore: Simulation core, ready to continue with main_course().
+
+    Extra Notes:
+        - Config is not part of the checkpoint. The remaining run follows the currently
+          loaded config, and logs are written to the current cfg.LOG_DIR.
+        - If cfg.RESUME_RESET_LOGS > 0, log records accumulated before the checkpoint are
+          discarded, so the checkpoint serves as a warm start for a new experiment.
+        - Knobs overridden by a branch are not carried over either (see branch_knobs).
+
+    """
+    infile = gzip.open(fn, 'rb')
+    sim_core, random_state, nprd_state = pickle.load(infile)
+    infile.close()
+
+    random.setstate(random_state)
+    nprd.set_state(nprd_state)
+
+    sim_core.sim_time = cfg.SIM_TIME
+    sim_core.branch_knobs = []
+    sim_core.set_log_paths()
+    if (cfg.RESUME_RESET_LOGS > 0):
+        sim_core.reset_log_records()
+
+    return sim_core
@@ -7,17 +7,144 @@ __author__      = 'Kuan-yin Chen'
 __copyright__   = 'Copyright 2014, NYU-Poly'
 
 # Built-in modules
-from heapq import heappush, heappop
 # Third-party modules
 # User-defined modules
 import SimConfig as cfg
 from SimFlow import *
 from SimEvent import *
+from SimHostAddr import *
 
 
 class SimCoreEventHandling:
     """Event handling-related codes for SimCore class.
     """
+    def __init__(self):
+        """Constructor of SimCoreEventHandling class.
+        Sets up the event sequence counter and registers the handler of each event type.
+
+        Args:
+            None
+
+        Extra Notes:
+            ev_handlers is indexed by integer event type codes (see SimEvent.py).
+            Event types without a registered handler are silently dropped.
+
+        """
+        self.ev_seq         = 0     # Monotonic sequence number, breaks ev_time ties in ev_queue
+        self.setup_ev_handlers()
+
+
+    def setup_ev_handlers(self):
+        """Build the event handler table and register the default handler of each event type.
+        """
+        self.ev_handlers    = [self.handle_EvUnhandled] * N_EV_TYPES
+
+        self.register_ev_handler(EV_FLOW_ARRIVAL,   self.handle_EvFlowArrival)
+        self.register_ev_handler(EV_PACKET_IN,      self.handle_EvPacketIn)
+        self.register_ev_handler(EV_FLOW_INSTALL,   self.handle_EvFlowInstall)
+        self.register_ev_handler(EV_FLOW_END,       self.handle_EvFlowEnd)
+        self.register_ev_handler(EV_IDLE_TIMEOUT,   self.handle_EvIdleTimeout)
+        self.register_ev_handler(EV_COLLECT_CNT,    self.handle_EvCollectCnt)
+        self.register_ev_handler(EV_REROUTE,        self.handle_EvReroute)
+        self.register_ev_handler(EV_LOG_LINK_UTIL,  self.handle_EvLogLinkUtil)
+        self.register_ev_handler(EV_LOG_TABLE_UTIL, self.handle_EvLogTableUtil)
+
+
+    def register_ev_handler(self, ev_type, handler):
+        """Register the handler of an event type.
+
+        Args:
+            ev_type (int): Event type code
+            handler (callable): Called as handler(ev_time, event)
+
+        """
+        self.ev_handlers[ev_type] = handler
+
+
+    def schedule_event(self, ev_time, event):
+        """Push an event into self.ev_queue, whichever backend it is.
+
+        Args:
+            ev_time (float64): Event time
+            event (Instance inherited from SimEvent): Event to be scheduled
+
+        Returns:
+            4-list: Handle of the scheduled event, which can be passed to cancel_event().
+
+        Extra Notes:
+            Each queue entry is a 4-list [ev_time, ev_seq, ev_type, event]. ev_seq keeps
+            events of equal ev_time in FIFO order, so event objects are never compared.
+
+        """
+        self.ev_seq += 1
+        return self.ev_queue.push([ev_time, self.ev_seq, event.ev_type, event])
+
+
+    def cancel_event(self, handle):
+        """Cancel a scheduled event. No-op if the event is already handled or cancelled.
+
+        Args:
+            handle (4-list): Handle returned by schedule_event(), or None.
+
+        """
+        if (handle is not None):
+            self.ev_queue.cancel(handle)
+
+
+    def reschedule_event(self, handle, ev_time):
+        """Move a scheduled event to a new event time.
+
+        Args:
+            handle (4-list): Handle returned by schedule_event()
+            ev_time (float64): New event time
+
+        Returns:
+            4-list: Handle of the rescheduled event, or None if the event was already
+                    handled or cancelled.
+
+        """
+        event = handle[3]
+        if (event is None):
+            return None
+        self.ev_queue.cancel(handle)
+        event.ev_time = ev_time
+        return self.schedule_event(ev_time, event)
+
+
+    def schedule_periodic(self, ev_time, period, event):
+        """Register a recurring event in self.timers. It first fires at ev_time, and then
+        every period seconds. Its handler must not reschedule it.
+
+        Args:
+            ev_time (float64): Time of first firing
+            period (float64): Period of firing
+            event (Instance inherited from SimEvent): Event to be handled on each firing.
+                                                      Reused across firings.
+
+        Returns:
+            5-list: Handle of the periodic timer, which can be passed to self.timers.cancel().
+
+        """
+        self.ev_seq += 1
+        return self.timers.add([ev_time, self.ev_seq, event.ev_type, event, period])
+
+
+    def rearm_periodic(self, timer):
+        """Advance a periodic timer by one period. Called by main_course when it fires.
+
+        Args:
+            timer (5-list): Handle returned by schedule_periodic()
+
+        """
+        self.ev_seq += 1
+        self.timers.rearm(timer, self.ev_seq)
+
+
+    def handle_EvUnhandled(self, ev_time, event):
+        """Default handler for event types without a registered handler. Does nothing.
+        """
+        pass
+
 
     def handle_EvFlowArrival(self, ev_time, event):
         """Handle an EvFlowArrival event.
@@ -31,42 +158,51 @@ class SimCoreEventHandling:
         Return:
             None. Will schedule events to self.ev_queue if necessary.
 
+        Extra Notes:
+            If the arriving (src_ip, dst_ip) pair is still taken by another flow, the
+            arrival is replaced by one with re-picked hosts (see SimFlowGen.repick_flow_arr),
+            so that flow keys in self.flows stay unique.
+
         """
         # First update all flow's states
         #self.update_all_flows(ev_time)
 
+        if (((event.src_ip << 32) | event.dst_ip) in self.flows):
+            new_EvFlowArrival = self.flowgen.repick_flow_arr(ev_time, event, self)
+            self.schedule_event(ev_time, new_EvFlowArrival)
+            return
+
         self.n_EvFlowArrival += 1      # Increment the counter
 
         # Create SimFlow instance
-        flow_obj    = SimFlow(  src_ip=event.src_ip, dst_ip=event.dst_ip, \
-                                src_node=self.hosts[event.src_ip], \
-                                dst_node=self.hosts[event.dst_ip], \
+        src_node    = self.hosts[event.src_ip]
+        dst_node    = self.hosts[event.dst_ip]
+        flow_obj    = SimFlow(  self.flow_table, src_ip=event.src_ip, dst_ip=event.dst_ip, \
+                                src_node=src_node, dst_node=dst_node, \
                                 flow_size=event.flow_size, flow_rate=event.flow_rate, \
                                 bytes_left=event.flow_size, \
                                 arrive_time=ev_time, update_time=ev_time, \
-                                status='requesting', resend=0)
+                                status=FLOW_REQUESTING, resend=0)
 
         # Add to self.flows
-        self.flows[(event.src_ip, event.dst_ip)] = flow_obj
+        self.flows[(event.src_ip << 32) | event.dst_ip] = flow_obj
 
         # Schedule an EvPacketIn event
         new_ev_time = ev_time + cfg.SW_CTRL_DELAY
-        new_EvPacketIn      = EvPacketIn(   ev_time=new_ev_time, \
-                                            src_ip=event.src_ip, dst_ip=event.dst_ip, \
-                                            src_node=self.hosts[event.src_ip], \
-                                            dst_node=self.hosts[event.dst_ip]       )
-        heappush(self.ev_queue, (new_ev_time, new_EvPacketIn))
+        new_EvPacketIn      = EvPacketIn(   new_ev_time, event.src_ip, event.dst_ip, \
+                                            src_node, dst_node  )
+        self.flow_table.ev_handle[flow_obj.fid] = self.schedule_event(new_ev_time, new_EvPacketIn)
 
         # If arrival model is "const" or "exp", generate a new flow
         # and schedule an EvFlowArrival.
         if cfg.FLOWGEN_ARR_MODEL == 'const':
             new_ev_time, new_EvFlowArrival = self.flowgen.gen_new_flow_arr_const(    \
                                              ev_time, self)
-            heappush(self.ev_queue, (new_ev_time, new_EvFlowArrival))
+            self.schedule_event(new_ev_time, new_EvFlowArrival)
         elif cfg.FLOWGEN_ARR_MODEL == 'exp':
             new_ev_time, new_EvFlowArrival = self.flowgen.gen_new_flow_arr_exp(    \
                                              ev_time, self)
-            heappush(self.ev_queue, (new_ev_time, new_EvFlowArrival))
+            self.schedule_event(new_ev_time, new_EvFlowArrival)
 
 
     def handle_EvPacketIn(self, ev_time, event):
@@ -94,39 +230,38 @@ class SimCoreEventHandling:
         path = self.ctrl.find_path(event.src_ip, event.dst_ip)
 
         # Case 1: No feasible path. Reject the flow and resend EvPacketIn
-        fl = (event.src_ip, event.dst_ip)
+        fl = (event.src_ip << 32) | event.dst_ip
         if (path == []):
 
             if (cfg.SHOW_REJECTS > 0):
-                print 'Flow (%s, %s) is rejected. No available path.' \
-                      %(event.src_ip, event.dst_ip)
+                print 'Flow %s is rejected. No available path.' %(flow_str(fl))
                 print
 
             # Re-send this EvPacketIn after REJECT_TIMEOUT (don't forget SW_CTRL_DELAY!)
             if (self.flows[fl].resend < cfg.MAX_RETRY
                 or cfg.FLOWGEN_ARR_MODEL == 'saturate'):
                 new_ev_time = ev_time + cfg.REJECT_TIMEOUT + cfg.SW_CTRL_DELAY
-                new_event   = EvPacketIn(   ev_time=new_ev_time, \
-                                            src_ip=event.src_ip, dst_ip=event.dst_ip,
-                                            src_node=event.src_node, dst_node=event.dst_node)
-                heappush(self.ev_queue, (new_ev_time, new_event))
+                new_event   = EvPacketIn(   new_ev_time, event.src_ip, event.dst_ip, \
+                                            event.src_node, event.dst_node)
+                self.flows[fl].ev_handle = self.schedule_event(new_ev_time, new_event)
 
                 # Increment resend counters
                 self.flows[fl].resend += 1
                 self.n_Reject += 1
 
             # Else simply ignore the packet_in, delete flow
+            # (along with any event still pending for it)
             else:
-                del self.flows[fl]
+                self.cancel_event(self.flows[fl].ev_handle)
+                self.flows.pop(fl).free()
 
         else:
             # Schedule a EvFlowInstall event
             new_ev_time = ev_time + cfg.CTRL_SW_DELAY
-            new_event   = EvFlowInstall(ev_time=new_ev_time, \
-                                        src_ip=event.src_ip, dst_ip=event.dst_ip, \
-                                        src_node=event.src_node, dst_node=event.dst_node, \
-                                        path=path)
-            heappush(self.ev_queue, (new_ev_time, new_event))
+            new_event   = EvFlowInstall(new_ev_time, event.src_ip, event.dst_ip, \
+                                        event.src_node, event.dst_node, path)
+            fid         = self.flows[fl].fid
+            self.flow_table.ev_handle[fid] = self.schedule_event(new_ev_time, new_event)
 
 
     def handle_EvFlowInstall(self, ev_time, event):
@@ -146,57 +281,59 @@ class SimCoreEventHandling:
             None. Will schedule events to self.ev_queue if necessary.
 
         """
-        # First update all flow's states
-        self.update_all_flows(ev_time)
-
         is_feasible = self.ctrl.is_feasible(event.path)
 
         if (is_feasible == True):
             # Register entries at SimSwitch & SimLink instances
+            fl                          = (event.src_ip << 32) | event.dst_ip
             list_links                  = self.get_links_on_path(event.path)
-            self.install_entries_to_path(event.path, list_links, event.src_ip, event.dst_ip)
+            self.install_entries_to_path(event.path, list_links, fl)
 
             # Update the installed flow's states to 'active'
-            fl = (event.src_ip, event.dst_ip)
             flowobj             = self.flows[fl]
             flowobj.install_flow(ev_time, event.path, list_links)
 
             # Decrement/increment active flow counters at sim core and links
             for lk in list_links:
-                self.linkobjs[lk].n_active_flows += 1
+                self.linkobjs[lk].activate_flow(fl, flowobj)
             self.n_active_flows += 1
 
             # Register flow entries at controller
-            self.ctrl.install_flow_entry(event.src_ip, event.dst_ip)
+            self.ctrl.install_flow_entry(fl)
 
             # Add flow to sorted_flows list at simulation core
-            self.sorted_flows_insert(flowobj.flow_rate, flowobj, fl)
+            self.sorted_flows_insert(self.flow_table.flow_rate[flowobj.fid], flowobj, fl)
+            self.path_class_join(fl, flowobj)
+            self.changed_links.update(list_links)
+            self.provisional_flows.append(flowobj)
 
-            # Recalculate flow rates
-            self.calc_flow_rates(ev_time)
+            # Flow rates are recalculated once all events at ev_time are handled
+            self.rates_dirty = True
+            self.n_rate_changes += 1
 
         else:
-            fl = (event.src_ip, event.dst_ip)
+            fl = (event.src_ip << 32) | event.dst_ip
 
             if (cfg.SHOW_REJECTS > 0):
-                print 'Flow %s is rejected. Overflow detected during installation' %(fl)
+                print 'Flow %s is rejected. Overflow detected during installation' \
+                      %(flow_str(fl))
 
             # Re-schedule a new EvPacketIn event after REJECT_TIMEOUT
             if (self.flows[fl].resend < cfg.MAX_RETRY
                 or cfg.FLOWGEN_ARR_MODEL == 'saturate'):
                 new_ev_time = ev_time + cfg.REJECT_TIMEOUT + cfg.SW_CTRL_DELAY
-                new_event   = EvPacketIn( ev_time=new_ev_time, \
-                                          src_ip=event.src_ip, dst_ip=event.dst_ip, \
-                                          src_node=event.src_node, dst_node=event.dst_node)
-                heappush(self.ev_queue, (new_ev_time, new_event))
+                new_event   = EvPacketIn( new_ev_time, event.src_ip, event.dst_ip, \
+                                          event.src_node, event.dst_node)
+                self.flows[fl].ev_handle = self.schedule_event(new_ev_time, new_event)
 
                 # Increment resend counters
                 self.flows[fl].resend   += 1
                 self.n_Reject           += 1
 
-            # else simply ignore
+            # else simply ignore (and drop any event still pending for the flow)
             else:
-                del self.flows[fl]
+                self.cancel_event(self.flows[fl].ev_handle)
+                self.flows.pop(fl).free()
 
 
     def handle_EvFlowEnd(self, ev_time, event):
@@ -215,37 +352,40 @@ class SimCoreEventHandling:
             None. Will schedule events to self.ev_queue if necessary.
 
         """
-        # First update all flow's states
-        self.update_all_flows(ev_time)
-
         # Update the ending flow's states to 'finished'
-        fl      = (event.src_ip, event.dst_ip)
+        fl      = (event.src_ip << 32) | event.dst_ip
         flowobj = self.flows[fl]
+        ft, fid = self.flow_table, flowobj.fid
+        self.update_link_byte_cnt(ev_time)
+        flowobj.update_flow(ev_time)
+        self.add_flow_rate(flowobj, -ft.curr_rate[fid])
         flowobj.terminate_flow(ev_time)
 
         # Decrement/increment active flow counters at sim core and links
-        for lk in flowobj.links:
-            self.linkobjs[lk].n_active_flows -= 1
+        for lk in ft.links[fid]:
+            self.linkobjs[lk].deactivate_flow(fl)
         self.n_active_flows     -= 1
         self.n_EvFlowEnd        += 1
 
         # Remove flow from sorted_flows list
         self.sorted_flows_remove(fl)
+        self.path_class_leave(fl, flowobj)
+        self.changed_links.update(ft.links[fid])
 
-        # Re-calculate the flow rates
-        self.calc_flow_rates(ev_time)
+        # Flow rates are recalculated once all events at ev_time are handled
+        self.rates_dirty = True
+        self.n_rate_changes += 1
 
         # Schedule an EvIdleTimeout event
         new_ev_time         = ev_time + cfg.IDLE_TIMEOUT
-        new_EvIdleTimeout   = EvIdleTimeout(ev_time=new_ev_time, \
-                                            src_ip=event.src_ip, dst_ip=event.dst_ip )
-        heappush(self.ev_queue, (new_ev_time, new_EvIdleTimeout))
+        new_EvIdleTimeout   = EvIdleTimeout(new_ev_time, event.src_ip, event.dst_ip)
+        ft.ev_handle[fid]   = self.schedule_event(new_ev_time, new_EvIdleTimeout)
 
         # If arrival model is "saturate", generate a new flow and schedule an EvFlowArrival.
         if cfg.FLOWGEN_ARR_MODEL == 'saturate':
             new_ev_time, new_EvFlowArrival = self.flowgen.gen_new_flow_arr_saturate(    \
                                              ev_time, event.src_ip, self)
-            heappush(self.ev_queue, (new_ev_time, new_EvFlowArrival))
+            self.schedule_event(new_ev_time, new_EvFlowArrival)
 
         # Increment flowend counter
         self.n_ended_flows += 1
@@ -269,28 +409,30 @@ class SimCoreEventHandling:
         #self.update_all_flows(ev_time)
 
         # Update the timeout flow's states
-        fl      = (event.src_ip, event.dst_ip)
+        fl      = (event.src_ip << 32) | event.dst_ip
         flowobj = self.flows[fl]
+        ft, fid = self.flow_table, flowobj.fid
         flowobj.timeout_flow(ev_time)
 
         # Remove flow entry from switches along path
-        for nd in flowobj.path:
-            self.nodeobjs[nd].remove_flow_entry(event.src_ip, event.dst_ip)
+        for nd in ft.path[fid]:
+            self.nodeobjs[nd].remove_flow_entry(fl)
 
         # Remove flow entry from links along path
-        for lk in flowobj.links:
-            self.linkobjs[lk].remove_flow_entry(event.src_ip, event.dst_ip)
+        for lk in ft.links[fid]:
+            self.linkobjs[lk].remove_flow_entry(fl)
 
         # Remove flow entry from controller
-        self.ctrl.remove_flow_entry(event.src_ip, event.dst_ip)
+        self.ctrl.remove_flow_entry(fl)
 
         # Log flow stats
         if (cfg.LOG_FLOW_STATS > 0):
             record = self.log_flow_stats(flowobj)
             self.flow_stats_recs.append(record)
 
-        # Finally, remove the flow entry from self.flows
+        # Finally, remove the flow entry from self.flows, and free its row in self.flow_table
         del self.flows[fl]
+        flowobj.free()
 
         # Increment the counter
         self.n_EvIdleTimeout += 1
@@ -305,18 +447,11 @@ class SimCoreEventHandling:
             event (Instance inherited from SimEvent): EvCollectCnt event
 
         Return:
-            None. Will schedule events to self.ev_queue if necessary.
+            None. Fired periodically from self.timers, so it does not reschedule itself.
         """
-        # First update all flow's states
-        self.update_all_flows(ev_time)
-
-        # Then, collect (and reset) the flows' counters
+        # Collect (and reset) the flows' counters. Flows are updated as their counters are read.
         self.ctrl.collect_counters(ev_time)
 
-        # Schedule next EvCollectCnt event
-        new_ev_time = ev_time + cfg.PERIOD_COLLECT
-        heappush(self.ev_queue, (new_ev_time, EvCollectCnt(ev_time=new_ev_time)))
-
 
     def handle_EvReroute(self, ev_time, event):
         """Handle an EvReroute event.
@@ -328,27 +463,21 @@ class SimCoreEventHandling:
             event (Instance inherited from SimEvent):
 
         Return:
-            None. Will schedule events to self.ev_queue if necessary.
+            None. Fired periodically from self.timers, so it does not reschedule itself.
         """
-        # First update all flow's states
-        self.update_all_flows(ev_time)
-
         # Do reroute
         self.ctrl.do_reroute(ev_time)
 
-        # Re-calculate flow BW after reroute
-        self.calc_flow_rates(ev_time)
-
-        # Schedule next EvReroute event
-        new_ev_time = ev_time + cfg.PERIOD_REROUTE
-        heappush(self.ev_queue, (new_ev_time, EvReroute(ev_time=new_ev_time)))
+        # Flow BW is recalculated once all events at ev_time are handled
+        self.rates_dirty = True
+        self.n_rate_changes += 1
 
 
     def handle_EvLogLinkUtil(self, ev_time, event):
         """
         """
-        # First update all flow's states
-        self.update_all_flows(ev_time)
+        # First bring link byte counters up to ev_time
+        self.update_link_byte_cnt(ev_time)
 
         if (cfg.LOG_LINK_UTIL > 0):
             # Create link util and link flows records, and append them to lists
@@ -356,22 +485,11 @@ class SimCoreEventHandling:
             self.link_util_recs.append(rec_link_util)
             self.link_flows_recs.append(rec_link_flows)
 
-            # Schedule next EvLogLinkUtil event
-            new_ev_time = ev_time + cfg.PERIOD_LOGGING
-            heappush(self.ev_queue, (new_ev_time, EvLogLinkUtil(ev_time=new_ev_time)))
-
 
     def handle_EvLogTableUtil(self, ev_time, event):
         """
         """
-        # First update all flow's states
-        self.update_all_flows(ev_time)
-
         if (cfg.LOG_TABLE_UTIL > 0):
             # Create table util record, and append it to list
             rec_table_util = self.log_table_util(ev_time)
             self.table_util_recs.append(rec_table_util)
-
-            # Schedule next EvLogTableUtil event
-            new_ev_time = ev_time + cfg.PERIOD_LOGGING
-            heappush(self.ev_queue, (new_ev_time, EvLogTableUtil(ev_time=new_ev_time)))
@@ -0,0 +1,587 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""sim/SimCoreFluid.py: Class SimCoreFluid, a time-stepped fluid engine for SimCore.
+Inherited by SimCore, and used instead of the event loop if cfg.ENGINE_MODE == 'fluid'.
+"""
+__author__      = 'Kuan-yin Chen'
+__copyright__   = 'Copyright 2014, NYU-Poly'
+
+# Built-in modules
+import sys
+from time import time
+# Third-party modules
+import numpy as np
+# User-defined modules
+import SimConfig as cfg
+from SimFlow import *
+from SimCoreCalculation import maxmin_fill
+
+
+# Flow status codes in FluidFlowTable.status
+FLUID_REQUESTING    = 0
+FLUID_ACTIVE        = 1
+FLUID_FINISHED      = 2
+
+
+def expand_paths(paths, ptr, items):
+    """Expand paths into a sparse row x item matrix in coordinate form.
+
+    Args:
+        paths (numpy array of int): Path IDs, one per row
+        ptr (numpy array of int): Items of path p are items[ptr[p]:ptr[p+1]]
+        items (numpy array of int): Node or link indices of all paths, concatenated
+
+    Returns:
+        numpy array of int: Row of each nonzero entry
+        numpy array of int: Item of each nonzero entry
+
+    """
+    lens    = ptr[paths+1] - ptr[paths]
+    rows    = np.repeat(np.arange(len(paths)), lens)
+    offsets = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+    return rows, items[np.repeat(ptr[paths], lens) + offsets]
+
+
+class FluidFlowTable:
+    """Flows of the fluid engine, kept as one numpy array per attribute.
+    Row i of every array belongs to the same flow.
+
+    Attributes:
+        fid (int64): Serial number of the flow
+        src_ip, dst_ip (int64): Source and dest host IPs as integers
+        src_nd, dst_nd (intp): Indices of source and dest edge switches in SimCore.nodes
+        flow_size, flow_rate, bytes_left, curr_rate (float64): As in SimFlow
+        arrive_time, install_time, end_time, remove_time (float64): As in SimFlow
+        req_time (float64): Time of the flow's next EvPacketIn
+        resend (int64): As in SimFlow
+        status (int8): FLUID_REQUESTING, FLUID_ACTIVE or FLUID_FINISHED
+        path (intp): Path ID (see SimCoreFluid.setup_fluid_paths), -1 if not installed
+
+    """
+    COLUMNS = [('fid',          np.int64),
+               ('src_ip',       np.int64),
+               ('dst_ip',       np.int64),
+               ('src_nd',       np.intp),
+               ('dst_nd',       np.intp),
+               ('flow_size',    np.float64),
+               ('flow_rate',    np.float64),
+               ('bytes_left',   np.float64),
+               ('curr_rate',    np.float64),
+               ('arrive_time',  np.float64),
+               ('req_time',     np.float64),
+               ('install_time', np.float64),
+               ('end_time',     np.float64),
+               ('remove_time',  np.float64),
+               ('resend',       np.int64),
+               ('status',       np.int8),
+               ('path',         np.intp)]
+
+    def __init__(self):
+        for col, dtype in self.COLUMNS:
+            setattr(self, col, np.zeros(0, dtype=dtype))
+
+
+    def __len__(self):
+        return len(self.fid)
+
+
+    def append(self, **kwargs):
+        """Append rows. Every column is given as an array (or a scalar for all new rows).
+        """
+        n = len(kwargs['fid'])
+        for col, dtype in self.COLUMNS:
+            new = np.empty(n, dtype=dtype)
+            new[:] = kwargs[col]
+            setattr(self, col, np.concatenate((getattr(self, col), new)))
+
+
+    def keep(self, mask):
+        """Keep only rows where mask is True. Rows stay in the same order.
+        """
+        for col, dtype in self.COLUMNS:
+            setattr(self, col, getattr(self, col)[mask])
+
+
+
+class SimCoreFluid:
+    """Time-stepped fluid engine for SimCore class.
+
+    Extra Notes:
+        1. Time advances in steps of cfg.FLUID_TIME_STEP, cut short at logging times.
+           Each step [t, t_end) handles, as batches of numpy array operations:
+           - idle timeouts (flow entry removals) due before t_end,
+           - flow arrivals before t_end,
+           - EvPacketIns due before t_end: routing through the path DB, and admission,
+           - one max-min fair rate allocation over flows installed before t_end,
+           - transmission, and completion of flows within the step.
+        2. Control plane events are therefore handled up to one step early. Flows start
+           transmitting at their exact install_time, and end at their exact end_time.
+        3. Routing sees table usage and # of active flows per link as of the start of
+           the step. A flow is admitted if its chosen path is feasible, and its entries still
+           fit after earlier requests of the same batch. Otherwise it is rejected, as at
+           EvPacketIn / EvFlowInstall.
+        4. Flows are generated by the batch generators of SimFlowGen (numpy.random), so
+           runs do not reproduce the flows of the event engine.
+        5. Rerouting (cfg.DO_REROUTE), checkpoints and branches are not supported.
+           cfg.RATE_ALLOC_MODE does not apply: rates are always exact max-min fair.
+
+    """
+    def setup_fluid(self):
+        """Set up the flow table and numpy path database for the fluid engine.
+        """
+        self.fluid_flows        = FluidFlowTable()
+        self.fluid_next_fid     = 0
+        self.fluid_next_arr     = 0.0       # Next arrival time of 'const' and 'exp' models
+        self.fluid_pend_time    = np.zeros(0)
+            # Arrival times of flows generated at flow ends ('saturate' model)
+        self.fluid_pend_src     = np.zeros(0, dtype=np.int64)
+            # Source host IPs of those flows
+        self.fluid_act_fids     = None      # fid of flows whose rates were last calculated
+        self.fluid_act_rows     = None      # Their flow x link matrix, in coordinate form
+        self.fluid_act_links    = None
+        self.n_fluid_steps      = 0
+        self.n_fluid_rate_calc  = 0
+
+        self.fluid_table_size   = np.array([self.nodeobjs[nd].table_size for nd in self.nodes], \
+                                           dtype=np.int64)
+        self.fluid_table_usage  = np.zeros(len(self.nodes), dtype=np.int64)
+        self.fluid_link_bytes   = np.zeros(len(self.links))
+        self.fluid_link_flows   = np.zeros(len(self.links), dtype=np.int64)
+        self.fluid_host_ips     = self.flowgen.host_ips
+        self.fluid_host_nd      = np.array([self.node_ids[self.hosts[ip]] \
+                                            for ip in self.fluid_host_ips.tolist()], dtype=np.intp)
+        self.setup_fluid_paths()
+
+        if (cfg.FLOWGEN_ARR_MODEL == 'saturate'):
+            # One initial flow for each source host
+            self.fluid_pend_src     = self.fluid_host_ips.copy()
+            self.fluid_pend_time    = np.random.uniform(0.0, \
+                                          cfg.FLOWGEN_ARR_SATURATE.INIT_FLOWS_SPREAD, \
+                                          len(self.fluid_pend_src))
+
+
+    def setup_fluid_paths(self):
+        """Number the paths in the controller's path DB, and keep their nodes and links as
+        numpy arrays.
+
+        Extra Notes:
+            fluid_pair_paths[src_nd * # of nodes + dst_nd] lists the path IDs of a
+            node pair, in path DB order, padded with -1.
+            Nodes of path p are fluid_path_nodes[fluid_node_ptr[p]:fluid_node_ptr[p+1]],
+            and likewise for its links.
+
+        """
+        n_nodes     = len(self.nodes)
+        path_db     = self.ctrl.path_db
+        max_k       = max(len(paths) for paths in path_db.values())
+        pair_paths  = np.full((n_nodes * n_nodes, max_k), -1, dtype=np.intp)
+        self.fluid_paths = []
+        path_nodes  = []
+        path_links  = []
+
+        for (src, dst) in sorted(path_db):
+            pair = self.node_ids[src] * n_nodes + self.node_ids[dst]
+            for k, path in enumerate(path_db[(src, dst)]):
+                pair_paths[pair, k] = len(self.fluid_paths)
+                self.fluid_paths.append(path)
+                path_nodes.append([self.node_ids[nd] for nd in path])
+                path_links.append(list(path.link_ids))
+
+        self.fluid_pair_paths   = pair_paths
+        self.fluid_node_ptr     = np.cumsum([0] + [len(x) for x in path_nodes])
+        self.fluid_path_nodes   = np.array(sum(path_nodes, []), dtype=np.intp)
+        self.fluid_link_ptr     = np.cumsum([0] + [len(x) for x in path_links])
+        self.fluid_path_links   = np.array(sum(path_links, []), dtype=np.intp)
+
+
+    def main_course_fluid(self):
+        """The main course of simulation execution with the fluid engine.
+        Replaces steps 1 to 3 of main_course(). Logs are dumped as in main_course().
+        """
+        self.setup_fluid()
+
+        print "Logging to folder: %s" %(cfg.LOG_DIR)
+        print "Start fluid simulation. Experiment name: %s" %(cfg.EXP_NAME)
+
+        ft              = self.fluid_flows
+        next_prog_time  = 0.0
+        n_logs          = 0
+        next_log_time   = cfg.PERIOD_LOGGING
+        t               = 0.0
+
+        while (t < self.sim_time):
+            # Show progress
+            if (cfg.SHOW_PROGRESS > 0 and t >= next_prog_time):
+                percentage = t * 100.0 / cfg.SIM_TIME
+                sys.stdout.write("Sim Time: %-3.2fs (%-3.2f%%)    " %(t, percentage)   + \
+                                 "Exec Time: %-5.3f seconds    "    %(time()-self.exec_st_time) + \
+                                 "#Flows:%-4d    "                  %(len(ft))                  + \
+                                 "#ActiveFlows:%-4d    "            %(self.n_active_flows)      + \
+                                 "#FlowEnds:%-6d    "               %(self.n_ended_flows)       + \
+                                 "#Rejects:%-6d\r"                  %(self.n_Reject)
+                                )
+                sys.stdout.flush()
+                next_prog_time = np.ceil(percentage) * cfg.SIM_TIME / 100.0
+
+            # Steps end at logging times
+            t_end = min(t + cfg.FLUID_TIME_STEP, next_log_time, self.sim_time)
+            if (next_log_time - t_end < 1e-9 * cfg.FLUID_TIME_STEP):
+                t_end = next_log_time
+
+            self.fluid_remove_flows(t_end)
+            self.fluid_arrive_flows(t_end)
+            self.fluid_request_flows(t_end)
+            self.fluid_calc_rates(t_end)
+            self.fluid_advance_flows(t, t_end)
+            self.n_fluid_steps += 1
+            self.timer = t = t_end
+
+            if (t >= next_log_time):
+                self.fluid_log_util(t)
+                n_logs          += 1
+                next_log_time   = (n_logs + 1) * cfg.PERIOD_LOGGING
+
+        # Finalize. Flows not yet removed are logged as in dump_flow_stats().
+        if (cfg.LOG_FLOW_STATS > 0):
+            for i in range(len(ft)):
+                self.fluid_log_flow_stats(i, t)
+        self.exec_ed_time = time()
+        self.dump_logs()
+
+
+    def fluid_remove_flows(self, t_end):
+        """Remove entries of finished flows whose idle timeout is before t_end, and log their
+        flow stats.
+        """
+        ft      = self.fluid_flows
+        done    = (ft.status == FLUID_FINISHED) & (ft.remove_time < t_end)
+        if (not done.any()):
+            return
+
+        idx         = np.flatnonzero(done)
+        rows, nodes = expand_paths(ft.path[idx], self.fluid_node_ptr, self.fluid_path_nodes)
+        self.fluid_table_usage -= np.bincount(nodes, minlength=len(self.nodes))
+
+        if (cfg.LOG_FLOW_STATS > 0):
+            for i in idx.tolist():
+                self.fluid_log_flow_stats(i)
+
+        self.n_EvIdleTimeout += len(idx)
+        ft.keep(~done)
+
+
+    def fluid_arrive_flows(self, t_end):
+        """Generate the flows that arrive before t_end, and add them to the flow table.
+        """
+        ft      = self.fluid_flows
+        times   = []
+
+        # 'saturate': flows generated at flow ends, and initial flows
+        if (cfg.FLOWGEN_ARR_MODEL == 'saturate'):
+            due                     = self.fluid_pend_time < t_end
+            times                   = self.fluid_pend_time[due]
+            src                     = self.fluid_pend_src[due]
+            self.fluid_pend_time    = self.fluid_pend_time[~due]
+            self.fluid_pend_src     = self.fluid_pend_src[~due]
+        # 'const' and 'exp': inter-arrival times are drawn in chunks
+        elif (cfg.FLOWGEN_ARR_MODEL == 'const' or cfg.FLOWGEN_ARR_MODEL == 'exp'):
+            while (self.fluid_next_arr < t_end):
+                n_draw  = int(self.get_fluid_arr_rate() * cfg.FLUID_TIME_STEP) + 16
+                if (cfg.FLOWGEN_ARR_MODEL == 'const'):
+                    hi = (1+cfg.FLOWGEN_ARR_CONST.CUTOFF) * 1.0/cfg.FLOWGEN_ARR_CONST.FLOW_ARR_RATE
+                    lo = (1-cfg.FLOWGEN_ARR_CONST.CUTOFF) * 1.0/cfg.FLOWGEN_ARR_CONST.FLOW_ARR_RATE
+                    intarr = np.random.uniform(lo, hi, n_draw)
+                else:
+                    intarr = np.random.exponential(1.0/cfg.FLOWGEN_ARR_EXP.FLOW_ARR_RATE, n_draw)
+                arr     = self.fluid_next_arr + np.concatenate(([0.0], np.cumsum(intarr)))
+                n_due   = np.searchsorted(arr, t_end)
+                times.append(arr[:n_due])
+                self.fluid_next_arr = arr[n_due]
+            times   = np.concatenate(times) if (times) else np.zeros(0)
+            src     = np.full(len(times), -1, dtype=np.int64)
+
+        n = len(times)
+        if (n == 0):
+            return
+
+        src, dst        = self.flowgen.pick_src_dst_batch(src, (ft.src_ip << 32) | ft.dst_ip)
+        fsize, frate    = self.flowgen.gen_flow_size_rate_batch(n)
+        ft.append(fid=np.arange(self.fluid_next_fid, self.fluid_next_fid + n),
+                  src_ip=src, dst_ip=dst,
+                  src_nd=self.fluid_host_nd[np.searchsorted(self.fluid_host_ips, src)],
+                  dst_nd=self.fluid_host_nd[np.searchsorted(self.fluid_host_ips, dst)],
+                  flow_size=fsize, flow_rate=frate, bytes_left=fsize, curr_rate=0.0,
+                  arrive_time=times, req_time=times + cfg.SW_CTRL_DELAY,
+                  install_time=np.inf, end_time=np.inf, remove_time=np.inf,
+                  resend=0, status=FLUID_REQUESTING, path=-1)
+        self.fluid_next_fid     += n
+        self.n_EvFlowArrival    += n
+
+
+    def get_fluid_arr_rate(self):
+        """Get mean flow arrival rate of 'const' and 'exp' models.
+        """
+        if (cfg.FLOWGEN_ARR_MODEL == 'const'):
+            return cfg.FLOWGEN_ARR_CONST.FLOW_ARR_RATE
+        return cfg.FLOWGEN_ARR_EXP.FLOW_ARR_RATE
+
+
+    def fluid_choose_paths(self, pairs):
+        """Choose a path for each of a batch of requests, according to routing mode.
+        Batch version of SimCtrl.find_path().
+
+        Args:
+            pairs (numpy array of int): Node pair of each request (see setup_fluid_paths)
+
+        Returns:
+            numpy array of int: Chosen path ID of each request, -1 if no feasible path.
+
+        """
+        cand    = self.fluid_pair_paths[pairs]
+        valid   = cand >= 0
+        rows    = np.arange(len(pairs))
+
+        if (cfg.PATHDB_MODE == 'one_shortest'):
+            return cand[:, 0]
+        if (cfg.ROUTING_MODE == 'ecmp'):
+            # Not checked for feasibility until installation, as in find_path_ecmp()
+            score = np.random.uniform(0, 1, cand.shape)
+            score[~valid] = -np.inf
+            return cand[rows, score.argmax(axis=1)]
+
+        # Feasible paths: no node on path has a full table
+        n_paths     = len(self.fluid_paths)
+        path_rows, path_nodes = expand_paths(np.arange(n_paths), self.fluid_node_ptr, \
+                                             self.fluid_path_nodes)
+        usage       = self.fluid_table_usage.astype(np.float64)
+        size        = self.fluid_table_size.astype(np.float64)
+        full        = usage >= size
+        feasible    = np.bincount(path_rows, weights=full[path_nodes], minlength=n_paths) == 0
+
+        if (cfg.ROUTING_MODE == 'fe'):
+            # Lowest sum of size / (size - usage) over path nodes
+            with np.errstate(divide='ignore'):
+                objval  = size / (size - usage)
+            path_score  = -np.bincount(path_rows, weights=objval[path_nodes], minlength=n_paths)
+        elif (cfg.ROUTING_MODE == 'bw'):
+            # Highest bottleneck of cap / (# of active flows + 1) over path links
+            avail_bw    = self.link_table.view('cap') / (self.fluid_link_flows + 1)
+            path_score  = np.minimum.reduceat(avail_bw[self.fluid_path_links], \
+                                              self.fluid_link_ptr[:-1])
+        else:
+            path_score  = None      # Default to 'random'
+
+        ok      = valid & feasible[np.maximum(cand, 0)]
+        score   = np.random.uniform(0, 1, cand.shape) if (path_score is None) \
+                  else path_score[np.maximum(cand, 0)]
+        score[~ok] = -np.inf
+        choice  = cand[rows, score.argmax(axis=1)]
+        choice[~ok.any(axis=1)] = -1
+        return choice
+
+
+    def fluid_request_flows(self, t_end):
+        """Handle EvPacketIns due before t_end as one batch: route, admit and install flows,
+        or reject them.
+        """
+        ft      = self.fluid_flows
+        req     = np.flatnonzero((ft.status == FLUID_REQUESTING) & (ft.req_time < t_end))
+        if (len(req) == 0):
+            return
+        req     = req[np.argsort(ft.req_time[req], kind='mergesort')]
+        self.n_EvPacketIn += len(req)
+
+        paths   = self.fluid_choose_paths(ft.src_nd[req] * len(self.nodes) + ft.dst_nd[req])
+        routed  = np.flatnonzero(paths >= 0)
+
+        # Admission: entries of each request must fit after those of earlier requests
+        rows, nodes = expand_paths(paths[routed], self.fluid_node_ptr, self.fluid_path_nodes)
+        order       = np.lexsort((rows, nodes))
+        rows, nodes = rows[order], nodes[order]
+        n_entries   = np.bincount(nodes, minlength=len(self.nodes))
+        first       = np.cumsum(n_entries) - n_entries
+        rank        = np.arange(len(nodes)) - first[nodes]
+        free        = self.fluid_table_size - self.fluid_table_usage
+        overflow    = np.zeros(len(routed), dtype=bool)
+        overflow[rows[rank >= free[nodes]]] = True
+
+        admit       = np.zeros(len(req), dtype=bool)
+        admit[routed[~overflow]] = True
+        self.fluid_table_usage += np.bincount(nodes[~overflow[rows]], minlength=len(self.nodes))
+
+        idx                     = req[admit]
+        ft.path[idx]            = paths[admit]
+        ft.status[idx]          = FLUID_ACTIVE
+        ft.install_time[idx]    = ft.req_time[idx] + cfg.CTRL_SW_DELAY
+
+        # Rejected: re-send EvPacketIn after REJECT_TIMEOUT, or drop the flow
+        idx     = req[~admit]
+        retry   = (ft.resend[idx] < cfg.MAX_RETRY) | (cfg.FLOWGEN_ARR_MODEL == 'saturate')
+        ft.req_time[idx[retry]] += cfg.REJECT_TIMEOUT + cfg.SW_CTRL_DELAY
+        ft.resend[idx[retry]]   += 1
+        self.n_Reject           += int(retry.sum())
+        if (not retry.all()):
+            drop            = np.zeros(len(ft), dtype=bool)
+            drop[idx[~retry]] = True
+            ft.keep(~drop)
+
+
+    def fluid_calc_rates(self, t_end):
+        """Calculate max-min fair rates of flows installed before t_end. Skipped if the set
+        of such flows is unchanged since the last calculation.
+
+        Extra Notes:
+            If cfg.SRC_LIMITED == 0, flows on the same path always get the same rate, so
+            water-filling runs over distinct paths, each weighted by its # of flows.
+
+        """
+        ft      = self.fluid_flows
+        act     = np.flatnonzero((ft.status == FLUID_ACTIVE) & (ft.install_time < t_end))
+        fids    = ft.fid[act]
+        if (self.fluid_act_fids is not None and np.array_equal(fids, self.fluid_act_fids)):
+            return
+
+        self.fluid_act_fids = fids
+        self.fluid_act_rows, self.fluid_act_links = expand_paths(ft.path[act], \
+                                                                 self.fluid_link_ptr, \
+                                                                 self.fluid_path_links)
+        self.fluid_link_flows   = np.bincount(self.fluid_act_links, minlength=len(self.links))
+        self.n_active_flows     = len(act)
+        self.n_fluid_rate_calc  += 1
+        if (len(act) == 0):
+            return
+
+        if (cfg.SRC_LIMITED > 0):
+            inv         = np.arange(len(act))
+            rows, links = self.fluid_act_rows, self.fluid_act_links
+            src_rate    = ft.flow_rate[act]
+            weight      = None
+        else:
+            paths, inv, counts = np.unique(ft.path[act], return_inverse=True, return_counts=True)
+            rows, links = expand_paths(paths, self.fluid_link_ptr, self.fluid_path_links)
+            src_rate    = np.full(len(paths), np.inf)
+            weight      = counts.astype(np.float64)
+
+        # never_btnk links are left out of the matrix
+        kept            = self.link_table.view('never_btnk')[links] == 0
+        rates, frozen   = maxmin_fill(rows[kept], links[kept], self.link_table.view('cap'), \
+                                      src_rate, weight)
+        ft.curr_rate[act] = rates[inv]
+
+
+    def fluid_advance_flows(self, t, t_end):
+        """Transmit installed flows over [t, t_end) at their current rates. Flows that
+        complete within the step end at their exact end_time.
+        """
+        ft      = self.fluid_flows
+        act     = np.flatnonzero((ft.status == FLUID_ACTIVE) & (ft.install_time < t_end))
+        if (len(act) == 0):
+            return
+
+        st_time     = np.maximum(t, ft.install_time[act])
+        rate        = ft.curr_rate[act]
+        bytes_left  = ft.bytes_left[act]
+        sent        = rate * (t_end - st_time)
+        fin         = sent >= bytes_left
+        sent[fin]   = bytes_left[fin]
+        ft.bytes_left[act] = bytes_left - sent
+
+        self.fluid_link_bytes   += np.bincount(self.fluid_act_links, \
+                                               weights=sent[self.fluid_act_rows], \
+                                               minlength=len(self.links))
+        self.global_throughput  += sent.sum()
+
+        if (fin.any()):
+            idx                     = act[fin]
+            ft.end_time[idx]        = st_time[fin] + bytes_left[fin] / rate[fin]
+            ft.remove_time[idx]     = ft.end_time[idx] + cfg.IDLE_TIMEOUT
+            ft.bytes_left[idx]      = 0.0
+            ft.status[idx]          = FLUID_FINISHED
+            self.n_EvFlowEnd        += len(idx)
+            self.n_ended_flows      += len(idx)
+
+            # 'saturate': the source host fires a new flow
+            if (cfg.FLOWGEN_ARR_MODEL == 'saturate'):
+                self.fluid_pend_time    = np.concatenate((self.fluid_pend_time, \
+                                          ft.end_time[idx] + cfg.FLOWGEN_ARR_SATURATE.NEXT_FLOW_DELAY))
+                self.fluid_pend_src     = np.concatenate((self.fluid_pend_src, ft.src_ip[idx]))
+
+
+    def fluid_log_util(self, ev_time):
+        """Log link util. and table util. records at ev_time, as EvLogLinkUtil and
+        EvLogTableUtil do.
+        """
+        if (cfg.LOG_LINK_UTIL > 0):
+            ft          = self.fluid_flows
+            act         = np.flatnonzero((ft.status == FLUID_ACTIVE) & (ft.install_time <= ev_time))
+            rows, links = expand_paths(ft.path[act], self.fluid_link_ptr, self.fluid_path_links)
+            n_flows     = np.bincount(links, minlength=len(self.links))
+            self.link_table.view('byte_cnt')[:] = self.fluid_link_bytes
+            rec_link_util, rec_link_flows = self.log_link_util(ev_time, n_flows)
+            self.link_util_recs.append(rec_link_util)
+            self.link_flows_recs.append(rec_link_flows)
+        self.fluid_link_bytes.fill(0.0)
+        self.global_throughput = 0.0
+
+        if (cfg.LOG_TABLE_UTIL > 0):
+            # Entries in tables at ev_time, i.e. installed and not yet timed out
+            ft          = self.fluid_flows
+            inst        = np.flatnonzero((ft.install_time <= ev_time) & (ft.remove_time > ev_time))
+            rows, nodes = expand_paths(ft.path[inst], self.fluid_node_ptr, self.fluid_path_nodes)
+            usage       = np.bincount(nodes, minlength=len(self.nodes))
+            util        = (usage.astype(np.float64) / self.fluid_table_size).tolist()
+            rec_table_util = self.log_table_util(ev_time, dict(zip(self.nodes, util)))
+            self.table_util_recs.append(rec_table_util)
+
+
+    def fluid_log_flow_stats(self, i, ev_time=None):
+        """Log flow stats of row i of the flow table (see fluid_flowobj()).
+        """
+        flowobj = self.fluid_flowobj(i, ev_time)
+        self.flow_stats_recs.append(self.log_flow_stats(flowobj))
+        flowobj.free()
+
+
+    def fluid_flowobj(self, i, ev_time=None):
+        """Build a SimFlow instance of row i of the flow table, for log_flow_stats().
+        Its row in self.flow_table must be freed by the caller.
+
+        Args:
+            i (int): Row in self.fluid_flows
+            ev_time (float64): Current time, for flows not yet removed.
+                               None if the flow is being removed at its remove_time.
+
+        """
+        ft          = self.fluid_flows
+        status      = int(ft.status[i])
+        path        = self.fluid_paths[ft.path[i]] if (ft.path[i] >= 0) else []
+        flow_size   = float(ft.flow_size[i])
+        bytes_left  = float(ft.bytes_left[i])
+        arrive_time = float(ft.arrive_time[i])
+        end_time    = float(ft.end_time[i])
+        update_time = ev_time if (ev_time is not None) else float(ft.remove_time[i])
+
+        flowobj = SimFlow(self.flow_table, src_ip=int(ft.src_ip[i]), dst_ip=int(ft.dst_ip[i]), \
+                          src_node=self.nodes[ft.src_nd[i]], dst_node=self.nodes[ft.dst_nd[i]], \
+                          path=path, links=self.get_links_on_path(path), \
+                          flow_size=flow_size, flow_rate=float(ft.flow_rate[i]), \
+                          bytes_left=bytes_left, bytes_sent=flow_size-bytes_left, \
+                          arrive_time=arrive_time, install_time=float(ft.install_time[i]), \
+                          end_time=end_time, update_time=update_time, \
+                          resend=int(ft.resend[i]))
+
+        if (status == FLUID_FINISHED):
+            flowobj.status      = FLOW_FINISHED if (ev_time is not None) else FLOW_REMOVED
+            flowobj.duration    = end_time - arrive_time
+            flowobj.avg_rate    = flow_size / flowobj.duration
+            if (ev_time is None):
+                flowobj.remove_time = update_time
+        elif (status == FLUID_ACTIVE):
+            flowobj.status      = FLOW_ACTIVE
+            flowobj.curr_rate   = float(ft.curr_rate[i])
+            if (update_time > arrive_time):
+                flowobj.avg_rate = (flow_size - bytes_left) / (update_time - arrive_time)
+        else:
+            flowobj.status      = FLOW_REQUESTING
+
+        return flowobj
@@ -16,6 +16,13 @@ import pprint as pp
 # User-defined modules
 import SimConfig as cfg
 import SimMath as mth
+from SimHostAddr import *
+from SimFlowTable import FLOW_STATUS_NAMES
+
+
+# Register CSV dialect at import time, so that it is also available to a SimCore
+# restored from a checkpoint (see SimCoreCheckpoint)
+csv.register_dialect('flowsim', delimiter=',', quoting=csv.QUOTE_NONNUMERIC)
 
 
 class SimCoreLogging:
@@ -31,27 +38,15 @@ class SimCoreLogging:
             None
 
         """
-        # Lists for keeping records (link util., table util., and flow stats)
-        self.link_util_recs     = []
-        self.link_flows_recs    = []
-        self.table_util_recs    = []
-        self.flow_stats_recs    = []
-
         # File paths and names for csv log files
-        if ( not os.path.exists(cfg.LOG_DIR) ):
-            os.mkdir(cfg.LOG_DIR)
-        self.fn_link_util   =   os.path.join(cfg.LOG_DIR, 'link_util.csv')
-        self.fn_link_flows  =   os.path.join(cfg.LOG_DIR, 'link_flows.csv')
-        self.fn_table_util  =   os.path.join(cfg.LOG_DIR, 'table_util.csv')
-        self.fn_flow_stats  =   os.path.join(cfg.LOG_DIR, 'flow_stats.csv')
-        self.fn_summary     =   os.path.join(cfg.LOG_DIR, 'summary.csv')
-        self.fn_config      =   os.path.join(cfg.LOG_DIR, 'config.txt')
+        self.set_log_paths()
 
         # Column names for csv log files
+        self.col_links      =   [str(lk) for lk in self.links]  # Per-link columns, by link ID
         self.col_link_util  =   ['time', 'mean', 'stdev', 'min', 'max', 'q1', 'q3', 'median', \
-                                'throughput'] + [str(lk) for lk in self.links]
+                                'throughput'] + self.col_links
         self.col_link_flows =   ['time', 'mean', 'stdev', 'min', 'max', 'q1', 'q3', 'median'] + \
-                                [str(lk) for lk in self.links]
+                                self.col_links
         self.col_table_util =   ['time', 'mean', 'stdev', 'min', 'max', 'q1', 'q3', 'median'] + \
                                 [str(nd) for nd in self.nodes]
         self.col_flow_stats =   ['src_ip', 'dst_ip', 'src_node', 'dst_node', 'flow_size', \
@@ -60,36 +55,24 @@ class SimCoreLogging:
                                  'update_time', 'duration', 'status', 'resend', 'reroute', 'hop_count']
         # Column names for those who are going to be averaged and logged
         self.col_avg_link_util  =   ['mean', 'stdev', 'min', 'max', 'q1', 'q3', 'median', \
-                                    'throughput'] + [str(lk) for lk in self.links]
+                                    'throughput'] + self.col_links
         self.col_avg_link_flows =   ['mean', 'stdev', 'min', 'max', 'q1', 'q3', 'median'] + \
-                                    [str(lk) for lk in self.links]
+                                    self.col_links
         self.col_avg_table_util =   ['mean', 'stdev', 'min', 'max', 'q1', 'q3', 'median'] + \
                                     [str(nd) for nd in self.nodes]
         self.col_avg_flow_stats =   ['flow_size', 'avg_rate', 'resend', 'reroute', 'duration', 'hop_count']
 
-        # Record column vectors
-        self.col_vec_link_util  = {k: [] for k in self.col_link_util}
-        self.col_vec_link_flows = {k: [] for k in self.col_link_flows}
-        self.col_vec_table_util = {k: [] for k in self.col_table_util}
-        self.col_vec_flow_stats = {k: [] for k in self.col_flow_stats}
+        # Lists for keeping records (link util., table util., and flow stats),
+        # record column vectors, and event counters for summary
+        self.reset_log_records()
 
-        # Byte counters for each link, and global throughput
-        self.link_byte_cnt = {}
-        for lk in self.links:
-            self.link_byte_cnt[lk] = 0.0
+        # Global throughput. Byte counters of links are in self.link_table (see SimLink).
         self.global_throughput = 0.0
 
 
         # Parameters & counters for summary
         self.summary_message = ''   # A string that stores the whole summary message
-        self.n_EvPacketIn = 0
-        self.n_EvFlowArrival = 0
-        self.n_EvFlowEnd = 0
-        self.n_EvIdleTimeout = 0
-        self.n_Reject = 0
         self.n_active_flows = 0
-        self.n_rerouted_flows = 0
-        self.n_ended_flows = 0
         self.avg_throughput = 0.0
         self.avg_link_util = 0.0
         self.avg_table_util = 0.0
@@ -97,63 +80,97 @@ class SimCoreLogging:
         self.std_table_util = 0.0
         self.exec_st_time = self.exec_ed_time = self.exec_time = 0.0
 
-        # Register CSV dialect
-        csv.register_dialect('flowsim', delimiter=',', quoting=csv.QUOTE_NONNUMERIC)
 
+    def set_log_paths(self):
+        """Set file paths and names for csv log files under cfg.LOG_DIR.
+        """
+        if ( not os.path.exists(cfg.LOG_DIR) ):
+            os.mkdir(cfg.LOG_DIR)
+        self.fn_link_util   =   os.path.join(cfg.LOG_DIR, 'link_util.csv')
+        self.fn_link_flows  =   os.path.join(cfg.LOG_DIR, 'link_flows.csv')
+        self.fn_table_util  =   os.path.join(cfg.LOG_DIR, 'table_util.csv')
+        self.fn_flow_stats  =   os.path.join(cfg.LOG_DIR, 'flow_stats.csv')
+        self.fn_summary     =   os.path.join(cfg.LOG_DIR, 'summary.csv')
+        self.fn_config      =   os.path.join(cfg.LOG_DIR, 'config.txt')
+
+
+    def reset_log_records(self):
+        """Discard all accumulated link util., table util. and flow stats records, and
+        reset the event counters reported in summary.csv.
+        """
+        self.link_util_recs     = []
+        self.link_flows_recs    = []
+        self.table_util_recs    = []
+        self.flow_stats_recs    = []
+
+        self.col_vec_link_util  = {k: [] for k in self.col_link_util}
+        self.col_vec_link_flows = {k: [] for k in self.col_link_flows}
+        self.col_vec_table_util = {k: [] for k in self.col_table_util}
+        self.col_vec_flow_stats = {k: [] for k in self.col_flow_stats}
 
-    def log_link_util(self, ev_time):
+        self.n_EvPacketIn       = 0
+        self.n_EvFlowArrival    = 0
+        self.n_EvFlowEnd        = 0
+        self.n_EvIdleTimeout    = 0
+        self.n_Reject           = 0
+        self.n_rerouted_flows   = 0
+        self.n_ended_flows      = 0
+
+        # Approximate rate mode and fluid engine counters (see SimCoreCalculation and
+        # SimCoreFluid)
+        self.n_exact_calc       = 0
+        self.n_provisional_calc = 0
+        self.max_rate_dev       = 0.0
+        self.max_rel_rate_dev   = 0.0
+        self.n_fluid_steps      = 0
+        self.n_fluid_rate_calc  = 0
+
+
+    def log_link_util(self, ev_time, link_flows=None):
         """
+        Args:
+            ev_time (float64): Current time
+            link_flows (numpy array of int): # of active flows on each link, indexed by link
+                                             ID. Read from self.link_table if None.
+
+        Extra Notes:
+            Utilization of all links is computed at once from the byte_cnt and cap columns
+            of self.link_table.
         """
-        ret_util    = {'time': round(ev_time, 3)}
-        ret_flows   = {'time': round(ev_time, 3)}
-        list_usage  = []
-        list_util   = []
-        list_flows  = []
+        lt = self.link_table
+        if (link_flows is None):
+            link_flows = lt.view('n_active_flows')
 
         # Get link_util and link_flows info
-        for lk in self.link_byte_cnt:
-            ret_util[str(lk)]   =   self.link_byte_cnt[lk] / \
-                                    (self.linkobjs[lk].cap * cfg.PERIOD_LOGGING)
-            ret_flows[str(lk)]  =   self.linkobjs[lk].get_n_active_flows()
-
-        # Make lists for averages
-        list_usage  = [self.link_byte_cnt[lk] for lk in self.link_byte_cnt]
-        list_util   = [ret_util[str(lk)] for lk in self.link_byte_cnt ]
-        list_flows  = [ret_flows[str(lk)] for lk in self.link_byte_cnt]
-
-        # Calculate statistics for link_util
-        ret_util['mean']        = mth.mean(list_util)
-        ret_util['stdev']       = mth.std(list_util)
-        ret_util['min']         = min(list_util)
-        ret_util['max']         = max(list_util)
-        ret_util['q1']          = mth.percentile(list_util, 25)
-        ret_util['q3']          = mth.percentile(list_util, 75)
-        ret_util['median']      = mth.percentile(list_util, 50)
+        link_util   = lt.view('byte_cnt') / (lt.view('cap') * cfg.PERIOD_LOGGING)
+        ret_util    = dict(zip(self.col_links, link_util.tolist()))
+        ret_flows   = dict(zip(self.col_links, link_flows.tolist()))
+        ret_util['time']    = round(ev_time, 3)
+        ret_flows['time']   = round(ev_time, 3)
+
+        # Calculate statistics for link_util and link_flows
+        ret_util.update(mth.describe(link_util))
         ret_util['throughput']  = self.global_throughput / cfg.PERIOD_LOGGING
-        # Calculate statistics for link_flows
-        ret_flows['mean']       = mth.mean(list_flows)
-        ret_flows['stdev']      = mth.std(list_flows)
-        ret_flows['min']        = min(list_flows)
-        ret_flows['max']        = max(list_flows)
-        ret_flows['q1']         = mth.percentile(list_flows, 25)
-        ret_flows['q3']         = mth.percentile(list_flows, 75)
-        ret_flows['median']     = mth.percentile(list_flows, 50)
+        ret_flows.update(mth.describe(link_flows))
 
         # Append to column vectors
         for k in ret_util:  self.col_vec_link_util[k].append(ret_util[k])
         for k in ret_flows: self.col_vec_link_flows[k].append(ret_flows[k])
 
         # Reset byte counters & global throughput
-        for lk in self.link_byte_cnt:
-            self.link_byte_cnt[lk] = 0.0
+        lt.view('byte_cnt')[:] = 0.0
         self.global_throughput = 0.0
 
         return ret_util, ret_flows
 
 
-    def log_table_util(self, ev_time):
+    def log_table_util(self, ev_time, node_utils=None):
         """Log table utilization data. Called ever cfg.PERIOD_LOGGING.
 
+        Args:
+            ev_time (float64): Current time
+            node_utils (dict): Table utilization of each node. Read from switches if None.
+
         Extra Notes:
             Fields of a table util. record (in column order):
             - Time, mean, rmse, min, max, q1, q3, median
@@ -164,7 +181,7 @@ class SimCoreLogging:
 
         # Retrieve each node's utilization
         for nd in self.topo.nodes():
-            nd_util = self.nodeobjs[nd].get_util()
+            nd_util = self.nodeobjs[nd].get_util() if (node_utils is None) else node_utils[nd]
             ret[nd] = nd_util
             list_util.append(nd_util)
 
@@ -187,15 +204,20 @@ class SimCoreLogging:
         """
         """
         ret = {}
+        t, i = flow_item.table, flow_item.fid
 
         for fld in self.col_flow_stats:
             if (fld == 'hop_count'):
-                if (not flow_item.path == []):
-                    ret[fld] = len(flow_item.path) - 1
+                if (not t.path[i] == []):
+                    ret[fld] = len(t.path[i]) - 1
                 else:
                     ret[fld] = float('inf')
+            elif (fld == 'src_ip' or fld == 'dst_ip'):
+                ret[fld] = ip_str(getattr(t, fld)[i])     # Dotted-quad in flow_stats.csv
+            elif (fld == 'status'):
+                ret[fld] = FLOW_STATUS_NAMES[t.status[i]]
             else:
-                ret[fld] = getattr(flow_item, fld)
+                ret[fld] = getattr(t, fld)[i]
 
         # Append to column vectors
         for k in ret:   self.col_vec_flow_stats[k].append(ret[k])
@@ -330,15 +352,38 @@ class SimCoreLogging:
         self.summary_message += ('std_link_util,%.6f\n'     %(self.std_link_util))
         self.summary_message += ('avg_table_util,%.6f\n'    %(self.avg_table_util))
         self.summary_message += ('std_table_util,%.6f\n'    %(self.std_table_util))
+        if (cfg.RATE_APPROX_INTERVAL > 0 or cfg.RATE_APPROX_N_CHANGES > 0):
+            self.summary_message += ('RATE_APPROX_INTERVAL,%s\n'  %(cfg.RATE_APPROX_INTERVAL))
+            self.summary_message += ('RATE_APPROX_N_CHANGES,%s\n' %(cfg.RATE_APPROX_N_CHANGES))
+            self.summary_message += ('n_exact_calc,%d\n'          %(self.n_exact_calc))
+            self.summary_message += ('n_provisional_calc,%d\n'    %(self.n_provisional_calc))
+            self.summary_message += ('max_rate_dev,%e\n'          %(self.max_rate_dev))
+            self.summary_message += ('max_rel_rate_dev,%.6f\n'    %(self.max_rel_rate_dev))
+        if (cfg.ENGINE_MODE == 'fluid'):
+            self.summary_message += ('ENGINE_MODE,%s\n'           %(cfg.ENGINE_MODE))
+            self.summary_message += ('FLUID_TIME_STEP,%s\n'       %(cfg.FLUID_TIME_STEP))
+            self.summary_message += ('n_fluid_steps,%d\n'         %(self.n_fluid_steps))
+            self.summary_message += ('n_fluid_rate_calc,%d\n'     %(self.n_fluid_rate_calc))
         self.summary_message += ('exec_time,%.6f\n'         %(self.exec_ed_time - self.exec_st_time))
 
         summary_file.write(self.summary_message)
 
 
-    # def dump_config(self):
-    #     """
-    #     """
-    #     os.system("cp ./sim/SimConfig.py %s" %(self.fn_config))
+    def dump_config(self, fn_src):
+        """Copy the config file to self.fn_config. In a branch, the knobs it overrides are
+        appended, so that the logged config is the one the branch actually ran with.
+
+        Args:
+            fn_src (str): Path of the config file that was loaded
+
+        """
+        outfile = open(self.fn_config, 'w')
+        outfile.write(open(fn_src).read())
+        if (self.branch_knobs):
+            outfile.write('\n\n# ---- Branch overrides ----\n')
+            for knob, val in self.branch_knobs:
+                outfile.write('%s = %r\n' %(knob, val))
+        outfile.close()
 
 
     def show_summary(self):
@@ -12,9 +12,11 @@ import random as rd
 import os
 # Third-party modules
 import networkx as nx
+import numpy as np
 # User-defined modules
 import SimConfig as cfg
 from SimCtrlPathDB import *
+from SimFlowTable import FLOW_ACTIVE
 
 
 class SimCtrl(SimCtrlPathDB):
@@ -22,18 +24,26 @@ class SimCtrl(SimCtrlPathDB):
 
     Attributes:
         topo (networkx.Graph): Network topology as an undirected graph.
-        hosts (dict): Hosts database. Key: Host IP, Value: attached edge switch.
+        hosts (dict): Hosts database. Key: Host IP (int), Value: attached edge switch.
                       Directly copy-assigned during SimCtrl.__init__()
-        path_db (dict): Path database. key: flow (2-tuple), value: list of paths.
+        path_db (dict): Path database. key: flow (2-tuple), value: list of paths (SimPath).
                         Can be constructed by k-path, ECMP or shortest path.
+        link_caps (numpy array of float64): Snapshot of link capacities, indexed by link ID
+                                            (see SimCore.link_ids)
+        link_eleph_flows (list of lists): Elephant flows on each link, indexed by link ID.
+                                          Set by comB().
+        n_link_eleph (numpy array of int): Length of each list in link_eleph_flows
 
     Extra Notes:
-
+        NodeRec and FlowRec are __slots__ classes, as there is one FlowRec for
+        every installed flow.
 
     """
-    class NodeRec:
+    class NodeRec(object):
         """Record of node attributes at controller.
         """
+        __slots__ = ('table_size',)
+
         def __init__(self, nd, sim_core):
             """Constructor of NodeRec class.
 
@@ -44,36 +54,20 @@ class SimCtrl(SimCtrlPathDB):
             self.table_size     = sim_core.get_node_attr(nd, 'table_size')
 
 
-    class LinkRec:
-        """Record of link attributes at controller.
-        """
-        def __init__(self, lk, sim_core):
-            """Constructor of LinkRec class.
-
-            Args:
-                sim_core (Instance of SimCore)
-                lk (2-tuple of str): Link key, which is a 2-tuple of node names.
-            """
-            self.cap            = sim_core.get_link_attr(lk[0], lk[1], 'cap')
-            self.usage          = 0.0
-            self.util           = 0.0
-            self.unasgn_bw      = self.cap
-            self.flows          = []
-            self.unasgn_flows   = []
-
-
-    class FlowRec:
+    class FlowRec(object):
         """Record of flow attributes at controller.
         """
+        __slots__ = ('src_node', 'dst_node', 'path', 'link_ids', 'cnt')
+
         def __init__(self, fl, sim_core):
             """Constructor of FlowRec class.
 
             """
-            flowobj             = sim_core.flows[fl]
-            self.src_node       = flowobj.src_node
-            self.dst_node       = flowobj.dst_node
-            self.path           = flowobj.path
-            self.links          = flowobj.links
+            t, i                = sim_core.flow_table, sim_core.flows[fl].fid
+            self.src_node       = t.src_node[i]
+            self.dst_node       = t.dst_node[i]
+            self.path           = t.path[i]
+            self.link_ids       = t.path[i].link_ids
             self.cnt            = 0.0
 
 
@@ -95,7 +89,9 @@ class SimCtrl(SimCtrlPathDB):
         self.topo.add_nodes_from(sim_core.topo.nodes())
         self.topo.add_edges_from(sim_core.topo.edges())
         self.noderecs   = {nd: SimCtrl.NodeRec(nd, sim_core) for nd in self.topo.nodes()}
-        self.linkrecs   = {lk: SimCtrl.LinkRec(lk, sim_core) for lk in self.topo.edges()}
+        self.link_caps  = sim_core.link_table.view('cap').copy()
+        self.link_eleph_flows = [[] for i in xrange(len(self.link_caps))]
+        self.n_link_eleph = np.zeros(len(self.link_caps), dtype=np.int64)
         self.flowrecs   = {}
         self.old_eleph_flows = {}
 
@@ -113,25 +109,20 @@ class SimCtrl(SimCtrlPathDB):
         return "Controller"
 
 
-    def install_flow_entry(self, src_ip, dst_ip):
-        """Install a flow entry (src_ip, dst_ip) as we've done at the SimSwitch instances.
+    def install_flow_entry(self, fl):
+        """Install a flow entry fl as we've done at the SimSwitch instances.
 
         Args:
-            path (list of string): Path of the flow, represented by a list of sw names.
-            src_ip (netaddr.IPAddress)
-            dst_ip (netaddr.IPAddress)
+            fl (int): Flow key, i.e. packed (src_ip, dst_ip) (see SimHostAddr)
 
         """
-        if (not (src_ip, dst_ip) in self.flowrecs):
-            fl = (src_ip, dst_ip)
+        if (not fl in self.flowrecs):
             self.flowrecs[fl]     = SimCtrl.FlowRec(fl, self.sim_core)
 
 
-    def remove_flow_entry(self, src_ip, dst_ip):
+    def remove_flow_entry(self, fl):
         """
         """
-        fl = (src_ip, dst_ip)
-
         if (fl in self.flowrecs):
             del self.flowrecs[fl]
 
@@ -151,6 +142,7 @@ class SimCtrl(SimCtrlPathDB):
         """
         for fl in self.flowrecs:
             flowobj                 = self.sim_core.flows[fl]
+            flowobj.update_flow(ev_time)
             self.flowrecs[fl].cnt   = flowobj.cnt
             flowobj.cnt             = 0.0
             flowobj.collect_time    = ev_time
@@ -158,61 +150,61 @@ class SimCtrl(SimCtrlPathDB):
 
     def comB(self):
         """Compute max-min fair BW, considering only flows in old_eleph_flows.
-        """
-        unproc_links                = []
 
-        for lk in self.linkrecs:
-            lkrec                   = self.linkrecs[lk]
-            lkrec.unasgn_bw         = lkrec.cap
-            lkrec.flows             = []
-            lkrec.unasgn_flows      = []
+        Extra Notes:
+            Per-link states are kept in lists indexed by link ID, starting from the
+            controller's snapshot of link capacities (self.link_caps).
+
+        """
+        n_links                 = len(self.link_caps)
+        unasgn_bw               = self.link_caps.tolist()
+        unasgn_flows            = [[] for i in xrange(n_links)]
+        self.link_eleph_flows   = [[] for i in xrange(n_links)]
+        unproc_links            = []
 
         for fl in self.old_eleph_flows:
-            for lk in self.flowrecs[fl].links:
-                lkrec = self.linkrecs[lk]
-                lkrec.flows.append(fl)
-                lkrec.unasgn_flows.append(fl)
-                if (not lk in unproc_links):
-                    unproc_links.append(lk)
+            for i in self.flowrecs[fl].link_ids:
+                self.link_eleph_flows[i].append(fl)
+                unasgn_flows[i].append(fl)
+                if (not i in unproc_links):
+                    unproc_links.append(i)
+        self.n_link_eleph = np.array([len(flows) for flows in self.link_eleph_flows], \
+                                     dtype=np.int64)
 
         while (len(unproc_links) > 0):
-            btnk_link = ''
+            btnk_link = -1
             btnk_bw   = float('inf')
 
             to_remove_unproc_links = []
-            for lk in unproc_links:
-                lkrec = self.linkrecs[lk]
-                if (lkrec.unasgn_flows == []):
-                    to_remove_unproc_links.append(lk)
+            for i in unproc_links:
+                if (unasgn_flows[i] == []):
+                    to_remove_unproc_links.append(i)
                 else:
-                    bw_per_flow = lkrec.unasgn_bw / len(lkrec.unasgn_flows)
+                    bw_per_flow = unasgn_bw[i] / len(unasgn_flows[i])
                     if (bw_per_flow < btnk_bw):
-                        btnk_link = lk
+                        btnk_link = i
                         btnk_bw   = bw_per_flow
 
-            for lk in to_remove_unproc_links:   unproc_links.remove(lk)
+            for i in to_remove_unproc_links:    unproc_links.remove(i)
 
             if (unproc_links == []):    break
 
-            btnk_lkrec = self.linkrecs[btnk_link]
-            for fl in btnk_lkrec.unasgn_flows:
+            for fl in unasgn_flows[btnk_link]:
                 self.old_eleph_flows[fl] = btnk_bw
-                for lk in self.flowrecs[fl].links:
-                    lkrec = self.linkrecs[lk]
-                    lkrec.unasgn_flows.remove(fl)
-                    lkrec.unasgn_bw -= btnk_bw
+                for i in self.flowrecs[fl].link_ids:
+                    unasgn_flows[i].remove(fl)
+                    unasgn_bw[i] -= btnk_bw
 
             unproc_links.remove(btnk_link)
 
 
-    def get_oab_on_link(self, lk):
+    def get_oab_on_link(self, lid):
         """
         """
-        lkrec   = self.linkrecs[lk]
-        cap     = lkrec.cap
-        flows   = lkrec.flows
+        cap     = float(self.link_caps[lid])
+        flows   = self.link_eleph_flows[lid]
         n_old_eleph     = len(self.old_eleph_flows)
-        sorted_flows    = sorted(lkrec.flows, key=lambda x: self.old_eleph_flows[x], reverse=True)
+        sorted_flows    = sorted(flows, key=lambda x: self.old_eleph_flows[x], reverse=True)
         tilda_flows     = []
 
         for i in range(len(sorted_flows) - 1):
@@ -237,12 +229,11 @@ class SimCtrl(SimCtrlPathDB):
         return oab_link
 
 
-    def get_maxmin_bw_on_link(self, lk):
+    def get_maxmin_bw_on_link(self, lid):
         """
         """
-        lkrec   = self.linkrecs[lk]
-        cap     = lkrec.cap
-        bw      = float(cap) / (len(lkrec.flows) + 1)
+        cap     = float(self.link_caps[lid])
+        bw      = cap / (len(self.link_eleph_flows[lid]) + 1)
 
         return bw
 
@@ -250,17 +241,15 @@ class SimCtrl(SimCtrlPathDB):
     def get_oab_on_path(self, pth):
         """
         """
-        links = self.sim_core.get_links_on_path(pth)
-        oab_path = min([self.get_oab_on_link(lk) for lk in links])
+        oab_path = min([self.get_oab_on_link(i) for i in pth.link_ids])
         return oab_path
 
 
     def get_maxmin_bw_on_path(self, pth):
+        """Smallest get_maxmin_bw_on_link() over the links of pth, as an array min.
         """
-        """
-        links = self.sim_core.get_links_on_path(pth)
-        maxmin_bw_path = min([self.get_maxmin_bw_on_link(lk) for lk in links])
-        return maxmin_bw_path
+        link_bw = self.link_caps.take(pth.link_ids) / (self.n_link_eleph.take(pth.link_ids) + 1)
+        return link_bw.min()
 
 
     def get_best_reroute_path(self, path_set):
@@ -301,26 +290,42 @@ class SimCtrl(SimCtrlPathDB):
             # Commit path change of the selected new eleph flow
             flowobj = self.sim_core.flows[fl]
             if (not flowobj.path == best_path):
+                # Finished flows waiting for idle timeout only have their entries moved
+                is_active       = (flowobj.status == FLOW_ACTIVE)
                 old_path        = flowobj.path
                 old_links       = flowobj.links
                 new_path        = best_path
                 new_links       = self.sim_core.get_links_on_path(best_path)
+                if (is_active):
+                    # Bytes sent so far are credited to the old path
+                    self.sim_core.update_link_byte_cnt(ev_time)
+                    self.sim_core.add_flow_rate(flowobj, -flowobj.curr_rate)
+                    self.sim_core.path_class_leave(fl, flowobj)
                 # Remove flow from old path
                 for lk in old_links:
                     linkobj = self.sim_core.linkobjs[lk]
-                    linkobj.n_active_flows -= 1
-                    linkobj.remove_flow_entry(fl[0], fl[1])
+                    if (is_active):
+                        linkobj.deactivate_flow(fl)
+                    linkobj.remove_flow_entry(fl)
                 for nd in old_path:
                     nodeobj = self.sim_core.nodeobjs[nd]
-                    nodeobj.remove_flow_entry(fl[0], fl[1])
+                    nodeobj.remove_flow_entry(fl)
 
                 # Install flow to new path
-                self.sim_core.install_entries_to_path(new_path, new_links, fl[0], fl[1])
+                self.sim_core.install_entries_to_path(new_path, new_links, fl)
                 flowobj.path = new_path
                 flowobj.links = new_links
-                for lk in new_links:
-                    linkobj = self.sim_core.linkobjs[lk]
-                    linkobj.n_active_flows += 1
+                if (is_active):
+                    for lk in new_links:
+                        linkobj = self.sim_core.linkobjs[lk]
+                        linkobj.activate_flow(fl, flowobj)
+                    if (self.sim_core.is_rate_approx()):
+                        self.sim_core.release_flow_rate(ev_time, flowobj)
+                    else:
+                        self.sim_core.add_flow_rate(flowobj, flowobj.curr_rate)
+                    self.sim_core.path_class_join(fl, flowobj)
+                    self.sim_core.changed_links.update(old_links)
+                    self.sim_core.changed_links.update(new_links)
                 # Update controller
                 self.flowrecs[fl].path = new_path
                 # Increment counter
@@ -359,8 +364,8 @@ class SimCtrl(SimCtrlPathDB):
         """ECMP routing: randomly choose among several ECMP routes.
 
         Args:
-            src_ip (netaddr.IPAddress)
-            dst_ip (netaddr.IPAddress)
+            src_node (str)
+            dst_node (str)
 
         Returns:
             list of strings: Chosen path
@@ -380,8 +385,8 @@ class SimCtrl(SimCtrlPathDB):
         stdev of table util.
 
         Args:
-            src_ip (netaddr.IPAddress)
-            dst_ip (netaddr.IPAddress)
+            src_node (str)
+            dst_node (str)
 
         Returns:
             list of strings: Chosen path
@@ -412,29 +417,28 @@ class SimCtrl(SimCtrlPathDB):
 
 
     def find_path_bw(self, src_node, dst_node):
-        """
+        """Choose the feasible path with the highest bottleneck of cap / (# of active flows + 1)
+        over its links. Bottlenecks of all paths of the node pair are computed at once, as
+        array mins over SimCore.link_table columns (see SimCtrlPathDB.pathset_links).
         """
         # First check for feasibility of path. Make sure no overflow.
-        feasible_paths = [path for path in self.path_db[(src_node, dst_node)] \
-                          if ( self.is_feasible(path) == True )]
+        paths       = self.path_db[(src_node, dst_node)]
+        feasible    = [(self.is_feasible(path) == True) for path in paths]
 
-        if (len(feasible_paths) == 1):
-            return feasible_paths[0]
+        if (feasible.count(True) == 1):
+            return paths[feasible.index(True)]
+
+        lt              = self.sim_core.link_table
+        link_bw         = lt.view('cap') / (lt.view('n_active_flows') + 1)
+        link_ids, ptr   = self.pathset_links[(src_node, dst_node)]
+        path_bw         = np.minimum.reduceat(link_bw.take(link_ids), ptr).tolist()
 
         # Find the best table LB path
         best_bw     = 0.0
         best_path       = []
 
-        for path in feasible_paths:
-            btnk_bw = float('inf')
-            for lk in self.sim_core.get_links_on_path(path):
-                cap = self.sim_core.get_link_attr(lk[0], lk[1], 'cap')
-                n_flows = self.sim_core.get_link_attr(lk[0], lk[1], 'n_active_flows') + 1
-                avail_bw = float(cap) / n_flows
-                if avail_bw < btnk_bw:
-                    btnk_bw = avail_bw
-
-            if (btnk_bw > best_bw):
+        for path, is_feasible, btnk_bw in zip(paths, feasible, path_bw):
+            if (is_feasible and btnk_bw > best_bw):
                 best_bw = btnk_bw
                 best_path = path
 
@@ -456,7 +460,11 @@ class SimCtrl(SimCtrlPathDB):
                     if (not nd in path):
                         break
 
-        return path
+        # Paths are built into SimPaths once, and cached
+        key = tuple(path)
+        if (not key in self.ecmp_paths):
+            self.ecmp_paths[key] = self.sim_core.make_path(path)
+        return self.ecmp_paths[key]
 
 
     def find_path(self, src_ip, dst_ip):
@@ -466,8 +474,8 @@ class SimCtrl(SimCtrlPathDB):
         3. If no feasible path (due to table overflow), return [].
 
         Args:
-            src_ip (netaddr.IPAddress)
-            dst_ip (netaddr.IPAddress)
+            src_ip (int)
+            dst_ip (int)
 
         Returns:
             list of strings: Chosen path
@@ -490,3 +498,9 @@ class SimCtrl(SimCtrlPathDB):
             path = self.find_path_random(src_node, dst_node)    # default to 'random'
         return path
 
+
+
+# Nested record classes are exported at module level, so that pickle can locate them
+# when saving a checkpoint (see SimCoreCheckpoint).
+NodeRec = SimCtrl.NodeRec
+FlowRec = SimCtrl.FlowRec
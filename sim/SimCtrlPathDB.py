@@ -12,6 +12,7 @@ import sys
 #import os
 # Third-party modules
 import networkx as nx
+import numpy as np
 # User-defined modules
 import SimConfig as cfg
 
@@ -29,6 +30,10 @@ class SimCtrlPathDB:
 
         Return:
             path_db (dict): Path database.
+            pathset_links (dict): Link IDs of the paths of each src-dst node pair, as
+                                  2-tuple (link IDs of all paths, concatenated in path DB
+                                  order; offset of each path's first link ID). Used for
+                                  per-path array mins over link columns (see find_path_bw).
 
         Extra Notes:
             - Currently supported routing modes:
@@ -52,8 +57,18 @@ class SimCtrlPathDB:
                         path_db[(src, dst)] = self.build_pathdb_one_shortest(src, dst)
                     else:
                         path_db[(src, dst)] = self.build_pathdb_all_shortest(src, dst)  # default to all_shortest
+                    # Paths carry their links and link IDs (see SimPath)
+                    path_db[(src, dst)] = [self.sim_core.make_path(pth) \
+                                           for pth in path_db[(src, dst)]]
         self.path_db = path_db
 
+        self.pathset_links = {}
+        for sd_pair in path_db:
+            pathset = path_db[sd_pair]
+            self.pathset_links[sd_pair] = \
+                (np.array(sum((pth.link_ids for pth in pathset), ()), dtype=np.intp), \
+                 np.cumsum([0] + [len(pth.link_ids) for pth in pathset[:-1]]))
+
         # Build ECMP database if needed
         if (cfg.ROUTING_MODE == 'ecmp'):
             self.build_ecmp_db()
@@ -197,13 +212,16 @@ class SimCtrlPathDB:
 
 
     def build_ecmp_db(self):
-        """
+        """Build the next hop database of ECMP routing, and the SimPath cache of paths
+        chosen by ECMP (see SimCtrl.find_path_ecmp), starting with those of the path DB.
         """
         ecmp_db = {}
+        self.ecmp_paths = {}
         for src, dst in self.path_db:
             if (not (src, dst) in ecmp_db):
                 ecmp_db[(src, dst)] = {}
             for pth in self.path_db[(src, dst)]:
+                self.ecmp_paths[tuple(pth)] = pth
                 for i in range(len(pth)-1):
                     nd = pth[i]
                     next_hop = pth[i+1]
@@ -10,34 +10,59 @@ __copyright__   = 'Copyright 2014, NYU-Poly'
 # Built-in modules
 import inspect
 # Third-party modules
-import netaddr as na
 # User-defined modules
 import SimConfig as cfg
 
 
-class SimEvent:
+# Integer event type codes. Each SimEvent subclass carries one of these as its ev_type,
+# and SimCore dispatches events by indexing its handler table with it.
+EV_NOTYPE           = 0
+EV_FLOW_ARRIVAL     = 1
+EV_PACKET_IN        = 2
+EV_FLOW_INSTALL     = 3
+EV_FLOW_END         = 4
+EV_IDLE_TIMEOUT     = 5
+EV_HARD_TIMEOUT     = 6
+EV_PULL_STATS       = 7
+EV_LOG_LINK_UTIL    = 8
+EV_LOG_TABLE_UTIL   = 9
+EV_COLLECT_CNT      = 10
+EV_REROUTE          = 11
+
+EV_NAMES = ['notype', 'EvFlowArrival', 'EvPacketIn', 'EvFlowInstall', 'EvFlowEnd',
+            'EvIdleTimeout', 'EvHardTimeout', 'EvPullStats', 'EvLogLinkUtil',
+            'EvLogTableUtil', 'EvCollectCnt', 'EvReroute']
+N_EV_TYPES = len(EV_NAMES)
+
+
+class SimEvent(object):
     """Base class of events, which is going to be queued in event queue under SimCore.
 
     Attributes:
-        ev_type (str): Explicitly illustrates the event's type
-                  (FlowArrival, FlowEnd, CollectStats, etc.)
+        ev_type (int): Event type code (EV_FLOW_ARRIVAL, EV_FLOW_END, etc.).
+                       Defined as a class attribute by each child class.
         ev_time (float64): Time of event occurence
 
     Extra Notes:
         1. Event types:
            FlowArrival, PacketIn, FlowInstall, FlowEnd,
            IdleTimeout, HardTimeout, CollectStats, DoReroute
+        2. Events are __slots__ classes, so that millions of them can be allocated without
+           a per-instance __dict__. Constructors take positional arguments (keyword
+           arguments also work) in the order listed under Attributes.
 
     """
+    __slots__ = ('ev_time',)
 
-    def __init__(self, **kwargs):
+    ev_type = EV_NOTYPE
+
+    def __init__(self, ev_time=0.0):
         """Constructor of Event class. Will be overriden by child classes.
         """
-        self.ev_type = kwargs.get('ev_type', 'notype')
-        self.ev_time = kwargs.get('ev_time', 0.0)
+        self.ev_time = ev_time
 
     def __str__(self):
-        ret = 'Event type: %s\n' %(self.ev_type)     # Header line shows event type
+        ret = 'Event type: %s\n' %(EV_NAMES[self.ev_type])   # Header line shows event type
         ret += '    Event time: %.6f\n' %(self.ev_time)
 
         attrs = ([attr for attr in dir(self)
@@ -56,158 +81,193 @@ class EvFlowArrival(SimEvent):
     """Event that signals arrival of a flow, and will trigger a PacketIn event.
 
     Attributes:
-        ev_type (str): 'EvFlowArrival'
-        src_ip (netaddr.ip.IPAddress): Source IP
-        dst_ip (netaddr.ip.IPAddress): Destination IP
+        ev_type (int): EV_FLOW_ARRIVAL
+        src_ip (int): Source host IP (see SimHostAddr)
+        dst_ip (int): Destination host IP
         flow_size (float64): Number of bytes to be transmitted in this flow.
         flow_rate (float64): The maximum data rate (bytes per sec) this flow can transmit.
                              Currently not supported.
     """
+    __slots__ = ('src_ip', 'dst_ip', 'flow_size', 'flow_rate')
+
+    ev_type = EV_FLOW_ARRIVAL
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvFlowArrival', ev_time=kwargs.get('ev_time', 0.0))
-        self.src_ip = kwargs.get('src_ip', na.IPAddress(0))
-        self.dst_ip = kwargs.get('dst_ip', na.IPAddress(0))
-        self.flow_size = kwargs.get('flow_size', 0.0)
-        self.flow_rate = kwargs.get('flow_rate', 0.0)
+    def __init__(self, ev_time=0.0, src_ip=None, dst_ip=None, flow_size=0.0, flow_rate=0.0):
+        self.ev_time   = ev_time
+        self.src_ip    = src_ip
+        self.dst_ip    = dst_ip
+        self.flow_size = flow_size
+        self.flow_rate = flow_rate
 
 
 class EvPacketIn(SimEvent):
     """Event that signals an OpenFlow packet-in request's arrival at the controller.
 
     Attributes:
-        ev_type (str): 'EvPacketIn'
-        src_ip (netaddr.ip.IPAddress): Source IP
-        dst_ip (netaddr.ip.IPAddress): Destination IP
+        ev_type (int): EV_PACKET_IN
+        src_ip (int): Source host IP (see SimHostAddr)
+        dst_ip (int): Destination host IP
         src_node (string): Source SW
         dst_node (string): Dest SW
     """
+    __slots__ = ('src_ip', 'dst_ip', 'src_node', 'dst_node')
+
+    ev_type = EV_PACKET_IN
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvPacketIn', ev_time=kwargs.get('ev_time', 0.0))
-        self.src_ip = kwargs.get('src_ip', na.IPAddress(0))
-        self.dst_ip = kwargs.get('dst_ip', na.IPAddress(0))
-        self.src_node = kwargs.get('src_node', 'unknown')
-        self.dst_node = kwargs.get('dst_node', 'unknown')
+    def __init__(self, ev_time=0.0, src_ip=None, dst_ip=None, \
+                 src_node='unknown', dst_node='unknown'):
+        self.ev_time  = ev_time
+        self.src_ip   = src_ip
+        self.dst_ip   = dst_ip
+        self.src_node = src_node
+        self.dst_node = dst_node
 
 
 class EvFlowInstall(SimEvent):
     """Event that signals installation of a flow at switches along selected path.
 
     Attributes:
-        ev_type (str): 'EvFlowInstall'
-        src_ip (netaddr.ip.IPAddress): Source IP
-        dst_ip (netaddr.ip.IPAddress): Destination IP
+        ev_type (int): EV_FLOW_INSTALL
+        src_ip (int): Source host IP (see SimHostAddr)
+        dst_ip (int): Destination host IP
         src_node (string): Source SW
         dst_node (string): Dest SW
         path (list of str): An ordered list of switch names along the path.
     """
+    __slots__ = ('src_ip', 'dst_ip', 'src_node', 'dst_node', 'path')
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvFlowInstall', ev_time=kwargs.get('ev_time', 0.0))
-        self.src_ip = kwargs.get('src_ip', na.IPAddress(0))
-        self.dst_ip = kwargs.get('dst_ip', na.IPAddress(0))
-        self.src_node = kwargs.get('src_node', 'unknown')
-        self.dst_node = kwargs.get('dst_node', 'unknown')
-        self.path = kwargs.get('path', [])
+    ev_type = EV_FLOW_INSTALL
+
+    def __init__(self, ev_time=0.0, src_ip=None, dst_ip=None, \
+                 src_node='unknown', dst_node='unknown', path=None):
+        self.ev_time  = ev_time
+        self.src_ip   = src_ip
+        self.dst_ip   = dst_ip
+        self.src_node = src_node
+        self.dst_node = dst_node
+        self.path     = path if (path is not None) else []
 
 
 class EvFlowEnd(SimEvent):
     """Event that signals end of a flow, and will trigger a IdleTimeout event.
 
     Attributes:
-        ev_type (str): 'EvFlowEnd'
-        src_ip (netaddr.ip.IPAddress): Source IP
-        dst_ip (netaddr.ip.IPAddress): Destination IP
+        ev_type (int): EV_FLOW_END
+        src_ip (int): Source host IP (see SimHostAddr)
+        dst_ip (int): Destination host IP
     """
+    __slots__ = ('src_ip', 'dst_ip')
+
+    ev_type = EV_FLOW_END
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvFlowEnd', ev_time=kwargs.get('ev_time', 0.0))
-        self.src_ip = kwargs.get('src_ip', na.IPAddress(0))
-        self.dst_ip = kwargs.get('dst_ip', na.IPAddress(0))
+    def __init__(self, ev_time=0.0, src_ip=None, dst_ip=None):
+        self.ev_time = ev_time
+        self.src_ip  = src_ip
+        self.dst_ip  = dst_ip
 
 
 class EvIdleTimeout(SimEvent):
     """Event that signals idle timeout of a flow and consequent removal of its entries.
 
     Attributes:
-        ev_type (str): 'EvIdleTimeout'
-        src_ip (netaddr.ip.IPAddress): Source IP
-        dst_ip (netaddr.ip.IPAddress): Destination IP
+        ev_type (int): EV_IDLE_TIMEOUT
+        src_ip (int): Source host IP (see SimHostAddr)
+        dst_ip (int): Destination host IP
     """
+    __slots__ = ('src_ip', 'dst_ip')
+
+    ev_type = EV_IDLE_TIMEOUT
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvIdleTimeout', ev_time=kwargs.get('ev_time', 0.0))
-        self.src_ip = kwargs.get('src_ip', na.IPAddress(0))
-        self.dst_ip = kwargs.get('dst_ip', na.IPAddress(0))
+    def __init__(self, ev_time=0.0, src_ip=None, dst_ip=None):
+        self.ev_time = ev_time
+        self.src_ip  = src_ip
+        self.dst_ip  = dst_ip
 
 
 class EvHardTimeout(SimEvent):
     """Event that signals hard timeout of a flow and consequent re-request of its entries.
 
     Attributes:
-        ev_type (str): 'EvHardTimeout'
-        src_ip (netaddr.ip.IPAddress): Source IP
-        dst_ip (netaddr.ip.IPAddress): Destination IP
+        ev_type (int): EV_HARD_TIMEOUT
+        src_ip (int): Source host IP (see SimHostAddr)
+        dst_ip (int): Destination host IP
 
     """
+    __slots__ = ('src_ip', 'dst_ip')
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvHardTimeout', ev_time=kwargs.get('ev_time', 0.0))
-        self.src_ip = kwargs.get('src_ip', na.IPAddress(0))
-        self.dst_ip = kwargs.get('dst_ip', na.IPAddress(0))
+    ev_type = EV_HARD_TIMEOUT
+
+    def __init__(self, ev_time=0.0, src_ip=None, dst_ip=None):
+        self.ev_time = ev_time
+        self.src_ip  = src_ip
+        self.dst_ip  = dst_ip
 
 
 class EvPullStats(SimEvent):
     """Event that signals controller's pulling flow-level statistics.
 
     Attributes:
-        ev_type (str): 'EvPullStats'
+        ev_type (int): EV_PULL_STATS
     """
+    __slots__ = ()
+
+    ev_type = EV_PULL_STATS
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvPullStats', ev_time=kwargs.get('ev_time', 0.0))
+    def __init__(self, ev_time=0.0):
+        self.ev_time = ev_time
 
 
 class EvLogLinkUtil(SimEvent):
     """Event that signals the simulation core to log link utilizations.
 
     Attributes:
-        ev_type (str): 'EvLogLinkUtil'
+        ev_type (int): EV_LOG_LINK_UTIL
     """
+    __slots__ = ()
+
+    ev_type = EV_LOG_LINK_UTIL
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvLogLinkUtil', ev_time=kwargs.get('ev_time', 0.0))
+    def __init__(self, ev_time=0.0):
+        self.ev_time = ev_time
 
 
 class EvLogTableUtil(SimEvent):
     """Event that signals the simulation core to log link utilizations.
 
     Attributes:
-        ev_type (str): 'EvLogLinkUtil'
+        ev_type (int): EV_LOG_TABLE_UTIL
     """
+    __slots__ = ()
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvLogTableUtil', ev_time=kwargs.get('ev_time', 0.0))
+    ev_type = EV_LOG_TABLE_UTIL
+
+    def __init__(self, ev_time=0.0):
+        self.ev_time = ev_time
 
 
 class EvCollectCnt(SimEvent):
     """Event that signals the controller to collect counters from simulation core.
 
     Attributes:
-        ev_type (str): 'EvCollectCnt'
+        ev_type (int): EV_COLLECT_CNT
     """
+    __slots__ = ()
+
+    ev_type = EV_COLLECT_CNT
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvCollectCnt', ev_time=kwargs.get('ev_time', 0.0))
+    def __init__(self, ev_time=0.0):
+        self.ev_time = ev_time
 
 
 class EvReroute(SimEvent):
     """Event that signals the simulated controllers to reroute elephant flows.
 
     Attributes:
-        ev_type (str): 'EvReroute'
+        ev_type (int): EV_REROUTE
     """
+    __slots__ = ()
+
+    ev_type = EV_REROUTE
 
-    def __init__(self, **kwargs):
-        SimEvent.__init__(self, ev_type='EvReroute', ev_time=kwargs.get('ev_time', 0.0))
\ No newline at end of file
+    def __init__(self, ev_time=0.0):
+        self.ev_time = ev_time
\ No newline at end of file
@@ -0,0 +1,426 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""sim/SimEventQueue.py: Event queue (scheduler) backends for SimCore.ev_queue.
+"""
+__author__      = 'Kuan-yin Chen'
+__copyright__   = 'Copyright 2014, NYU-Poly'
+
+# Built-in modules
+from heapq import heappush, heappop, heapify
+from bisect import insort
+# Third-party modules
+# User-defined modules
+
+INF = float('inf')
+
+
+class SimEventQueue:
+    """Base class of event queue backends. Implements cancellation by lazy deletion.
+
+    Attributes:
+        n_entries (int): Number of entries in queue, including cancelled ones.
+        n_cancelled (int): Number of cancelled entries (tombstones) still in queue.
+
+    Extra Notes:
+        1. All event queue backends share the same interface:
+           push(entry), pop(), peek(), peek_time(), cancel(entry) and len().
+        2. Entries are 4-lists [ev_time, ev_seq, ev_type, event], ordered by (ev_time, ev_seq).
+           push() returns the entry itself, which serves as the handle for cancel().
+        3. A cancelled entry stays in queue as a tombstone (its event is set to None) and is
+           skipped when it reaches the head. Once tombstones make up more than
+           COMPACT_RATIO of the queue (and there are at least COMPACT_MIN of them),
+           the queue is compacted.
+        4. Popped entries are also turned into tombstones, so cancelling an event that has
+           already been handled is a no-op.
+
+    """
+    COMPACT_MIN     = 1024
+    COMPACT_RATIO   = 0.5
+
+    def __init__(self):
+        self.n_entries      = 0
+        self.n_cancelled    = 0
+
+
+    def __len__(self):
+        return self.n_entries - self.n_cancelled
+
+
+    def cancel(self, entry):
+        """Cancel a scheduled entry.
+
+        Args:
+            entry (4-list): Handle returned by push()
+
+        """
+        if (entry[3] is None):
+            return      # Already cancelled or popped
+        entry[3] = None
+        self.n_cancelled += 1
+
+        if (self.n_cancelled >= SimEventQueue.COMPACT_MIN and \
+            self.n_cancelled > self.n_entries * SimEventQueue.COMPACT_RATIO):
+            self.compact()
+
+
+class HeapEventQueue(SimEventQueue):
+    """Event queue backed by a binary heap. O(log n) push and pop.
+
+    Attributes:
+        heap (list of 4-lists): heapq-ordered list of [ev_time, ev_seq, ev_type, event]
+
+    """
+    def __init__(self):
+        SimEventQueue.__init__(self)
+        self.heap = []
+
+
+    def push(self, entry):
+        """Push an entry into the queue.
+
+        Args:
+            entry (4-list): [ev_time, ev_seq, ev_type, event]
+
+        Returns:
+            4-list: The entry itself, as a handle for cancel().
+
+        """
+        heappush(self.heap, entry)
+        self.n_entries += 1
+        return entry
+
+
+    def pop(self):
+        """Pop the earliest live entry. Raises IndexError if queue is empty.
+
+        Returns:
+            4-tuple: (ev_time, ev_seq, ev_type, event)
+        """
+        heap = self.heap
+        while True:
+            entry = heappop(heap)
+            self.n_entries -= 1
+            event = entry[3]
+            if (event is None):
+                self.n_cancelled -= 1
+                continue
+            entry[3] = None
+            return entry[0], entry[1], entry[2], event
+
+
+    def peek(self):
+        """Return the earliest live entry without popping it, or None if queue is empty.
+        """
+        heap = self.heap
+        while (heap and heap[0][3] is None):
+            heappop(heap)
+            self.n_entries      -= 1
+            self.n_cancelled    -= 1
+        if (heap):
+            return heap[0]
+        return None
+
+
+    def peek_time(self):
+        """Return ev_time of the earliest live entry, or inf if queue is empty.
+        """
+        entry = self.peek()
+        if (entry is None):
+            return INF
+        return entry[0]
+
+
+    def compact(self):
+        """Drop all tombstones and re-heapify.
+        """
+        self.heap = [entry for entry in self.heap if (entry[3] is not None)]
+        heapify(self.heap)
+        self.n_entries      = len(self.heap)
+        self.n_cancelled    = 0
+
+
+class CalendarEventQueue(SimEventQueue):
+    """Event queue backed by a calendar queue (R. Brown, CACM 1988).
+    Amortized O(1) push and pop when event times are reasonably spread.
+
+    Attributes:
+        n_buckets (int): Number of buckets ("days" in a "year"). Always a power of 2.
+        width (float64): Time span covered by each bucket.
+        buckets (list of lists): Each bucket is a sorted list of entries.
+        cur_vb (int): Virtual bucket index (int(ev_time / width)) of the scan cursor.
+                      No entry in queue is earlier than the cursor bucket.
+        head (4-list): Cached earliest entry, or None if it has to be located again.
+
+    Extra Notes:
+        The number of buckets is doubled when n_entries exceeds 2*n_buckets and halved when it
+        drops below n_buckets/2. Bucket width is re-estimated on every resize from the
+        separation of the earliest queued events.
+
+    """
+    MIN_BUCKETS     = 2
+    N_SAMPLES       = 25    # Number of earliest entries sampled to estimate bucket width
+
+    def __init__(self, n_buckets=MIN_BUCKETS, width=1.0):
+        SimEventQueue.__init__(self)
+        self.cur_vb     = 0
+        self.head       = None
+        self.setup_buckets(n_buckets, width)
+
+
+    def setup_buckets(self, n_buckets, width):
+        """(Re-)initialize buckets and resize thresholds.
+        """
+        self.n_buckets  = n_buckets
+        self.width      = width
+        self.buckets    = [[] for i in range(n_buckets)]
+        self.grow_at    = 2 * n_buckets
+        self.shrink_at  = n_buckets / 2 - 2 if (n_buckets > CalendarEventQueue.MIN_BUCKETS) \
+                          else -1
+
+
+    def push(self, entry):
+        """Push an entry into the queue.
+
+        Args:
+            entry (4-list): [ev_time, ev_seq, ev_type, event]
+
+        Returns:
+            4-list: The entry itself, as a handle for cancel().
+
+        """
+        vb = int(entry[0] / self.width)
+        insort(self.buckets[vb % self.n_buckets], entry)
+        self.n_entries += 1
+
+        if (vb < self.cur_vb or self.n_entries == 1):
+            self.cur_vb = vb            # Entry is earlier than the scan cursor
+        if (self.head is not None and entry < self.head):
+            self.head = None
+
+        if (self.n_entries > self.grow_at):
+            self.resize(2 * self.n_buckets)
+
+        return entry
+
+
+    def locate_head(self):
+        """Advance the scan cursor to the bucket holding the earliest entry, and cache it.
+        Tombstones are not skipped here.
+        """
+        buckets     = self.buckets
+        n_buckets   = self.n_buckets
+        width       = self.width
+        vb          = self.cur_vb
+
+        # Scan at most one "year" of buckets, starting from the cursor
+        for i in range(n_buckets):
+            bucket = buckets[vb % n_buckets]
+            if (bucket and int(bucket[0][0] / width) <= vb):
+                self.cur_vb = vb
+                self.head   = bucket[0]
+                return
+            vb += 1
+
+        # Nothing due within a year: fall back to a direct search over bucket heads
+        self.head   = min([bucket[0] for bucket in buckets if bucket])
+        self.cur_vb = int(self.head[0] / width)
+
+
+    def pop_head(self):
+        """Remove and return the earliest entry, live or not.
+        """
+        if (self.n_entries == 0):
+            raise IndexError('pop from empty CalendarEventQueue')
+        if (self.head is None):
+            self.locate_head()
+
+        entry           = self.buckets[self.cur_vb % self.n_buckets].pop(0)
+        self.head       = None
+        self.n_entries  -= 1
+        if (entry[3] is None):
+            self.n_cancelled -= 1
+
+        if (self.n_entries < self.shrink_at):
+            self.resize(self.n_buckets / 2)
+
+        return entry
+
+
+    def pop(self):
+        """Pop the earliest live entry. Raises IndexError if queue is empty.
+
+        Returns:
+            4-tuple: (ev_time, ev_seq, ev_type, event)
+        """
+        while True:
+            entry = self.pop_head()
+            event = entry[3]
+            if (event is None):
+                continue
+            entry[3] = None
+            return entry[0], entry[1], entry[2], event
+
+
+    def peek(self):
+        """Return the earliest live entry without popping it, or None if queue is empty.
+        """
+        while True:
+            if (self.n_entries == 0):
+                return None
+            if (self.head is None):
+                self.locate_head()
+            if (self.head[3] is not None):
+                return self.head
+            self.pop_head()
+
+
+    def peek_time(self):
+        """Return ev_time of the earliest live entry, or inf if queue is empty.
+        """
+        entry = self.peek()
+        if (entry is None):
+            return INF
+        return entry[0]
+
+
+    def compact(self):
+        """Drop all tombstones. Bucket count is adjusted to the remaining number of entries.
+        """
+        n_buckets = self.n_buckets
+        while (n_buckets > CalendarEventQueue.MIN_BUCKETS and \
+               self.n_entries - self.n_cancelled < n_buckets / 2):
+            n_buckets /= 2
+        self.resize(n_buckets)
+
+
+    def resize(self, n_buckets):
+        """Re-distribute all live entries into n_buckets buckets with a re-estimated width.
+        Tombstones are dropped on the way.
+        """
+        entries = []
+        for bucket in self.buckets:
+            entries.extend([entry for entry in bucket if (entry[3] is not None)])
+        entries.sort()
+        self.n_entries      = len(entries)
+        self.n_cancelled    = 0
+
+        self.setup_buckets(n_buckets, self.estimate_width(entries))
+
+        width       = self.width
+        buckets     = self.buckets
+        for entry in entries:       # Already sorted, so appending keeps each bucket sorted
+            buckets[int(entry[0] / width) % n_buckets].append(entry)
+
+        self.head   = None
+        if (entries):
+            self.cur_vb = int(entries[0][0] / width)
+
+
+    def estimate_width(self, entries):
+        """Estimate bucket width as 3x the average separation of the earliest entries,
+        leaving out separations larger than twice the overall average.
+
+        Args:
+            entries (list of 4-lists): All entries in queue, sorted.
+
+        """
+        times   = [entry[0] for entry in entries[:CalendarEventQueue.N_SAMPLES]]
+        seps    = [times[i+1] - times[i] for i in range(len(times)-1)]
+        if (len(seps) == 0):
+            return self.width
+
+        avg_sep = sum(seps) / len(seps)
+        seps    = [sep for sep in seps if (sep <= 2.0 * avg_sep)]
+        avg_sep = sum(seps) / len(seps)
+
+        if (avg_sep <= 0.0):
+            return self.width
+        return 3.0 * avg_sep
+
+
+class PeriodicTimers:
+    """Registry of periodic tasks (logging, counter collection, reroute, etc.), kept outside
+    the event queue. Each task fires at a fixed period and reuses one event instance, so a
+    periodic tick costs neither an allocation nor an event queue push/pop.
+
+    Attributes:
+        timers (list of 5-lists): Each timer is [ev_time, ev_seq, ev_type, event, period],
+                                  where ev_time is the time it fires next.
+        head (5-list): Timer that fires first, or None if there are no timers.
+
+    Extra Notes:
+        1. The first four fields of a timer have the same layout as an event queue entry,
+           so the two can be compared directly. SimCore.main_course handles whichever of
+           ev_queue head, timers head and next flow end comes first.
+        2. A timer is rearmed, and takes a new ev_seq, as soon as it fires. Ties with
+           queued events are broken in FIFO order of scheduling, as in ev_queue.
+        3. The number of periodic tasks is small, so head is found by a linear scan.
+
+    """
+    def __init__(self):
+        self.timers = []
+        self.head   = None
+
+
+    def __len__(self):
+        return len(self.timers)
+
+
+    def add(self, timer):
+        """Add a periodic timer.
+
+        Args:
+            timer (5-list): [ev_time, ev_seq, ev_type, event, period]
+
+        Returns:
+            5-list: The timer itself, as a handle for cancel().
+
+        """
+        self.timers.append(timer)
+        self.update_head()
+        return timer
+
+
+    def cancel(self, timer):
+        """Remove a periodic timer. No-op if it has been removed already.
+        """
+        if (timer in self.timers):
+            self.timers.remove(timer)
+            self.update_head()
+
+
+    def cancel_type(self, ev_type):
+        """Remove all periodic timers of the given event type.
+        """
+        self.timers = [timer for timer in self.timers if (timer[2] != ev_type)]
+        self.update_head()
+
+
+    def rearm(self, timer, ev_seq):
+        """Advance a fired timer by one period.
+
+        Args:
+            timer (5-list): Handle returned by add()
+            ev_seq (int): New sequence number of the timer
+
+        """
+        timer[0] += timer[4]
+        timer[1] = ev_seq
+        self.update_head()
+
+
+    def peek_time(self):
+        """Return the time of the next firing timer, or inf if there are no timers.
+        """
+        if (self.head is None):
+            return INF
+        return self.head[0]
+
+
+    def update_head(self):
+        """Locate the timer that fires first.
+        """
+        if (self.timers):
+            self.head = min(self.timers)
+        else:
+            self.head = None
@@ -10,25 +10,32 @@ __copyright__   = 'Copyright 2014, NYU-Poly'
 # Built-in modules
 
 # Third-party modules
-import netaddr as na
+
 # User-defined modules
+from SimFlowTable import *
+from SimHostAddr import *
 
 
-class SimFlow:
+class SimFlow(object):
     """Class for a flow profile. Will be referred by SimCore and Controller.
+    A SimFlow is a view over one row of a SimFlowTable: its attributes are read from and
+    written to the table's columns.
 
     Attributes:
-        src_ip (netaddr.IPAddress)
-        dst_ip (netaddr.IPAddress)
+        table (SimFlowTable): Table that holds the flow's attributes
+        fid (int): Flow ID, i.e. row of the flow in table
+        src_ip (int): Source host IP (see SimHostAddr)
+        dst_ip (int): Dest host IP
         src_node (str)
         dst_node (str)
         path (list of str)
+        links (list of 2-tuples)
         flow_size (float64): Total number of bytes to be transmitted
         flow_rate (float64): Maximum data rate for this flow (limited by source & dest) in Bps
         curr_rate (float64): Current data rate for this flow (limited by network) in Bps
         bytes_left (float64): Bytes not yet sent at current time
         bytes_sent (float64): Bytes already sent at current time
-        status (str): Status of the flow ('requesting', 'active', 'idle')
+        status (int): Status of the flow, a FLOW_* code (see SimFlowTable)
         arrive_time (float64): Time when flow arrives at edge switch (before it is requested and installed)
         install_time (float64): Time when flow entries are installed to path switches
         end_time (float64): Time when flow transmission completes
@@ -37,74 +44,56 @@ class SimFlow:
         duration (float64): Flow duration
         resend (int): # of resent EvPacketIn events before flow got admitted
         reroute (int): # of times this flow being rerouted
+        assigned (int): Used in calc_flow_rates
+        path_class (SimPathClass): Path class the flow belongs to, if any
+        class_tag (float64): Finish tag in its path class (see SimPathClass)
+        ev_handle (4-list): Handle of the flow's pending event in SimCore.ev_queue
+                            (see SimCore.schedule_event)
 
     Extra Notes:
-        1. Possible flow status: 'requesting', 'active', 'finished', 'removed'
+        1. Possible flow status: FLOW_REQUESTING, FLOW_ACTIVE, FLOW_FINISHED, FLOW_REMOVED.
+           Their names ('requesting', etc.) are in FLOW_STATUS_NAMES, and are only used
+           for output.
+        2. Each attribute access is a property call. Per-event code and the rate
+           allocators index the table's columns directly (table.<col>[fid]) instead.
     """
+    __slots__ = ('table', 'fid')
 
-    def __init__(   self,
-                    src_ip          =na.IPAddress(0),
-                    dst_ip          =na.IPAddress(0),
-                    src_node        ='',
-                    dst_node        ='',
-                    path            =[],
-                    links           =[],
-                    flow_size       =0.0,
-                    flow_rate       =0.0,
-                    curr_rate       =0.0,
-                    avg_rate        =0.0,
-                    bytes_left      =0.0,
-                    bytes_sent      =0.0,
-                    status          = 'requesting',
-                    arrive_time     = float('inf'),
-                    install_time    = float('inf'),
-                    end_time        = float('inf'),
-                    est_end_time    = float('inf'),
-                    remove_time     = float('inf'),
-                    update_time     = float('inf'),
-                    collect_time    = float('inf'),
-                    duration        = float('inf'),
-                    resend          = 0,
-                    reroute         = 0,
-                    cnt             = 0
-                ):
-        """
+    def __init__(self, table, **kwargs):
+        """Allocate a row for a new flow in table.
+
+        Args:
+            table (SimFlowTable): Table to hold the flow's attributes
+            kwargs: Initial values of attributes. Others take the defaults in
+                    SimFlowTable.DEFAULTS.
 
         Extra Notes:
-            For any time-related attributes, -1.0 means not decided.
+            For any time-related attributes, inf means not decided.
         """
-        self.src_ip         = src_ip
-        self.dst_ip         = dst_ip
-        self.src_node       = src_node
-        self.dst_node       = dst_node
-        self.path           = path
-        self.links          = links
-        self.flow_size      = flow_size
-        self.flow_rate      = flow_rate
-        self.curr_rate      = curr_rate
-        self.avg_rate       = avg_rate
-        self.bytes_left     = bytes_left
-        self.bytes_sent     = bytes_sent
-        self.status         = status
-        self.arrive_time    = arrive_time
-        self.install_time   = install_time
-        self.end_time       = end_time
-        self.est_end_time   = est_end_time
-        self.remove_time    = remove_time
-        self.update_time    = update_time
-        self.collect_time   = collect_time
-        self.duration       = duration
-        self.resend         = resend
-        self.reroute        = reroute
-        self.cnt            = cnt
-
-        # These variables are used in calc_flow_rates
-        self.assigned       = False
+        self.table  = table
+        self.fid    = table.alloc()
+        for attr in kwargs:
+            getattr(table, attr)[self.fid] = kwargs[attr]
+
+
+    def free(self):
+        """Return the flow's row to its table. The flow must not be used afterwards.
+        """
+        self.table.free(self.fid)
+
+
+    @property
+    def key(self):
+        """Flow key, i.e. packed (src_ip, dst_ip) (see SimHostAddr.flow_key).
+        """
+        t, i = self.table, self.fid
+        return (t.src_ip[i] << 32) | t.dst_ip[i]
+
 
     def __str__(self):
         # Header is tuple of (src_ip, dst_ip); attribute name and value shown line by line
-        ret =   'Flow (%s -> %s)\n'         %(self.src_ip, self.dst_ip) + \
-                '    status: %s\n'          %(self.status) + \
+        ret =   'Flow (%s -> %s)\n'         %(ip_str(self.src_ip), ip_str(self.dst_ip)) + \
+                '    status: %s\n'          %(FLOW_STATUS_NAMES[self.status]) + \
                 '    src_node: %s\n'        %(self.src_node) + \
                 '    dst_node: %s\n'        %(self.dst_node) + \
                 '    path: %s\n'            %(self.path) + \
@@ -130,56 +119,77 @@ class SimFlow:
     def install_flow(self, ev_time, path, links):
         """Change the flow to 'active' status, and update states accordingly.
         """
-        self.status                 =   'active'
-        self.update_time            =   ev_time
-        self.install_time           =   ev_time
-        self.path                   =   path
-        self.links                  =   links
+        t, i                        =   self.table, self.fid
+        t.status[i]                 =   FLOW_ACTIVE
+        t.update_time[i]            =   ev_time
+        t.install_time[i]           =   ev_time
+        t.path[i]                   =   path
+        t.links[i]                  =   links
 
 
     def update_flow(self, ev_time):
         """Change the flow's states up to ev_time.
         """
+        t, i                        =   self.table, self.fid
         bytes_recent                =   0.0
 
         # If the flows's status is 'active', calculate the following states:
-        if (self.status == 'active'):
+        if (t.status[i] == FLOW_ACTIVE):
             # bytes_recent: For an active flow, the # of transmitted bytes
             #               since last state update
-            bytes_recent            =   self.curr_rate * (ev_time - self.update_time)
-            self.bytes_left         -=  bytes_recent
-            self.bytes_sent         =   self.flow_size - self.bytes_left
-            self.cnt                +=  bytes_recent
-            self.avg_rate           =   self.bytes_sent / (ev_time - self.arrive_time)
+            bytes_recent            =   t.curr_rate[i] * (ev_time - t.update_time[i])
+            t.bytes_left[i]         -=  bytes_recent
+            t.bytes_sent[i]         =   t.flow_size[i] - t.bytes_left[i]
+            t.cnt[i]                +=  bytes_recent
+            t.avg_rate[i]           =   t.bytes_sent[i] / (ev_time - t.arrive_time[i])
 
-        self.update_time            =   ev_time
+        t.update_time[i]            =   ev_time
         return bytes_recent
 
 
     def terminate_flow(self, ev_time):
         """Change the flow to 'finished' status, and update states accordingly.
         """
-        self.status         = 'finished'
-        self.update_time    = ev_time
-        self.end_time       = ev_time
-        self.est_end_time   = float('inf')
-        self.duration       = self.end_time - self.arrive_time
-        self.bytes_left     = 0.0       # To avoid tiny error caused by FP calculation
-        self.bytes_sent     = self.flow_size
-        self.curr_rate      = 0.0
+        t, i                = self.table, self.fid
+        t.status[i]         = FLOW_FINISHED
+        t.update_time[i]    = ev_time
+        t.end_time[i]       = ev_time
+        t.est_end_time[i]   = float('inf')
+        t.duration[i]       = ev_time - t.arrive_time[i]
+        t.bytes_left[i]     = 0.0       # To avoid tiny error caused by FP calculation
+        t.bytes_sent[i]     = t.flow_size[i]
+        t.curr_rate[i]      = 0.0
 
 
     def timeout_flow(self, ev_time):
         """Change the flow to 'removed' status, and update states accordingly.
         """
-        self.status         = 'removed'
-        self.update_time    = ev_time
-        self.remove_time    = ev_time
+        t, i                = self.table, self.fid
+        t.status[i]         = FLOW_REMOVED
+        t.update_time[i]    = ev_time
+        t.remove_time[i]    = ev_time
 
 
     def assign_bw(self, ev_time, asgn_bw):
         """When calculating flow BW, assign BW and change flag of the flow.
         """
-        self.curr_rate              = asgn_bw
-        self.est_end_time           = ev_time + (self.bytes_left / self.curr_rate)
-        self.assigned               = True
+        t, i                        = self.table, self.fid
+        t.curr_rate[i]              = asgn_bw
+        if (asgn_bw > 0.0):
+            t.est_end_time[i]       = ev_time + (t.bytes_left[i] / asgn_bw)
+        else:
+            t.est_end_time[i]       = float('inf')      # e.g. on a zero-capacity link
+        t.assigned[i]               = True
+
+
+def column_property(col):
+    """Property of SimFlow that reads and writes column col of the flow's table.
+    """
+    def fget(self):
+        return getattr(self.table, col)[self.fid]
+    def fset(self, val):
+        getattr(self.table, col)[self.fid] = val
+    return property(fget, fset)
+
+for col in SimFlowTable.COLUMNS:
+    setattr(SimFlow, col, column_property(col))
@@ -6,12 +6,11 @@ __author__      = 'Kuan-yin Chen'
 __copyright__   = 'Copyright 2014, NYU-Poly'
 
 # Built-in modules
-from heapq import heappush, heappop
 import random as rd
 import math
 # Third-party modules
 import networkx as nx
-import netaddr as na
+import numpy as np
 import numpy.random as nprd
 # User-defined modules
 import SimConfig as cfg
@@ -22,18 +21,34 @@ class SimFlowGen:
     """Flow Generator.
 
     Attributes:
-        hosts (dict): Hosts database. Key: Host IP, Value: attached edge switch.
+        hosts (dict): Hosts database. Key: Host IP (int), Value: attached edge switch.
                       Directly copy-assigned during SimFlowGen.__init__()
+        host_list (list of int): Host IPs in ascending order, to pick hosts from
 
     """
     def __init__(self, sim_core):
         self.sim_core = sim_core
         self.hosts = sim_core.hosts
+        self.host_list = sorted(self.hosts)
         self.nodes = sorted(sim_core.nodes)
 
         if (cfg.FLOWGEN_SRCDST_MODEL == 'gravity' or \
             cfg.FLOWGEN_SRCDST_MODEL == 'antigravity'):
             self.gravity_table, self.src_idx_table = self.build_gravity_table()
+            # numpy copies for pick_src_dst_gravity_batch()
+            self.gravity_array  = np.array(self.gravity_table)
+            self.src_idx_array  = np.array(self.src_idx_table)
+            self.node_base_ips  = np.array([sim_core.nodeobjs[nd].base_ip \
+                                            for nd in self.nodes], dtype=np.int64)
+            self.node_n_hosts   = np.array([max(sim_core.nodeobjs[nd].n_hosts, 1) \
+                                            for nd in self.nodes], dtype=np.int64)
+
+        # numpy copy of self.host_list, and indices of the hosts' edge switches in self.nodes.
+        # Used by the batch generators (see SimCoreFluid).
+        node_idx        = {nd: i for i, nd in enumerate(self.nodes)}
+        self.host_ips   = np.array(self.host_list, dtype=np.int64)
+        self.host_lans  = np.array([node_idx[self.hosts[ip]] for ip in self.host_list], \
+                                   dtype=np.intp)
 
 
     def build_gravity_table(self):
@@ -56,7 +71,7 @@ class SimFlowGen:
                     wt      = 0.0
                     if (cfg.FLOWGEN_SRCDST_MODEL == 'gravity'):
                         wt = float(n1 * n2) / (float(dist)**2)
-                    elif(cfg.FLOWGEN_SRCDST_MODEL == 'antigravity'):
+                    elif(cfg.FLOWGEN_SRCDST_MODEL == 'antigravity' and n1 * n2 > 0):
                         wt = (float(dist)**2) / float(n1 * n2)
                     total_weight += wt
                     value_list.append(total_weight)
@@ -83,8 +98,8 @@ class SimFlowGen:
         Args:
 
         Returns:
-            src_ip (netaddr.IPAddress)
-            dst_ip (netaddr.IPAddress)
+            src_ip (int)
+            dst_ip (int)
         """
         while True:
             rand_num = rd.uniform(0, 1)
@@ -106,12 +121,12 @@ class SimFlowGen:
             nd_dst = self.nodes[dst_idx]
 
             # Source and dest node chosen. Get IP addresses.
-            src_ip = na.IPAddress(rd.randint(int(self.sim_core.nodeobjs[nd_src].base_ip),   \
-                                             int(self.sim_core.nodeobjs[nd_src].end_ip) ))
-            dst_ip = na.IPAddress(rd.randint(int(self.sim_core.nodeobjs[nd_dst].base_ip),   \
-                                             int(self.sim_core.nodeobjs[nd_dst].end_ip) ))
+            src_ip = rd.randint(self.sim_core.nodeobjs[nd_src].base_ip,   \
+                                self.sim_core.nodeobjs[nd_src].end_ip)
+            dst_ip = rd.randint(self.sim_core.nodeobjs[nd_dst].base_ip,   \
+                                self.sim_core.nodeobjs[nd_dst].end_ip)
 
-            if (not (src_ip, dst_ip) in self.sim_core.flows):
+            if (not ((src_ip << 32) | dst_ip) in self.sim_core.flows):
                 break
 
         return src_ip, dst_ip
@@ -121,7 +136,7 @@ class SimFlowGen:
         """Given src_ip, pick a dst_ip using specified random model.
 
         Args:
-            src_ip (netaddr.IPAddress)
+            src_ip (int)
             sim_core (instance of SimCore)
 
         Extra Notes:
@@ -134,7 +149,7 @@ class SimFlowGen:
                 dst_ip = self.pick_dst_uniform(src_ip)
             else:
                 dst_ip = self.pick_dst_uniform(src_ip)  # Default to 'uniform'
-            if (not (src_ip, dst_ip) in sim_core.flows):
+            if (not ((src_ip << 32) | dst_ip) in sim_core.flows):
                 break   # Make sure src and dst host are not an existing flow
 
         return dst_ip
@@ -144,7 +159,7 @@ class SimFlowGen:
         """Given src_ip, pick a dst_ip using uniform random model.
 
         Args:
-            src_ip (netaddr.IPAddress)
+            src_ip (int)
 
         Extra Notes:
             src_ip and dst_ip will never be under the same edge node (switch).
@@ -152,7 +167,7 @@ class SimFlowGen:
         """
         dst_ip = 0
         while True:
-            dst_ip = rd.choice(self.hosts.keys())
+            dst_ip = rd.choice(self.host_list)
             if (not self.hosts[dst_ip] == self.hosts[src_ip]):
                 break   # Make sure src and dst host are not within the same LAN
         return dst_ip
@@ -245,6 +260,104 @@ class SimFlowGen:
         return fsize, frate
 
 
+    def gen_flow_size_rate_batch(self, n):
+        """Generate sizes and rates of n flows at once, according to specified random model.
+        Batch version of gen_flow_size_rate(), drawing from numpy.random.
+
+        Args:
+            n (int): Number of flows
+
+        Return:
+            numpy array of float64: Flow sizes, round to integral digit.
+            numpy array of float64: Flow rates.
+
+        """
+        if (cfg.FLOWGEN_SIZERATE_MODEL == 'bimodal'):
+            bm      = cfg.FLOWGEN_SIZERATE_BIMODAL
+            large   = nprd.uniform(0, 1, n) < bm.PROB_LARGE_FLOW
+            fsize   = np.where(large, nprd.uniform(bm.FLOW_SIZE_LARGE_LO, bm.FLOW_SIZE_LARGE_HI, n), \
+                                      nprd.uniform(bm.FLOW_SIZE_SMALL_LO, bm.FLOW_SIZE_SMALL_HI, n))
+            frate   = np.where(large, nprd.uniform(bm.FLOW_RATE_LARGE_LO, bm.FLOW_RATE_LARGE_HI, n), \
+                                      nprd.uniform(bm.FLOW_RATE_SMALL_LO, bm.FLOW_RATE_SMALL_HI, n))
+        elif (cfg.FLOWGEN_SIZERATE_MODEL == 'lognormal'):
+            ln      = cfg.FLOWGEN_SIZERATE_LOGNORMAL
+            fsize   = nprd.lognormal(mean=ln.FLOW_SIZE_MU, sigma=ln.FLOW_SIZE_SIGMA, size=n)
+            frate   = nprd.uniform(ln.FLOW_RATE_LO, ln.FLOW_RATE_HI, n)
+        else:
+            un      = cfg.FLOWGEN_SIZERATE_UNIFORM     # Default to 'uniform'
+            fsize   = nprd.uniform(un.FLOW_SIZE_LO, un.FLOW_SIZE_HI, n)
+            frate   = nprd.uniform(un.FLOW_RATE_LO, un.FLOW_RATE_HI, n)
+
+        return np.round(fsize, 0), frate
+
+
+    def pick_src_dst_batch(self, src_ips, live_keys):
+        """Pick (src, dst) host pairs of a batch of new flows, according to specified
+        random model. Batch version of pick_dst() and pick_src_dst_gravity().
+
+        Args:
+            src_ips (numpy array of int64): Source host IP of each new flow, or -1 to pick
+                                            one. Ignored by gravity and anti-gravity models.
+            live_keys (numpy array of int64): Keys (src_ip << 32 | dst_ip) of existing flows
+
+        Returns:
+            numpy array of int64: Source host IPs
+            numpy array of int64: Dest host IPs
+
+        Extra Notes:
+            As in pick_dst(), a picked pair never repeats an existing flow, nor another
+            pair of the same batch. Conflicting pairs are picked again.
+
+        """
+        n       = len(src_ips)
+        src     = src_ips.copy()
+        dst     = np.zeros(n, dtype=np.int64)
+        todo    = np.ones(n, dtype=bool)
+        gravity = (cfg.FLOWGEN_SRCDST_MODEL == 'gravity' or \
+                   cfg.FLOWGEN_SRCDST_MODEL == 'antigravity')
+
+        while (todo.any()):
+            idx = np.flatnonzero(todo)
+            if (gravity):
+                src[idx], dst[idx] = self.pick_src_dst_gravity_batch(len(idx))
+            else:
+                # Uniform: dst host is never within source host's LAN
+                pick        = idx[src[idx] < 0]
+                src[pick]   = self.host_ips[nprd.randint(0, len(self.host_ips), len(pick))]
+                same_lan    = idx
+                while (len(same_lan) > 0):
+                    dst[same_lan]   = self.host_ips[nprd.randint(0, len(self.host_ips), \
+                                                                 len(same_lan))]
+                    src_lan         = self.host_lans[np.searchsorted(self.host_ips, src[same_lan])]
+                    dst_lan         = self.host_lans[np.searchsorted(self.host_ips, dst[same_lan])]
+                    same_lan        = same_lan[src_lan == dst_lan]
+
+            # Pairs that repeat an existing flow, or an earlier pair of the batch
+            keys        = (src << 32) | dst
+            first       = np.zeros(n, dtype=bool)
+            first[np.unique(keys, return_index=True)[1]] = True
+            todo        = np.isin(keys, live_keys) | ~first
+
+        return src, dst
+
+
+    def pick_src_dst_gravity_batch(self, n):
+        """Pick n (src, dst) host pairs for gravity or anti-gravity models. Batch version of
+        pick_src_dst_gravity(), with the same use of one random number per pair.
+        """
+        n_nodes     = len(self.nodes)
+        rand_num    = nprd.uniform(0, 1, n)
+
+        # First index whose cumulative weight is no less than rand_num
+        src_idx     = np.minimum(np.searchsorted(self.src_idx_array, rand_num), n_nodes-1)
+        dst_idx     = np.minimum((self.gravity_array[src_idx] < rand_num[:, None]).sum(axis=1), \
+                                 n_nodes-1)
+
+        src = self.node_base_ips[src_idx] + nprd.randint(0, 2**31, n) % self.node_n_hosts[src_idx]
+        dst = self.node_base_ips[dst_idx] + nprd.randint(0, 2**31, n) % self.node_n_hosts[dst_idx]
+        return src, dst
+
+
     def gen_new_flow_with_src(self, ev_time, src_ip, sim_core):
         """
         """
@@ -253,8 +366,7 @@ class SimFlowGen:
         # Generate flow size and rate.
         fsize, frate = self.gen_flow_size_rate()                # Generate flow size
         # Generate an EvFlowArrival event and return it.
-        event = EvFlowArrival(ev_time=ev_time, src_ip=src_ip, dst_ip=dst, \
-                              flow_size=fsize, flow_rate=frate)
+        event = EvFlowArrival(ev_time, src_ip, dst, fsize, frate)
         return event
 
 
@@ -264,11 +376,36 @@ class SimFlowGen:
         # Generate flow size and rate.
         fsize, frate = self.gen_flow_size_rate()                # Generate flow size
         # Generate an EvFlowArrival event and return it.
-        event = EvFlowArrival(ev_time=ev_time, src_ip=src_ip, dst_ip=dst_ip, \
-                              flow_size=fsize, flow_rate=frate)
+        event = EvFlowArrival(ev_time, src_ip, dst_ip, fsize, frate)
         return event
 
 
+    def repick_flow_arr(self, ev_time, event, sim_core):
+        """Re-pick the hosts of an EvFlowArrival whose (src_ip, dst_ip) pair is taken by
+        another flow in sim_core.flows. Flow size and rate are kept.
+
+        Args:
+            ev_time (float64): Time of the new EvFlowArrival
+            event (EvFlowArrival): The colliding arrival
+            sim_core (instance of SimCore)
+
+        Returns:
+            EvFlowArrival: Arrival with a pair that is not in sim_core.flows
+
+        Extra Notes:
+            Pairs are only checked against sim_core.flows when an arrival is generated, so
+            two pending arrivals can pick the same pair, e.g. saturate arrivals with the
+            gravity models.
+
+        """
+        if (cfg.FLOWGEN_SRCDST_MODEL == 'gravity' or cfg.FLOWGEN_SRCDST_MODEL == 'antigravity'):
+            src_ip, dst_ip = self.pick_src_dst_gravity()
+        else:
+            src_ip = event.src_ip
+            dst_ip = self.pick_dst(src_ip, sim_core)
+        return EvFlowArrival(ev_time, src_ip, dst_ip, event.flow_size, event.flow_rate)
+
+
     def gen_new_flow_arr_saturate(self, ev_time, src_ip, sim_core):
         """
         """
@@ -292,13 +429,13 @@ class SimFlowGen:
         new_ev_time = ev_time + new_intarr_time
 
         if (cfg.FLOWGEN_SRCDST_MODEL == 'uniform'):
-            new_src_ip  = rd.choice(self.hosts.keys())
+            new_src_ip  = rd.choice(self.host_list)
             new_EvFlowArrival = self.gen_new_flow_with_src(new_ev_time, new_src_ip, sim_core)
         elif (cfg.FLOWGEN_SRCDST_MODEL == 'gravity' or cfg.FLOWGEN_SRCDST_MODEL == 'antigravity'):
             new_src_ip, new_dst_ip = self.pick_src_dst_gravity()
             new_EvFlowArrival = self.gen_new_flow_with_src_dst(new_ev_time, new_src_ip, new_dst_ip, sim_core)
         else:
-            new_src_ip  = rd.choice(self.hosts.keys()) # Default to 'uniform'
+            new_src_ip  = rd.choice(self.host_list) # Default to 'uniform'
             new_EvFlowArrival = self.gen_new_flow_with_src(new_ev_time, new_src_ip, sim_core)
 
         return new_ev_time, new_EvFlowArrival
@@ -311,45 +448,44 @@ class SimFlowGen:
         new_ev_time = ev_time + new_intarr_time
 
         if (cfg.FLOWGEN_SRCDST_MODEL == 'uniform'):
-            new_src_ip  = rd.choice(self.hosts.keys())
+            new_src_ip  = rd.choice(self.host_list)
             new_EvFlowArrival = self.gen_new_flow_with_src(new_ev_time, new_src_ip, sim_core)
         elif (cfg.FLOWGEN_SRCDST_MODEL == 'gravity' or cfg.FLOWGEN_SRCDST_MODEL == 'antigravity'):
             new_src_ip, new_dst_ip = self.pick_src_dst_gravity()
             new_EvFlowArrival = self.gen_new_flow_with_src_dst(new_ev_time, new_src_ip, new_dst_ip, sim_core)
         else:
-            new_src_ip  = rd.choice(self.hosts.keys()) # Default to 'uniform'
+            new_src_ip  = rd.choice(self.host_list) # Default to 'uniform'
             new_EvFlowArrival = self.gen_new_flow_with_src(new_ev_time, new_src_ip, sim_core)
 
         return new_ev_time, new_EvFlowArrival
 
 
-    def gen_init_flows(self, ev_queue, sim_core):
+    def gen_init_flows(self, sim_core):
         """When simulation starts, generate a set of initial flows.
         We generate exactly one initial flow for each source host.
-        The initial flows, as EvFlowArrival events, will be enqueued to ev_queue
+        The initial flows, as EvFlowArrival events, will be enqueued to sim_core's ev_queue
 
         Args:
-            ev_queue (list of instances inherited from SimEvent): Event queue
             sim_core (instance of SimCore): Simulation core
         """
         if (cfg.FLOWGEN_ARR_MODEL == 'saturate'):
             # For each host, generate one flow with the host as its src host.
             # New flows will be generated upon EvFlowEnd
-            for src_host in self.hosts:
+            for src_host in self.host_list:
                 ev_time = rd.uniform(0.0, cfg.FLOWGEN_ARR_SATURATE.INIT_FLOWS_SPREAD)
                 event   = self.gen_new_flow_with_src(ev_time, src_host, sim_core)
-                heappush(ev_queue, (ev_time, event))
+                sim_core.schedule_event(ev_time, event)
         elif (cfg.FLOWGEN_ARR_MODEL == 'const' or cfg.FLOWGEN_ARR_MODEL == 'exp'):
             ev_time     = 0.0
             # Generate a single new flow. New flows will be generated upon EvFlowArrival
             if (cfg.FLOWGEN_SRCDST_MODEL == 'uniform'):
-                src_host    = rd.choice(self.hosts.keys())
+                src_host    = rd.choice(self.host_list)
                 event       = self.gen_new_flow_with_src(ev_time, src_host, sim_core)
             elif (cfg.FLOWGEN_SRCDST_MODEL == 'gravity' or cfg.FLOWGEN_SRCDST_MODEL == 'antigravity'):
                 src_host, dst_host = self.pick_src_dst_gravity()
                 event = self.gen_new_flow_with_src_dst(ev_time, src_host, dst_host, sim_core)
             else:
-                src_host    = rd.choice(self.hosts.keys())  # Default to 'uniform'
+                src_host    = rd.choice(self.host_list)  # Default to 'uniform'
                 event       = self.gen_new_flow_with_src(ev_time, src_host, sim_core)
 
-            heappush(ev_queue, (ev_time, event))
+            sim_core.schedule_event(ev_time, event)
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""sim/SimFlowTable.py: Columnar storage of flow attributes, indexed by integer flow ID.
+SimFlow instances are views over its rows.
+"""
+__author__      = 'Kuan-yin Chen'
+__copyright__   = 'Copyright 2014, NYU-Poly'
+
+# Built-in modules
+from array import array
+# Third-party modules
+import numpy as np
+# User-defined modules
+
+
+# Flow status codes in SimFlowTable.status
+FLOW_FREE       = -1    # Slot is in the free list
+FLOW_REQUESTING = 0
+FLOW_ACTIVE     = 1
+FLOW_FINISHED   = 2
+FLOW_REMOVED    = 3
+FLOW_STATUS_NAMES = {FLOW_REQUESTING: 'requesting', FLOW_ACTIVE: 'active', \
+                     FLOW_FINISHED: 'finished', FLOW_REMOVED: 'removed'}
+
+
+class SimFlowTable:
+    """Attributes of all flows, one column per attribute. Row fid of every column belongs to
+    the flow with integer ID fid.
+
+    Attributes:
+        (float columns, array of 'd'): See FLOAT_COLUMNS
+        (int columns, array of 'l'): See INT_COLUMNS. status holds FLOW_* codes, and
+            src_ip / dst_ip hold integer host IPs (see SimHostAddr).
+        (object columns, list): See OBJECT_COLUMNS
+        free_ids (list of int): IDs of free rows, reused by alloc() before new rows are added
+
+    Extra Notes:
+        1. Numeric columns are array.array, so that single elements are read and written as
+           Python floats and ints, and whole columns can be viewed as numpy arrays without
+           copying (see view()).
+        2. A freed row keeps its numeric values until it is reused, but its object columns
+           are cleared so that paths, path classes and events can be garbage-collected.
+
+    """
+    FLOAT_COLUMNS   = ['flow_size', 'flow_rate', 'curr_rate', 'avg_rate', 'bytes_left', \
+                       'bytes_sent', 'arrive_time', 'install_time', 'end_time', 'est_end_time', \
+                       'remove_time', 'update_time', 'collect_time', 'duration', 'cnt', 'class_tag']
+    INT_COLUMNS     = ['status', 'resend', 'reroute', 'assigned', 'src_ip', 'dst_ip']
+    OBJECT_COLUMNS  = ['src_node', 'dst_node', 'path', 'links', 'path_class', 'ev_handle']
+    COLUMNS         = FLOAT_COLUMNS + INT_COLUMNS + OBJECT_COLUMNS
+
+    # Values of a newly allocated row. Lists (path, links) are created per row.
+    DEFAULTS = {'flow_size': 0.0, 'flow_rate': 0.0, 'curr_rate': 0.0, 'avg_rate': 0.0, \
+                'bytes_left': 0.0, 'bytes_sent': 0.0, 'arrive_time': float('inf'), \
+                'install_time': float('inf'), 'end_time': float('inf'), \
+                'est_end_time': float('inf'), 'remove_time': float('inf'), \
+                'update_time': float('inf'), 'collect_time': float('inf'), \
+                'duration': float('inf'), 'cnt': 0.0, 'class_tag': 0.0, \
+                'status': FLOW_REQUESTING, 'resend': 0, 'reroute': 0, 'assigned': 0, \
+                'src_ip': 0, 'dst_ip': 0, 'src_node': '', 'dst_node': '', \
+                'path': None, 'links': None, 'path_class': None, 'ev_handle': None}
+
+    def __init__(self):
+        for col in self.FLOAT_COLUMNS:
+            setattr(self, col, array('d'))
+        for col in self.INT_COLUMNS:
+            setattr(self, col, array('l'))
+        for col in self.OBJECT_COLUMNS:
+            setattr(self, col, [])
+        self.free_ids = []
+
+
+    def __len__(self):
+        """Number of allocated (not free) rows.
+        """
+        return len(self.status) - len(self.free_ids)
+
+
+    def alloc(self):
+        """Allocate a row with default values, reusing a free row if any.
+
+        Returns:
+            int: Flow ID of the row
+
+        """
+        defaults = self.DEFAULTS
+        if (self.free_ids):
+            fid = self.free_ids.pop()
+            for col in self.COLUMNS:
+                getattr(self, col)[fid] = defaults[col]
+        else:
+            fid = len(self.status)
+            for col in self.COLUMNS:
+                getattr(self, col).append(defaults[col])
+        self.path[fid]  = []
+        self.links[fid] = []
+        return fid
+
+
+    def free(self, fid):
+        """Return a row to the free list.
+        """
+        self.status[fid] = FLOW_FREE
+        for col in self.OBJECT_COLUMNS:
+            getattr(self, col)[fid] = None
+        self.free_ids.append(fid)
+
+
+    def view(self, col):
+        """Get a numpy view of a numeric column, indexed by flow ID. Free rows are included
+        (see status). The view shares memory with the column, so writes go to the table;
+        it must not be used after rows are allocated.
+        """
+        column = getattr(self, col)
+        dtype  = np.float64 if (column.typecode == 'd') else np.dtype('l')
+        if (len(column) == 0):
+            return np.zeros(0, dtype=dtype)
+        return np.frombuffer(column, dtype=dtype)
@@ -0,0 +1,48 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""sim/SimHostAddr.py: Integer host addresses and flow keys.
+
+Inside the simulator, host IPs are plain integers (e.g. 10.0.0.1 is 0x0A000001), and a flow
+is keyed by its packed 64-bit (src_ip << 32) | dst_ip. Both hash and compare as ints.
+Dotted-quad strings are only produced for output (see ip_str()).
+"""
+__author__      = 'Kuan-yin Chen'
+__copyright__   = 'Copyright 2014, NYU-Poly'
+
+# Built-in modules
+# Third-party modules
+# User-defined modules
+
+
+HOST_BASE_IP    = 0x0A000001    # 10.0.0.1, IP of the first host (see SimCore.create_hosts)
+NO_FLOW         = -1            # Flow key that matches no flow
+
+
+def flow_key(src_ip, dst_ip):
+    """Pack a (src_ip, dst_ip) pair into a flow key.
+    """
+    return (src_ip << 32) | dst_ip
+
+
+def key_src(fl):
+    """Source host IP of flow key fl.
+    """
+    return fl >> 32
+
+
+def key_dst(fl):
+    """Dest host IP of flow key fl.
+    """
+    return fl & 0xFFFFFFFF
+
+
+def ip_str(ip):
+    """Dotted-quad string of integer IP ip.
+    """
+    return '%d.%d.%d.%d' %((ip >> 24) & 0xFF, (ip >> 16) & 0xFF, (ip >> 8) & 0xFF, ip & 0xFF)
+
+
+def flow_str(fl):
+    """String '(src_ip, dst_ip)' of flow key fl, with IPs in dotted-quad.
+    """
+    return '(%s, %s)' %(ip_str(fl >> 32), ip_str(fl & 0xFFFFFFFF))
@@ -10,34 +10,55 @@ __copyright__   = 'Copyright 2014, NYU-Poly'
 # Third-party modules
 # User-defined modules
 import SimConfig as cfg
+from SimFlowTable import FLOW_FINISHED
+from SimLinkTable import *
 
 
-class SimLink:
+class SimLink(object):
     """Class of a link in the network.
+    A SimLink is a view over one row of a SimLinkTable (see SimCore.link_table): its
+    attributes are read from and written to the table's columns.
 
     Attributes:
+        table (SimLinkTable): Table that holds the link's attributes
+        lid (int): Link ID, i.e. row of the link in table
         cap (float64): Capacity in Bps
-        flows (list of 2-tuple of netaddr.IPAddress):
-            Flows running on the link.
-            Key: 2-tuple (src_ip, dst_ip)
+        flows (dict): Flows running on the link.
+            Key: Flow key (see SimHostAddr)
             Value: A pointer to item at SimCore.flows.
+        active_flows (dict): Subset of flows that are active, i.e. can be assigned BW.
+            Same keys and values as flows. Kept in sync with n_active_flows by
+            activate_flow() and deactivate_flow().
+        path_classes (dict): Path classes running on this link (see SimPathClass)
+        unasgn_bw, n_unasgn_flows, bw_per_flow (float64, int, float64): Used in
+            calc_flow_rates
+        never_btnk (int): Left out of rate allocation if nonzero
+            (see SimCore.mark_never_btnk_links)
+        asgn_rate (float64): Aggregate curr_rate of active flows on this link (see
+            SimCore.add_flow_rate). Integrated into byte_cnt (see
+            SimCore.update_link_byte_cnt).
+        byte_cnt (float64): Bytes sent over the link since the last link util. log
+
+    Extra Notes:
+        Links are __slots__ classes, and their attributes are the columns of SimLinkTable:
+        set_link_attr() cannot add new ones.
     """
+    __slots__ = ('table', 'lid')
 
-    def __init__(self, **kwargs):
-        """
-        """
-        self.node1 = kwargs.get('node1', 'noname')
-        self.node2 = kwargs.get('node2', 'noname')
-        self.cap = kwargs.get('cap', 1e9) * cfg.CAP_UNIT if (not cfg.OVERRIDE_CAP)     \
-                   else cfg.CAP_PER_LINK * cfg.CAP_UNIT
-        self.flows = {}
+    def __init__(self, table, **kwargs):
+        """Allocate a row for a new link in table.
 
-        # These variables are used in calc_flow_rates
-        self.unasgn_b       = self.cap
-        self.n_active_flows = 0
-        self.n_unsagn_flows = 0
-        self.bw_per_flow    = 0.0
-        self.processed      = False
+        Args:
+            table (SimLinkTable): Table to hold the link's attributes
+            kwargs: Link attributes read from links.csv (see SimCore.build_topo)
+
+        """
+        self.table  = table
+        self.lid    = table.alloc()
+        self.node1  = kwargs.get('node1', 'noname')
+        self.node2  = kwargs.get('node2', 'noname')
+        self.cap    = kwargs.get('cap', 1e9) * cfg.CAP_UNIT if (not cfg.OVERRIDE_CAP)                           else cfg.CAP_PER_LINK * cfg.CAP_UNIT
+        self.unasgn_bw = self.cap
 
 
     def __str__(self):
@@ -48,14 +69,31 @@ class SimLink:
                 '\t# of registered flows:%d\n'        %(len(self.flows)) +  \
                 '\t# of active flows:%d\n'            %(self.n_active_flows)+  \
                 '\t# of idling flows:%d\n'            %(len([fl for fl in self.flows \
-                                                           if self.flows[fl].status=='idle']))
+                                                    if self.flows[fl].status==FLOW_FINISHED]))
         return ret
 
 
-    def install_flow_entry(self, src_ip, dst_ip, flowobj):
+    def install_flow_entry(self, fl, flowobj):
+        """
+        """
+        self.table.flows[self.lid][fl] = flowobj
+
+
+    def activate_flow(self, fl, flowobj):
+        """Add an installed flow to active flows, when it starts (or is rerouted onto
+        this link).
         """
+        t, i = self.table, self.lid
+        t.active_flows[i][fl] = flowobj
+        t.n_active_flows[i] += 1
+
+
+    def deactivate_flow(self, fl):
+        """Remove a flow from active flows, when it ends (or is rerouted off this link).
         """
-        self.flows[(src_ip, dst_ip)] = flowobj
+        t, i = self.table, self.lid
+        del t.active_flows[i][fl]
+        t.n_active_flows[i] -= 1
 
 
     def get_n_active_flows(self):
@@ -74,7 +112,20 @@ class SimLink:
         return ret
 
 
-    def remove_flow_entry(self, src_ip, dst_ip):
+    def remove_flow_entry(self, fl):
         """
         """
-        del self.flows[(src_ip, dst_ip)]
+        del self.table.flows[self.lid][fl]
+
+
+def column_property(col):
+    """Property of SimLink that reads and writes column col of the link's table.
+    """
+    def fget(self):
+        return getattr(self.table, col)[self.lid]
+    def fset(self, val):
+        getattr(self.table, col)[self.lid] = val
+    return property(fget, fset)
+
+for col in SimLinkTable.COLUMNS:
+    setattr(SimLink, col, column_property(col))
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""sim/SimLinkTable.py: Columnar storage of link attributes, indexed by link ID.
+SimLink instances are views over its rows.
+"""
+__author__      = 'Kuan-yin Chen'
+__copyright__   = 'Copyright 2014, NYU-Poly'
+
+# Built-in modules
+from array import array
+# Third-party modules
+import numpy as np
+# User-defined modules
+
+
+class SimLinkTable:
+    """Attributes of all links, one column per attribute. Row i of every column belongs to
+    the link with link ID i, i.e. SimCore.links[i] (see SimCore.link_ids).
+
+    Attributes:
+        (float columns, array of 'd'): See FLOAT_COLUMNS
+        (int columns, array of 'l'): See INT_COLUMNS. never_btnk holds 0 or 1.
+        (object columns, list): See OBJECT_COLUMNS
+
+    Extra Notes:
+        1. As in SimFlowTable, numeric columns are array.array, so that the rate allocators
+           read and write single elements as Python floats and ints, and whole columns can
+           be viewed as numpy arrays without copying (see view()).
+        2. Links are only added by SimCore.build_topo, so views stay valid for the whole
+           simulation. They are still taken on demand, as views would be pickled as copies
+           in checkpoints.
+
+    """
+    FLOAT_COLUMNS   = ['cap', 'unasgn_bw', 'bw_per_flow', 'asgn_rate', 'byte_cnt']
+    INT_COLUMNS     = ['n_active_flows', 'n_unasgn_flows', 'never_btnk']
+    OBJECT_COLUMNS  = ['node1', 'node2', 'flows', 'active_flows', 'path_classes']
+    COLUMNS         = FLOAT_COLUMNS + INT_COLUMNS + OBJECT_COLUMNS
+
+    # Values of a newly allocated row. Dicts (flows, active_flows, path_classes) are
+    # created per row.
+    DEFAULTS = {'cap': 0.0, 'unasgn_bw': 0.0, 'bw_per_flow': 0.0, 'asgn_rate': 0.0, \
+                'byte_cnt': 0.0, 'n_active_flows': 0, 'n_unasgn_flows': 0, 'never_btnk': 0, \
+                'node1': 'noname', 'node2': 'noname', 'flows': None, 'active_flows': None, \
+                'path_classes': None}
+
+    def __init__(self):
+        for col in self.FLOAT_COLUMNS:
+            setattr(self, col, array('d'))
+        for col in self.INT_COLUMNS:
+            setattr(self, col, array('l'))
+        for col in self.OBJECT_COLUMNS:
+            setattr(self, col, [])
+
+
+    def __len__(self):
+        return len(self.cap)
+
+
+    def alloc(self):
+        """Add a row with default values.
+
+        Returns:
+            int: Link ID of the row
+
+        """
+        defaults = self.DEFAULTS
+        lid = len(self.cap)
+        for col in self.COLUMNS:
+            getattr(self, col).append(defaults[col])
+        self.flows[lid]         = {}
+        self.active_flows[lid]  = {}
+        self.path_classes[lid]  = {}
+        return lid
+
+
+    def view(self, col):
+        """Get a numpy view of a numeric column, indexed by link ID. The view shares memory
+        with the column, so writes go to the table.
+        """
+        column = getattr(self, col)
+        dtype  = np.float64 if (column.typecode == 'd') else np.dtype('l')
+        if (len(column) == 0):
+            return np.zeros(0, dtype=dtype)
+        return np.frombuffer(column, dtype=dtype)
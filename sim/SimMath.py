@@ -7,6 +7,8 @@ __copyright__   = 'Copyright 2014, NYU-Poly'
 
 # Built-in modules
 import math
+# Third-party modules
+import numpy as np
 
 def mean(lst):
     """Calculate mean of a list of numbers.
@@ -68,3 +70,32 @@ def std(lst):
     ret = math.sqrt(msqerr)
 
     return ret
+
+
+def describe(arr):
+    """Calculate mean, STDEV, min, max, quartiles and median of an array of numbers at once.
+    Results are the same as those of mean(), std(), min(), max() and percentile().
+
+    Args:
+        arr (numpy array of numbers)
+
+    Returns:
+        dict: Keys are 'mean', 'stdev', 'min', 'max', 'q1', 'q3' and 'median'
+    """
+    if (len(arr) == 0):
+        print "SimMath.describe(): empty array!"
+        return None
+
+    slst = np.sort(arr).tolist()    # Sorted once, for min, max and percentiles
+    n = float(len(slst))
+    myMean = math.fsum(slst) / n
+    if (len(slst) == 1):
+        myStd = 0.0
+    else:
+        myStd = math.sqrt(math.fsum(((arr - myMean)**2).tolist()) / n)
+
+    ret = {'mean': myMean, 'stdev': myStd, 'min': slst[0], 'max': slst[-1], \
+           'q1': percentile(slst, 25), 'q3': percentile(slst, 75), \
+           'median': percentile(slst, 50)}
+
+    return ret
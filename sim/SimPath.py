@@ -0,0 +1,40 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""sim/SimPath.py: Class SimPath, a path in the controller's path database.
+"""
+__author__      = 'Kuan-yin Chen'
+__copyright__   = 'Copyright 2014, NYU-Poly'
+
+# Built-in modules
+# Third-party modules
+# User-defined modules
+
+
+class SimPath(list):
+    """A path, i.e. a list of node names, which also carries its links.
+    Built once per path by SimCore.make_path(), so that looking up the links of a path
+    (see SimCore.get_links_on_path) needs no link_mapper lookups.
+
+    Attributes:
+        links (tuple of 2-tuples): Link keys along the path, as in SimCore.links
+        link_ids (tuple of int): Link IDs along the path, i.e. indices into SimCore.links
+
+    Extra Notes:
+        1. SimPath compares, prints and is logged as the plain list of node names.
+        2. Paths are shared by all flows routed on them and must not be modified.
+
+    """
+    __slots__ = ('links', 'link_ids')
+
+    def __init__(self, nodes, links, link_ids):
+        """Constructor of SimPath class.
+
+        Args:
+            nodes (list of str): Node names along the path
+            links (tuple of 2-tuples): Link keys along the path
+            link_ids (tuple of int): Link IDs along the path
+
+        """
+        list.__init__(self, nodes)
+        self.links      = links
+        self.link_ids   = link_ids
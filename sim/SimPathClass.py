@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""sim/SimPathClass.py: Class of a path class, i.e. a group of active flows that always get
+the same rate under max-min fairness. Used by cfg.RATE_ALLOC_MODE == 'pathclass'.
+"""
+__author__      = 'Kuan-yin Chen'
+__copyright__   = 'Copyright 2014, NYU-Poly'
+
+# Built-in modules
+from heapq import heappush, heappop, heapify
+# Third-party modules
+# User-defined modules
+
+
+class SimPathClass:
+    """Active flows running on an identical list of links (and with identical source rates,
+    if cfg.SRC_LIMITED > 0).
+
+    Attributes:
+        key (2-tuple): (tuple of links, source rate). Source rate is inf if cfg.SRC_LIMITED == 0.
+        links (list of 2-tuples): Links of every flow in the class
+        link_ids (tuple of int): IDs of links (see SimCore.link_ids), in the same order
+        flows (dict): Key: flow key, Value: SimFlow.
+        new_flows (list of int): Keys of flows that joined since the last rate assignment
+        rate (float64): Rate of each flow in the class
+        vbytes (float64): Bytes each flow in the class has sent since the class was created,
+                          up to vtime
+        vtime (float64): Time up to which vbytes has been integrated
+        end_heap (list of 3-tuples): Min-heap of (finish_tag, sort key in SimCore.sorted_flows,
+                                     flow key).
+        est_end_time (float64): Estimated end time of the class's earliest-ending flow
+
+    Extra Notes:
+        1. Flows in a class all run at the same rate, so a flow that joined when the class had
+           sent vbytes, with bytes_left bytes to go, ends when vbytes reaches
+           finish_tag = vbytes + bytes_left. Finish tags do not change with the rate, so
+           end_heap never needs re-keying.
+        2. Entries of flows that have left the class are dropped lazily from end_heap. A flow
+           keeps its current tag in SimFlow.class_tag.
+
+    """
+    def __init__(self, key, link_ids):
+        self.key            = key
+        self.links          = list(key[0])
+        self.link_ids       = link_ids
+        self.flows          = {}
+        self.new_flows      = []
+        self.rate           = 0.0
+        self.vbytes         = 0.0
+        self.vtime          = 0.0
+        self.end_heap       = []
+        self.est_end_time   = float('inf')
+        self.assigned       = False     # Used in calc_flow_rates
+
+
+    def __len__(self):
+        return len(self.flows)
+
+
+    def add_flow(self, flow_key, flowobj):
+        """Add a flow to the class. It gets its finish tag at the next rate assignment.
+        """
+        self.flows[flow_key] = flowobj
+        flowobj.path_class   = self
+        self.new_flows.append(flow_key)
+
+
+    def remove_flow(self, flow_key):
+        """Remove a flow from the class.
+        """
+        self.flows.pop(flow_key).path_class = None
+
+
+    def advance(self, ev_time):
+        """Integrate vbytes up to ev_time at the current rate.
+        """
+        self.vbytes += self.rate * (ev_time - self.vtime)
+        self.vtime  = ev_time
+
+
+    def push_tag(self, flow_key, sort_key):
+        """Give a flow its finish tag. The flow's bytes_left must be up to date at self.vtime.
+        """
+        flowobj = self.flows[flow_key]
+        flowobj.class_tag = self.vbytes + flowobj.bytes_left
+        heappush(self.end_heap, (flowobj.class_tag, sort_key, flow_key))
+
+
+    def head(self):
+        """Get end_heap entry of the earliest-ending flow, or None if the class is empty.
+        """
+        end_heap = self.end_heap
+        if (len(end_heap) > 2 * len(self.flows) + 16):
+            end_heap[:] = [x for x in end_heap \
+                           if (x[2] in self.flows and self.flows[x[2]].class_tag == x[0])]
+            heapify(end_heap)
+
+        while (end_heap):
+            tag, sort_key, fl = end_heap[0]
+            if (fl in self.flows and self.flows[fl].class_tag == tag):
+                return end_heap[0]
+            heappop(end_heap)
+        return None
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""sim/SimSortedFlows.py: Sorted container of active flows for SimCore.sorted_flows.
+"""
+__author__      = 'Kuan-yin Chen'
+__copyright__   = 'Copyright 2014, NYU-Poly'
+
+# Built-in modules
+from bisect import bisect_left, insort
+from itertools import chain
+# Third-party modules
+# User-defined modules
+
+
+class SortedFlows:
+    """Active flows in ascending order of (flow_rate, flow_id), with an index by flow key.
+
+    Attributes:
+        buckets (list of lists): Sorted runs of entries. Concatenated, they are sorted.
+                                 Each entry is a 4-tuple (flow_rate, flow_id, flowobj, flow_key).
+        maxes (list of 2-tuples): (flow_rate, flow_id) of the last entry of each bucket.
+        keys (dict): Key: flow key, Value: (flow_rate, flow_id) of the flow's entry.
+        next_id (int): flow_id given to the next inserted flow.
+
+    Extra Notes:
+        1. flow_id is unique and increases in order of insertion, so flows with the same
+           flow_rate are in FIFO order, and entries never compare their flowobj.
+        2. insert() and remove() locate the bucket by bisecting maxes, and then the entry by
+           bisecting the bucket: O(log n) comparisons, plus a memmove of at most
+           2 * BUCKET_SIZE pointers. Buckets are split when they grow beyond that.
+        3. Iteration yields entries in ascending order. The container must not be modified
+           while being iterated.
+        4. The plain list this replaces was not exactly in this order: its binary search
+           inserted a flow before the first equal flow_rate it probed, or at the last probed
+           position if none was equal, which may be one slot off. If cfg.SRC_LIMITED > 0,
+           the devoflow allocator visits flows in this order, so rates differ from those
+           computed with the old list.
+
+    """
+    BUCKET_SIZE = 512
+
+    def __init__(self):
+        self.buckets    = []
+        self.maxes      = []
+        self.keys       = {}
+        self.next_id    = 0
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def __iter__(self):
+        return chain.from_iterable(self.buckets)
+
+
+    def insert(self, flow_rate, flowobj, flow_key):
+        """Insert a flow.
+
+        Args:
+            flow_rate (float64): Sort key of the flow (its source rate, or inf)
+            flowobj (SimFlow): The flow
+            flow_key (int): Key of the flow in SimCore.flows. If a flow with the same key is
+                            already in the container, its entry is replaced.
+
+        """
+        if (flow_key in self.keys):
+            self.remove(flow_key)
+
+        key     = (flow_rate, self.next_id)
+        entry   = (flow_rate, self.next_id, flowobj, flow_key)
+        self.next_id += 1
+        self.keys[flow_key] = key
+
+        if (not self.buckets):
+            self.buckets.append([entry])
+            self.maxes.append(key)
+            return
+
+        i = bisect_left(self.maxes, key)
+        if (i == len(self.maxes)):
+            i -= 1
+            self.buckets[i].append(entry)
+            self.maxes[i] = key
+        else:
+            insort(self.buckets[i], entry)
+
+        bucket = self.buckets[i]
+        if (len(bucket) > 2 * self.BUCKET_SIZE):
+            self.buckets.insert(i + 1, bucket[self.BUCKET_SIZE:])
+            self.maxes.insert(i, bucket[self.BUCKET_SIZE-1][:2])
+            del bucket[self.BUCKET_SIZE:]
+
+
+    def remove(self, flow_key):
+        """Remove a flow. No-op if the flow is not in the container.
+
+        Args:
+            flow_key (int): Key of the flow in SimCore.flows
+
+        """
+        key = self.keys.pop(flow_key, None)
+        if (key is None):
+            return
+
+        i       = bisect_left(self.maxes, key)
+        bucket  = self.buckets[i]
+        j       = bisect_left(bucket, key)  # key sorts right before its own entry
+        del bucket[j]
+
+        if (not bucket):
+            del self.buckets[i]
+            del self.maxes[i]
+        elif (j == len(bucket)):
+            self.maxes[i] = bucket[-1][:2]
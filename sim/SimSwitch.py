@@ -8,41 +8,46 @@ __copyright__   = 'Copyright 2014, NYU-Poly'
 
 # Built-in modules
 # Third-party modules
-import netaddr as na
 # User-defined modules
 import SimConfig as cfg
+from SimHostAddr import *
 
 
-class SimSwitch:
+class SimSwitch(object):
     """Class of a switching node in the network.
 
     Attributes:
-        table (dict: 2-tuple netaddr.IpAddress -> float64):
-            Forwarding table, key is 2-tuple (src_ip, dst_ip) and value is byte counter.
+        table (dict: int -> float64):
+            Forwarding table, key is flow key (see SimHostAddr) and value is byte counter.
         tablesize (int): Maximum number of flow entries allowed in table
         n_hosts (int): Number of hosts connected with this edge switch.
-        base_ip
-        end_ip
+        base_ip (int): IP of the first attached host
+        end_ip (int): IP of the last attached host
+
+    Extra Notes:
+        Switches are __slots__ classes: every attribute must be listed in __slots__, and
+        set_node_attr() cannot add new ones.
 
     """
+    __slots__ = ('name', 'table', 'table_size', 'n_hosts', 'base_ip', 'end_ip')
 
     def __init__(self, **kwargs):
         self.name = kwargs.get('name', 'noname')
-        self.table = {}     # key is 2-tuple (src_ip, dst_ip), value is byte counter
+        self.table = {}     # key is flow key, value is byte counter
         self.table_size = kwargs.get('table_size', 1000) if (not cfg.OVERRIDE_TABLESIZE)    \
                           else cfg.TABLESIZE_PER_SW
         self.n_hosts = kwargs.get('n_hosts', 100) if (not cfg.OVERRIDE_N_HOSTS)     \
                        else cfg.N_HOSTS_PER_SW
-        self.base_ip = na.IPAddress(0)
-        self.end_ip = na.IPAddress(0)
+        self.base_ip = 0
+        self.end_ip = 0
 
 
     def __str__(self):
         ret =   'Switch name %s\n'                  %(self.name) + \
                 '\ttable_size: %s\n'                %(self.table_size) + \
                 '\tn_hosts: %s\n'                   %(self.n_hosts) + \
-                '\tbase_ip: %s\n'                   %(self.base_ip) + \
-                '\tend_ip: %s\n'                    %(self.end_ip) + \
+                '\tbase_ip: %s\n'                   %(ip_str(self.base_ip)) + \
+                '\tend_ip: %s\n'                    %(ip_str(self.end_ip)) + \
                 '\tcurrent # of entries: %s\n'      %(len(self.table))
         return ret
 
@@ -55,13 +60,13 @@ class SimSwitch:
         return float(len(self.table)) / float(self.table_size)
 
 
-    def install_flow_entry(self, src_ip, dst_ip):
-        if (not (src_ip, dst_ip) in self.table):
-            self.table[(src_ip, dst_ip)] = 0.0
+    def install_flow_entry(self, fl):
+        if (not fl in self.table):
+            self.table[fl] = 0.0
 
 
-    def remove_flow_entry(self, src_ip, dst_ip):
-        del self.table[(src_ip, dst_ip)]
+    def remove_flow_entry(self, fl):
+        del self.table[fl]
         # Prevent exceptions??
 
 